@@ -3,19 +3,411 @@
 支持任意OpenAI兼容的API服务（自定义URL、Key、Model）
 """
 
+import os
+import json
+import time
+import asyncio
+import functools
+import threading
+import email.utils
+from urllib.parse import urlparse
+from datetime import datetime, timezone
 import requests
-from typing import Optional
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from typing import List, Optional, Tuple
+
+try:
+    import aiohttp  # 可选依赖，仅 asyncio 生成引擎需要
+except ImportError:
+    aiohttp = None
+
+
+class APIRequestError(Exception):
+    """API请求异常，携带HTTP状态码与错误类别"""
+
+    # 错误类别
+    RATE_LIMIT = "rate_limit"      # 429 限流
+    SERVER_ERROR = "server_error"  # 5xx 服务端错误
+    CLIENT_ERROR = "client_error"  # 其他 4xx 错误
+    TIMEOUT = "timeout"            # 请求超时
+    NETWORK = "network"            # 连接失败等网络错误
+    RESPONSE = "response"          # 响应格式异常
+
+    # 可重试的错误类别，其余（如 400/401/403）重试也不会成功
+    RETRYABLE = (RATE_LIMIT, SERVER_ERROR, TIMEOUT, NETWORK)
+
+    def __init__(self, message: str, status_code: Optional[int] = None, error_type: str = NETWORK,
+                 retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.error_type = error_type
+        self.retry_after = retry_after  # 服务端 Retry-After 建议的等待秒数
+
+    @property
+    def retryable(self) -> bool:
+        """是否值得重试"""
+        return self.error_type in self.RETRYABLE
+
+    @classmethod
+    def from_status(cls, message: str, status_code: int, headers=None) -> 'APIRequestError':
+        """根据HTTP状态码确定错误类别"""
+        if status_code == 429:
+            error_type = cls.RATE_LIMIT
+        elif status_code >= 500:
+            error_type = cls.SERVER_ERROR
+        else:
+            error_type = cls.CLIENT_ERROR
+        retry_after = parse_retry_after(headers.get("Retry-After")) if headers else None
+        return cls(message, status_code=status_code, error_type=error_type, retry_after=retry_after)
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    解析 Retry-After 响应头
+    :param value: 秒数或HTTP日期
+    :return: 需要等待的秒数，无法解析时为空
+    """
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max((retry_at - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+
+class TokenBucket:
+    """令牌桶：按固定速率连续补充，允许预留为负（透支），后续请求顺延等待"""
+
+    def __init__(self, rate_per_minute: float, burst_seconds: float = 1.0):
+        """
+        :param rate_per_minute: 每分钟配额
+        :param burst_seconds: 桶容量对应的秒数，容量越小请求越均匀
+        """
+        self.rate = rate_per_minute / 60.0
+        self.capacity = max(self.rate * burst_seconds, 1.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, amount: float, now: float) -> float:
+        """
+        预留配额
+        :return: 需要等待的秒数
+        """
+        self._refill(now)
+        self._tokens -= amount
+        return max(0.0, -self._tokens / self.rate)
+
+    def adjust(self, delta: float):
+        """按实际用量修正已预留的配额（delta>0 表示实际用量超过预估）"""
+        self._tokens -= delta
+
+
+class RateLimiter:
+    """按每分钟请求数(RPM)与每分钟token数(TPM)限速，线程安全"""
+
+    def __init__(self, rpm: Optional[int] = None, tpm: Optional[int] = None, burst_seconds: float = 1.0):
+        """
+        :param rpm: 每分钟请求数上限，为空不限制
+        :param tpm: 每分钟token数上限，为空不限制
+        :param burst_seconds: 允许的突发量（秒），默认1秒的配额
+        """
+        self.rpm = rpm
+        self.tpm = tpm
+        self._request_bucket = TokenBucket(rpm, burst_seconds) if rpm else None
+        self._token_bucket = TokenBucket(tpm, burst_seconds) if tpm else None
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._estimated_tokens = 0
+        self._actual_tokens = 0
+        self._total_wait = 0.0
+
+    @staticmethod
+    def estimate_tokens(prompt: str, max_tokens: int) -> int:
+        """
+        预估请求消耗的token数：ASCII字符约4个一个token，中文等字符约一个字一个token，再加上最大输出
+        """
+        ascii_chars = sum(1 for ch in prompt if ord(ch) < 128)
+        return (ascii_chars + 3) // 4 + (len(prompt) - ascii_chars) + max_tokens
+
+    def reserve(self, estimated_tokens: int) -> float:
+        """
+        预留一次请求的配额
+        :param estimated_tokens: 预估token数
+        :return: 发出请求前需要等待的秒数
+        """
+        with self._lock:
+            now = time.monotonic()
+            wait = 0.0
+            if self._request_bucket:
+                wait = max(wait, self._request_bucket.reserve(1, now))
+            if self._token_bucket:
+                wait = max(wait, self._token_bucket.reserve(estimated_tokens, now))
+            self._requests += 1
+            self._estimated_tokens += estimated_tokens
+            self._total_wait += wait
+            return wait
+
+    def acquire(self, estimated_tokens: int):
+        """预留配额并阻塞等待到可发送时刻"""
+        wait = self.reserve(estimated_tokens)
+        if wait > 0:
+            time.sleep(wait)
+
+    def reconcile(self, estimated_tokens: int, actual_tokens: Optional[int]):
+        """
+        根据响应中的 usage 修正token配额
+        :param estimated_tokens: 预留时的预估值
+        :param actual_tokens: 实际消耗（响应没有 usage 时为空，保留预估值）
+        """
+        if actual_tokens is None:
+            return
+        with self._lock:
+            if self._token_bucket:
+                self._token_bucket.adjust(actual_tokens - estimated_tokens)
+            self._actual_tokens += actual_tokens
+
+    def get_stats(self) -> dict:
+        """获取限速统计"""
+        with self._lock:
+            return {
+                "rpm": self.rpm,
+                "tpm": self.tpm,
+                "requests": self._requests,
+                "estimated_tokens": self._estimated_tokens,
+                "actual_tokens": self._actual_tokens,
+                "total_wait": round(self._total_wait, 2)
+            }
+
+
+def _add_phase(timings: Optional[dict], name: str, seconds: float):
+    """累加一个阶段的耗时"""
+    if timings is not None:
+        timings[name] = timings.get(name, 0.0) + max(seconds, 0.0)
+
+
+def _wake_future(loop: asyncio.AbstractEventLoop, future: asyncio.Future) -> bool:
+    """
+    从任意线程唤醒等待在 future 上的协程（等待方可能已被取消）
+    :return: 事件循环已关闭时返回 False
+    """
+    def resolve():
+        if not future.done():
+            future.set_result(None)
+    try:
+        loop.call_soon_threadsafe(resolve)
+        return True
+    except RuntimeError:
+        return False
+
+
+class JSONStreamScanner:
+    """
+    增量扫描流式输出，判断第一个顶层JSON（对象或数组）是否已经完整
+    括号配对（忽略字符串内的括号与转义）闭合时再用 json.loads 校验，
+    说明文字中的括号（如 "[注意]"）配对成功但不是合法JSON，从其后继续扫描
+    """
+
+    def __init__(self):
+        self.end: Optional[int] = None  # JSON结束位置（在已输入文本中的下标，不含），未完整时为空
+        self._text = ""
+        self._pos = 0  # 下一个待扫描字符的下标
+        self._start: Optional[int] = None  # 当前候选JSON的起始下标
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+    def feed(self, text: str) -> bool:
+        """
+        输入一段增量文本
+        :return: 第一个顶层JSON是否已完整
+        """
+        if self.end is not None:
+            return True
+        self._text += text
+        text = self._text
+        i = self._pos
+        while i < len(text):
+            ch = text[i]
+            if self._start is None:
+                # JSON开始前的文字（含引号）不参与配对
+                if ch in '{[':
+                    self._start, self._depth = i, 1
+            elif self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == '\\':
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch in '{[':
+                self._depth += 1
+            elif ch in '}]':
+                self._depth -= 1
+                if self._depth == 0:
+                    try:
+                        json.loads(text[self._start:i + 1])
+                    except ValueError:
+                        # 不是合法JSON，从候选起点之后重新扫描（真正的JSON可能就在其中）
+                        i, self._start = self._start + 1, None
+                        self._in_string = self._escape = False
+                        continue
+                    self.end = i + 1
+                    return True
+            i += 1
+        self._pos = i
+        return False
+
+
+def _is_event_stream(content_type: Optional[str]) -> bool:
+    return bool(content_type) and content_type.split(";")[0].strip() == "text/event-stream"
+
+
+class _StreamReader:
+    """
+    累积SSE流式响应（chat/completions stream=true）：拼接增量内容、记录首个Token时刻与usage，
+    第一个顶层JSON完整后提示调用方提前关闭流
+    """
+
+    def __init__(self, stop_on_json: bool = True):
+        self.stop_on_json = stop_on_json
+        self.first_token_at: Optional[float] = None
+        self.usage: Optional[dict] = None
+        self.chunks = 0  # 收到的数据分片数
+        self.stopped_early = False
+        self._parts: List[str] = []
+        self._scanner = JSONStreamScanner()
+
+    def feed_line(self, line) -> bool:
+        """
+        处理一行SSE数据
+        :return: 是否应结束读取（收到 [DONE] 或JSON已完整）
+        """
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        line = line.strip()
+        if not line.startswith("data:"):
+            return False
+        payload = line[len("data:"):].strip()
+        if payload == "[DONE]":
+            return True
+        try:
+            chunk = json.loads(payload)
+        except json.JSONDecodeError:
+            raise APIRequestError(f"流式响应格式异常: {payload[:200]}", error_type=APIRequestError.RESPONSE)
+        self.chunks += 1
+        if chunk.get("error"):
+            raise APIRequestError(f"流式响应返回错误: {chunk['error']}", error_type=APIRequestError.SERVER_ERROR)
+        if chunk.get("usage"):
+            self.usage = chunk["usage"]
+        for choice in chunk.get("choices") or []:
+            text = (choice.get("delta") or {}).get("content")
+            if not text:
+                continue
+            if self.first_token_at is None:
+                self.first_token_at = time.perf_counter()
+            self._parts.append(text)
+            if self._scanner.feed(text) and self.stop_on_json:
+                self.stopped_early = True
+                return True
+        return False
+
+    @property
+    def content(self) -> str:
+        """拼接后的内容，提前结束时截去JSON之后已收到的多余文本"""
+        text = "".join(self._parts)
+        if self.stopped_early:
+            text = text[:self._scanner.end]
+        return text.strip()
+
+
+# 当前线程最近一次请求写出完成的时刻，用于区分建连发送与等待首字节
+_request_marks = threading.local()
+
+
+class _SendTimingMixin:
+    """请求写出后记录时刻"""
+
+    def request(self, *args, **kwargs):
+        super().request(*args, **kwargs)
+        _request_marks.sent = time.perf_counter()
+
+
+class _TimedHTTPConnection(_SendTimingMixin, HTTPConnection):
+    pass
+
+
+class _TimedHTTPSConnection(_SendTimingMixin, HTTPSConnection):
+    pass
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+class TimedHTTPAdapter(HTTPAdapter):
+    """连接池使用记录发送时刻的连接"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _TimedHTTPConnectionPool,
+            "https": _TimedHTTPSConnectionPool
+        }
+
+
+def _request_tracer():
+    """aiohttp 请求阶段打点，时刻写入请求时传入的 trace_request_ctx 字典"""
+    def mark(name):
+        async def handler(session, context, params):
+            if context.trace_request_ctx is not None:
+                context.trace_request_ctx[name] = time.perf_counter()
+        return handler
+
+    trace = aiohttp.TraceConfig()
+    trace.on_connection_queued_start.append(mark("queued_start"))
+    trace.on_connection_queued_end.append(mark("queued_end"))
+    trace.on_request_headers_sent.append(mark("sent"))
+    trace.on_request_chunk_sent.append(mark("sent"))
+    trace.on_request_end.append(mark("headers"))
+    return trace
 
 
 class UniversalAPIClient:
     """通用API客户端 - 支持OpenAI兼容格式"""
 
-    def __init__(self, api_url: str, api_key: str, model: str):
+    # generate/agenerate 可通过 timings 参数返回各阶段耗时（queue/connect/ttfb/receive，流式时另有ttft）
+    supports_timings = True
+
+    # 流式响应中第一个顶层JSON完整后即关闭流，不再接收其后的多余文本
+    stop_on_json = True
+
+    def __init__(self, api_url: str, api_key: str, model: str, pool_size: int = 10, stream: bool = False):
         """
         初始化API客户端
         :param api_url: API基础URL（如: https://open.bigmodel.cn/api/paas/v4/）
         :param api_key: API密钥
         :param model: 模型名称
+        :param pool_size: 连接池大小（通常与生成并发数一致）
+        :param stream: 是否默认使用流式响应（SSE）
         """
         self.api_url = api_url.rstrip('/')
         self.api_key = api_key
@@ -26,20 +418,123 @@ class UniversalAPIClient:
             self.chat_url = f"{self.api_url}/chat/completions"
         else:
             self.chat_url = self.api_url
+        # 批处理接口（/files、/batches）与 chat/completions 同一前缀
+        self.base_url = self.chat_url[:-len('/chat/completions')]
+        # 批处理文件中每个请求的 url 字段（如 /v1/chat/completions）
+        self.batch_endpoint = urlparse(self.chat_url).path
+
+        # 默认生成参数（调用时未指定则使用）
+        self.temperature = 0.3
+        self.max_tokens = 500
+        self.stream = stream
+
+        # 预构建的请求头，所有请求复用
+        self._headers = self._build_headers()
 
-    def generate(self, prompt: str, temperature: float = 0.3, max_tokens: int = 500, **kwargs) -> str:
+        # 长连接池（多个工作线程共享）
+        self._session: Optional[requests.Session] = None
+        self._pool_size = 0
+        self._pool_slots: Optional[threading.BoundedSemaphore] = None
+        self._pool_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._request_count = 0
+        self._waited_count = 0
+        self._prompt_tokens = 0  # 响应 usage 中累计的token数（不随连接池重建清零）
+        self._completion_tokens = 0
+        self._early_stops = 0  # 流式响应在JSON完整后提前关闭的次数
+        self.configure_pool(pool_size)
+
+        # 限速器（未设置时不限速）
+        self.rate_limiter: Optional[RateLimiter] = None
+
+    def set_rate_limit(self, rpm: Optional[int] = None, tpm: Optional[int] = None):
         """
-        调用API生成内容
-        :param prompt: 提示词
-        :param temperature: 温度参数
-        :param max_tokens: 最大token数
-        :return: 生成结果
+        设置每分钟请求数/token数配额，两者都为空时取消限速
+        :param rpm: 每分钟请求数上限
+        :param tpm: 每分钟token数上限
         """
-        headers = {
+        self.rate_limiter = RateLimiter(rpm, tpm) if (rpm or tpm) else None
+
+    def configure_pool(self, pool_size: int):
+        """
+        按生成并发数调整连接池大小（大小不变时复用现有连接）
+        :param pool_size: 连接池最大连接数
+        """
+        pool_size = max(int(pool_size), 1)
+        with self._pool_lock:
+            if self._session is not None and pool_size == self._pool_size:
+                return
+
+            session = requests.Session()
+            # pool_block=True：连接用尽时等待空闲连接，而不是新建后丢弃
+            adapter = TimedHTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            session.headers.update(self._headers)
+
+            old_session = self._session
+            self._session = session
+            self._pool_size = pool_size
+            self._pool_slots = threading.BoundedSemaphore(pool_size)
+            with self._stats_lock:
+                self._request_count = 0
+                self._waited_count = 0
+
+        if old_session is not None:
+            old_session.close()
+
+    def get_pool_stats(self) -> dict:
+        """
+        获取连接池统计
+        :return: 连接池大小、请求数、新建连接数、复用连接数、等待空闲连接的次数
+        """
+        opened = 0
+        adapter = self._session.get_adapter(self.chat_url)
+        pools = adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is not None:
+                opened += pool.num_connections
+
+        with self._stats_lock:
+            requests_sent = self._request_count
+            waited = self._waited_count
+
+        return {
+            "pool_size": self._pool_size,
+            "requests": requests_sent,
+            "opened": opened,
+            "reused": max(requests_sent - opened, 0),
+            "waited": waited
+        }
+
+    def get_usage_stats(self) -> dict:
+        """
+        获取token消耗统计
+        :return: 累计的输入token数、输出token数、流式响应提前关闭的次数（这些请求没有 usage，不计入token数）
+        """
+        with self._stats_lock:
+            return {
+                "prompt_tokens": self._prompt_tokens,
+                "completion_tokens": self._completion_tokens,
+                "early_stops": self._early_stops
+            }
+
+    def close(self):
+        """关闭连接池"""
+        with self._pool_lock:
+            if self._session is not None:
+                self._session.close()
+
+    def _build_headers(self) -> dict:
+        """构建请求头"""
+        return {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json"
         }
 
+    def _build_payload(self, prompt: str, temperature: float, max_tokens: int, stream: bool = False) -> dict:
+        """构建请求体"""
         data = {
             "model": self.model,
             "messages": [
@@ -48,26 +543,327 @@ class UniversalAPIClient:
             "temperature": temperature,
             "max_tokens": max_tokens
         }
+        if stream:
+            data["stream"] = True
+            data["stream_options"] = {"include_usage": True}
+        return data
+
+    @staticmethod
+    def _extract_usage(result: dict) -> Optional[int]:
+        """从响应中提取实际消耗的token数"""
+        usage = result.get("usage") or {}
+        total = usage.get("total_tokens")
+        if total is None and "prompt_tokens" in usage:
+            total = usage.get("prompt_tokens", 0) + usage.get("completion_tokens", 0)
+        return total
+
+    def _finish_stream(self, reader: _StreamReader, rate_limiter: Optional['RateLimiter'],
+                       estimated_tokens: int) -> str:
+        """流式响应读取结束：记录usage（提前关闭时没有usage，限速保留预估值）并返回内容"""
+        if reader.chunks == 0:
+            raise APIRequestError("流式响应没有返回任何数据", error_type=APIRequestError.RESPONSE)
+        if reader.stopped_early:
+            with self._stats_lock:
+                self._early_stops += 1
+        result = {"usage": reader.usage} if reader.usage else {}
+        self._record_usage(result)
+        if rate_limiter is not None:
+            rate_limiter.reconcile(estimated_tokens, self._extract_usage(result))
+        return reader.content
+
+    @staticmethod
+    def _stream_phases(timings: Optional[dict], reader: _StreamReader, headers_at: float, received_at: float):
+        """流式响应的响应头之后分为 ttft（等待首个Token）与 receive（首个Token到结束）"""
+        first_token_at = reader.first_token_at or received_at
+        _add_phase(timings, "ttft", first_token_at - headers_at)
+        _add_phase(timings, "receive", received_at - first_token_at)
+
+    def _record_usage(self, result: dict):
+        """累计响应 usage 中的token数"""
+        usage = result.get("usage") or {}
+        with self._stats_lock:
+            self._prompt_tokens += usage.get("prompt_tokens") or 0
+            self._completion_tokens += usage.get("completion_tokens") or 0
+
+    @staticmethod
+    def _extract_content(result: dict) -> str:
+        """从响应中提取生成内容"""
+        # 兼容不同API的响应格式
+        if "choices" in result and len(result["choices"]) > 0:
+            return result["choices"][0]["message"]["content"].strip()
+        else:
+            raise APIRequestError(f"API响应格式异常: {result}", error_type=APIRequestError.RESPONSE)
+
+    def generate(self, prompt: str, temperature: Optional[float] = None, max_tokens: Optional[int] = None,
+                 timings: Optional[dict] = None, stream: Optional[bool] = None, **kwargs) -> str:
+        """
+        调用API生成内容
+        :param prompt: 提示词
+        :param temperature: 温度参数，默认使用 self.temperature
+        :param max_tokens: 最大token数，默认使用 self.max_tokens
+        :param timings: 传入时累加各阶段耗时：queue（限速与等待连接）、connect（建连与发送）、ttfb、receive；
+                        流式时响应头之后分为 ttft（等待首个Token）与 receive
+        :param stream: 是否使用流式响应，默认使用 self.stream；流式时第一个顶层JSON完整即关闭流
+        :return: 生成结果
+        """
+        temperature = self.temperature if temperature is None else temperature
+        max_tokens = self.max_tokens if max_tokens is None else max_tokens
+        stream = self.stream if stream is None else stream
+        data = self._build_payload(prompt, temperature, max_tokens, stream)
+        session = self._session
+        slots = self._pool_slots
+        queue_start = time.perf_counter()
+
+        # 先按配额排队，再占用连接，避免等待期间占着连接
+        rate_limiter = self.rate_limiter
+        estimated_tokens = 0
+        if rate_limiter is not None:
+            estimated_tokens = RateLimiter.estimate_tokens(prompt, max_tokens)
+            rate_limiter.acquire(estimated_tokens)
+
+        # 占用一个连接槽位，连接池已满时记录等待次数
+        if not slots.acquire(blocking=False):
+            with self._stats_lock:
+                self._waited_count += 1
+            slots.acquire()
 
         try:
-            response = requests.post(
-                self.chat_url,
-                headers=headers,
-                json=data,
-                timeout=60
-            )
+            with self._stats_lock:
+                self._request_count += 1
+            request_start = time.perf_counter()
+            _add_phase(timings, "queue", request_start - queue_start)
+            _request_marks.sent = None
+            # stream=True：收到响应头即返回，读取响应体单独计时
+            with session.post(self.chat_url, json=data, timeout=60, stream=True) as response:
+                headers_at = time.perf_counter()
+                sent_at = getattr(_request_marks, 'sent', None) or request_start
+                _add_phase(timings, "connect", sent_at - request_start)
+                _add_phase(timings, "ttfb", headers_at - sent_at)
+                # 不支持流式的服务可能忽略 stream 参数直接返回JSON，按普通响应处理
+                reader = None
+                if stream and response.ok and _is_event_stream(response.headers.get("Content-Type")):
+                    reader = _StreamReader(self.stop_on_json)
+                    for line in response.iter_lines():
+                        if reader.feed_line(line):
+                            break
+                    # 提前结束时未读完的连接随响应关闭，不归还连接池
+                    self._stream_phases(timings, reader, headers_at, time.perf_counter())
+                else:
+                    response.content  # 读完响应体，连接归还连接池
+                    _add_phase(timings, "receive", time.perf_counter() - headers_at)
             response.raise_for_status()
+            if reader is not None:
+                return self._finish_stream(reader, rate_limiter, estimated_tokens)
 
             result = response.json()
+            self._record_usage(result)
+            if rate_limiter is not None:
+                rate_limiter.reconcile(estimated_tokens, self._extract_usage(result))
+            return self._extract_content(result)
 
-            # 兼容不同API的响应格式
-            if "choices" in result and len(result["choices"]) > 0:
-                return result["choices"][0]["message"]["content"].strip()
-            else:
-                raise Exception(f"API响应格式异常: {result}")
+        except requests.exceptions.HTTPError as e:
+            raise APIRequestError.from_status(f"API请求失败: {e}", e.response.status_code, e.response.headers)
+        except requests.exceptions.Timeout as e:
+            raise APIRequestError(f"API请求失败: {e}", error_type=APIRequestError.TIMEOUT)
+        except requests.exceptions.RequestException as e:
+            raise APIRequestError(f"API请求失败: {e}")
+        finally:
+            slots.release()
+
+    def async_session(self, limit: int = 100):
+        """
+        创建异步HTTP会话（供 asyncio 生成引擎共享）
+        :param limit: 连接池最大连接数
+        :return: aiohttp.ClientSession，需配合 async with 使用
+        """
+        if aiohttp is None:
+            raise Exception("asyncio引擎需要安装aiohttp: pip install aiohttp")
+        connector = aiohttp.TCPConnector(limit=limit)
+        return aiohttp.ClientSession(
+            connector=connector,
+            headers=self._headers,
+            timeout=aiohttp.ClientTimeout(total=60),
+            trace_configs=[_request_tracer()]
+        )
+
+    async def agenerate(self, prompt: str, temperature: Optional[float] = None, max_tokens: Optional[int] = None,
+                        session=None, timings: Optional[dict] = None, stream: Optional[bool] = None,
+                        **kwargs) -> str:
+        """
+        异步调用API生成内容（generate 的 asyncio 版本）
+        :param prompt: 提示词
+        :param temperature: 温度参数
+        :param max_tokens: 最大token数
+        :param session: 共享的 aiohttp 会话，为空时临时创建
+        :param timings: 传入时累加各阶段耗时（同 generate，会话需由 async_session 创建才能区分建连与首字节）
+        :param stream: 是否使用流式响应，默认使用 self.stream
+        :return: 生成结果
+        """
+        if session is None:
+            async with self.async_session(limit=1) as own_session:
+                return await self.agenerate(prompt, temperature, max_tokens, session=own_session, timings=timings,
+                                            stream=stream, **kwargs)
+
+        temperature = self.temperature if temperature is None else temperature
+        max_tokens = self.max_tokens if max_tokens is None else max_tokens
+        stream = self.stream if stream is None else stream
+        data = self._build_payload(prompt, temperature, max_tokens, stream)
+
+        rate_limiter = self.rate_limiter
+        estimated_tokens = 0
+        queue_start = time.perf_counter()
+        if rate_limiter is not None:
+            estimated_tokens = RateLimiter.estimate_tokens(prompt, max_tokens)
+            wait = rate_limiter.reserve(estimated_tokens)
+            if wait > 0:
+                await asyncio.sleep(wait)
 
+        marks = {}
+        try:
+            request_start = time.perf_counter()
+            # 请求头逐个请求携带：端点池中多个端点（不同Key）共享同一个会话
+            async with session.post(self.chat_url, json=data, headers=self._headers,
+                                    trace_request_ctx=marks) as response:
+                headers_at = time.perf_counter()
+                reader = None
+                if stream and response.ok and _is_event_stream(response.headers.get("Content-Type")):
+                    reader = _StreamReader(self.stop_on_json)
+                    async for line in response.content:
+                        if reader.feed_line(line):
+                            break
+                    if reader.stopped_early:
+                        response.close()  # 断开连接，服务端停止生成
+                else:
+                    await response.read()
+                received_at = time.perf_counter()
+                # 等待连接池空闲连接计入排队
+                queued = marks.get("queued_end", 0) - marks.get("queued_start", 0)
+                sent_at = marks.get("sent", request_start + queued)
+                headers_at = marks.get("headers", headers_at)
+                _add_phase(timings, "queue", request_start - queue_start + queued)
+                _add_phase(timings, "connect", sent_at - request_start - queued)
+                _add_phase(timings, "ttfb", headers_at - sent_at)
+                if reader is not None:
+                    self._stream_phases(timings, reader, headers_at, received_at)
+                else:
+                    _add_phase(timings, "receive", received_at - headers_at)
+                response.raise_for_status()
+                if reader is None:
+                    result = await response.json(content_type=None)
+        except TimeoutError as e:
+            raise APIRequestError(f"API请求失败: 请求超时 {e}", error_type=APIRequestError.TIMEOUT)
+        except aiohttp.ClientResponseError as e:
+            raise APIRequestError.from_status(f"API请求失败: {e}", e.status, e.headers)
+        except aiohttp.ClientError as e:
+            raise APIRequestError(f"API请求失败: {e}")
+
+        if reader is not None:
+            return self._finish_stream(reader, rate_limiter, estimated_tokens)
+        self._record_usage(result)
+        if rate_limiter is not None:
+            rate_limiter.reconcile(estimated_tokens, self._extract_usage(result))
+        return self._extract_content(result)
+
+    # ==================== 批处理（Batch API） ====================
+
+    # 批处理的终止状态，其余（validating/in_progress/finalizing/cancelling）需继续轮询
+    BATCH_TERMINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+    def _batch_request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """发起批处理相关的请求（上传、创建、查询、下载），错误转换为 APIRequestError"""
+        try:
+            response = self._session.request(method, url, timeout=kwargs.pop('timeout', 60), **kwargs)
+            response.raise_for_status()
+            return response
+        except requests.exceptions.HTTPError as e:
+            raise APIRequestError.from_status(f"批处理请求失败: {e}", e.response.status_code, e.response.headers)
+        except requests.exceptions.Timeout as e:
+            raise APIRequestError(f"批处理请求失败: {e}", error_type=APIRequestError.TIMEOUT)
         except requests.exceptions.RequestException as e:
-            raise Exception(f"API请求失败: {e}")
+            raise APIRequestError(f"批处理请求失败: {e}")
+
+    def build_batch_request(self, custom_id: str, prompt: str) -> dict:
+        """
+        构建批处理输入文件（JSONL）中的一行
+        :param custom_id: 请求ID，结果按此ID对应回输入行
+        :param prompt: 提示词
+        """
+        return {
+            "custom_id": custom_id,
+            "method": "POST",
+            "url": self.batch_endpoint,
+            "body": self._build_payload(prompt, self.temperature, self.max_tokens)
+        }
+
+    def submit_batch(self, requests_path: str, completion_window: str = "24h") -> dict:
+        """
+        上传批处理输入文件并创建批处理任务
+        :param requests_path: build_batch_request 生成的JSONL文件
+        :param completion_window: 完成时限
+        :return: 批处理对象（含 id、status）
+        """
+        with open(requests_path, 'rb') as f:
+            # Content-Type 置空，由 requests 生成 multipart 边界
+            response = self._batch_request(
+                "POST", f"{self.base_url}/files", data={"purpose": "batch"},
+                files={"file": (os.path.basename(requests_path), f, "application/jsonl")},
+                headers={"Content-Type": None}, timeout=300
+            )
+        file_id = response.json()["id"]
+        response = self._batch_request("POST", f"{self.base_url}/batches", json={
+            "input_file_id": file_id,
+            "endpoint": self.batch_endpoint,
+            "completion_window": completion_window
+        })
+        return response.json()
+
+    def get_batch(self, batch_id: str) -> dict:
+        """查询批处理任务状态"""
+        return self._batch_request("GET", f"{self.base_url}/batches/{batch_id}").json()
+
+    def cancel_batch(self, batch_id: str) -> dict:
+        """取消批处理任务"""
+        return self._batch_request("POST", f"{self.base_url}/batches/{batch_id}/cancel").json()
+
+    def fetch_batch_results(self, batch: dict) -> dict:
+        """
+        下载已结束批处理任务的输出与错误文件
+        :param batch: get_batch 返回的批处理对象
+        :return: {custom_id: 生成内容 或 APIRequestError}，没有结果的请求不在其中
+        """
+        outcomes = {}
+        for key in ("output_file_id", "error_file_id"):
+            file_id = batch.get(key)
+            if not file_id:
+                continue
+            text = self._batch_request("GET", f"{self.base_url}/files/{file_id}/content", timeout=300).text
+            for line in text.splitlines():
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                outcomes[record["custom_id"]] = self._batch_outcome(record)
+        return outcomes
+
+    def _batch_outcome(self, record: dict):
+        """批处理输出中的一行转换为生成内容或错误"""
+        response = record.get("response") or {}
+        status_code = response.get("status_code")
+        body = response.get("body")
+        if record.get("error") is None and status_code == 200 and isinstance(body, dict):
+            try:
+                content = self._extract_content(body)
+            except APIRequestError as e:
+                return e
+            self._record_usage(body)
+            return content
+
+        message = (record.get("error") or {}).get("message")
+        if message is None and isinstance(body, dict):
+            message = (body.get("error") or {}).get("message")
+        message = f"批处理请求失败: {message or body}"
+        if status_code:
+            return APIRequestError.from_status(message, status_code)
+        return APIRequestError(message, error_type=APIRequestError.RESPONSE)
 
     def test_connection(self) -> tuple[bool, str]:
         """测试API连接"""
@@ -81,6 +877,301 @@ class UniversalAPIClient:
             return False, str(e)
 
 
+class Endpoint:
+    """端点池中的一个端点：客户端、权重、并发上限与健康状态"""
+
+    def __init__(self, client: UniversalAPIClient, weight: float = 1.0, max_concurrency: Optional[int] = None,
+                 name: str = ""):
+        """
+        :param client: 该端点的客户端（URL、Key、模型）
+        :param weight: 路由权重
+        :param max_concurrency: 该端点的最大在途请求数，为空不限制
+        :param name: 端点名称，默认为 主机/模型（端点池中重名时追加序号）
+        """
+        self.client = client
+        self.weight = weight
+        self.max_concurrency = max_concurrency
+        self.name = name or f"{urlparse(client.chat_url).netloc}/{client.model}"
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.requests = 0
+        self.errors = 0  # 端点错误（限流、5xx、超时、网络、鉴权失败）次数
+        self.consecutive_errors = 0
+        self.latency: Optional[float] = None  # 成功请求耗时的EWMA（秒）
+        self.cooldown_until = 0.0  # 出错后暂停接收请求直到该时刻（time.monotonic）
+
+    def has_capacity(self) -> bool:
+        return self.max_concurrency is None or self.in_flight < self.max_concurrency
+
+    def get_stats(self, now: float) -> dict:
+        return {
+            "name": self.name,
+            "model": self.client.model,
+            "weight": self.weight,
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self.in_flight,
+            "peak_in_flight": self.peak_in_flight,
+            "requests": self.requests,
+            "errors": self.errors,
+            "latency": round(self.latency, 4) if self.latency is not None else None,
+            "healthy": now >= self.cooldown_until,
+            "cooldown_seconds": round(max(self.cooldown_until - now, 0.0), 2)
+        }
+
+
+class EndpointPool:
+    """
+    多端点（多个URL/Key/模型）客户端池，接口与 UniversalAPIClient 一致，可直接传给生成器
+    每个请求路由到 (在途数+1)/有效权重 最小的可用端点，有效权重随端点变慢而降低；
+    端点出错（限流、5xx、超时、网络、鉴权失败）后按指数退避暂停接收请求，当前请求立即转到其他端点
+    """
+
+    supports_timings = True
+
+    LATENCY_ALPHA = 0.2  # 端点耗时EWMA的平滑系数
+    MIN_SPEED_FACTOR = 0.05  # 变慢的端点有效权重的下限比例，仍能收到少量请求以便恢复
+    BASE_COOLDOWN = 1.0  # 首次出错后的暂停时长（秒），连续出错时翻倍
+    MAX_COOLDOWN = 60.0
+    ENDPOINT_STATUS_CODES = (401, 403)  # 鉴权失败属于端点问题，换端点可能成功
+
+    def __init__(self, endpoints: List[Endpoint]):
+        if not endpoints:
+            raise ValueError("端点池至少需要一个端点")
+        # 名称用作统计与指标的标签，同主机同模型（如同一服务的多个Key）的端点追加序号区分
+        names = [e.name for e in endpoints]
+        for i, endpoint in enumerate(endpoints):
+            if names.count(endpoint.name) > 1:
+                endpoint.name = f"{endpoint.name}#{i + 1}"
+        self.endpoints = endpoints
+        self.rate_limiter = None  # 限速在各端点的客户端上分别设置
+        self._condition = threading.Condition()
+        self._async_waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []  # 归还名额时唤醒
+
+    @property
+    def model(self) -> str:
+        """各端点的模型（用于缓存键，端点配置不变时保持稳定）"""
+        return "+".join(dict.fromkeys(e.client.model for e in self.endpoints))
+
+    @property
+    def temperature(self) -> float:
+        return self.endpoints[0].client.temperature
+
+    @property
+    def max_tokens(self) -> int:
+        return self.endpoints[0].client.max_tokens
+
+    def _is_endpoint_error(self, error: Exception) -> bool:
+        """换一个端点可能成功的错误；参数错误等与端点无关的错误不影响端点健康状态"""
+        if not isinstance(error, APIRequestError):
+            return False
+        return error.retryable or error.status_code in self.ENDPOINT_STATUS_CODES
+
+    def _effective_weight(self, endpoint: Endpoint, fastest: Optional[float]) -> float:
+        if endpoint.latency is None or not fastest:
+            return endpoint.weight
+        return endpoint.weight * max(fastest / endpoint.latency, self.MIN_SPEED_FACTOR)
+
+    def _try_acquire(self, tried: List[Endpoint]) -> Tuple[Optional[Endpoint], bool]:
+        """
+        选择端点并占用一个在途名额（调用方持有锁）
+        :param tried: 本次请求已失败过的端点
+        :return: (端点, 是否已无端点可试)；端点均已满时返回 (None, False)，需等待
+        """
+        now = time.monotonic()
+        remaining = [e for e in self.endpoints if e not in tried]
+        if not remaining:
+            return None, True
+        candidates = [e for e in remaining if e.has_capacity()]
+        if not candidates:
+            return None, False
+        healthy = [e for e in candidates if now >= e.cooldown_until]
+        if healthy:
+            latencies = [e.latency for e in self.endpoints if e.latency is not None and now >= e.cooldown_until]
+            fastest = min(latencies) if latencies else None
+            endpoint = min(healthy, key=lambda e: (e.in_flight + 1) / self._effective_weight(e, fastest))
+        else:
+            # 全部处于暂停期：试探最早恢复的端点，而不是让请求全部失败
+            endpoint = min(candidates, key=lambda e: e.cooldown_until)
+        endpoint.in_flight += 1
+        endpoint.peak_in_flight = max(endpoint.peak_in_flight, endpoint.in_flight)
+        endpoint.requests += 1
+        return endpoint, False
+
+    def _acquire(self, tried: List[Endpoint]) -> Optional[Endpoint]:
+        """选择端点，端点均已满时阻塞等待；已无端点可试时返回空"""
+        with self._condition:
+            while True:
+                endpoint, exhausted = self._try_acquire(tried)
+                if endpoint is not None or exhausted:
+                    return endpoint
+                self._condition.wait(0.1)
+
+    async def _aacquire(self, tried: List[Endpoint]) -> Optional[Endpoint]:
+        """_acquire 的 asyncio 版本，端点均已满时等待归还名额唤醒"""
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._condition:
+                endpoint, exhausted = self._try_acquire(tried)
+                if endpoint is not None or exhausted:
+                    return endpoint
+                future = loop.create_future()
+                self._async_waiters.append((loop, future))
+            try:
+                await future
+            except asyncio.CancelledError:
+                with self._condition:
+                    if (loop, future) in self._async_waiters:
+                        self._async_waiters.remove((loop, future))
+                raise
+
+    def _release(self, endpoint: Endpoint, latency: float, error: Optional[Exception] = None):
+        """归还名额并更新端点的耗时与健康状态"""
+        with self._condition:
+            endpoint.in_flight -= 1
+            if error is None:
+                endpoint.consecutive_errors = 0
+                endpoint.cooldown_until = 0.0
+                if endpoint.latency is None:
+                    endpoint.latency = latency
+                else:
+                    endpoint.latency = self.LATENCY_ALPHA * latency + (1 - self.LATENCY_ALPHA) * endpoint.latency
+            elif self._is_endpoint_error(error):
+                endpoint.errors += 1
+                endpoint.consecutive_errors += 1
+                cooldown = min(self.BASE_COOLDOWN * 2 ** (endpoint.consecutive_errors - 1), self.MAX_COOLDOWN)
+                retry_after = getattr(error, 'retry_after', None)
+                if retry_after is not None:
+                    cooldown = max(cooldown, min(retry_after, self.MAX_COOLDOWN))
+                endpoint.cooldown_until = time.monotonic() + cooldown
+            self._condition.notify_all()
+            # 各等待方已试过的端点不同，全部唤醒后各自重新选择
+            waiters, self._async_waiters = self._async_waiters, []
+        for loop, future in waiters:
+            _wake_future(loop, future)
+
+    def generate(self, prompt: str, timings: Optional[dict] = None, **kwargs) -> str:
+        """
+        路由到一个端点生成内容，端点出错时立即转到其他端点，所有端点都失败时抛出最后一个错误
+        :param timings: 同 UniversalAPIClient.generate，等待端点空闲名额计入排队
+        """
+        tried: List[Endpoint] = []
+        last_error: Optional[Exception] = None
+        while True:
+            wait_start = time.perf_counter()
+            endpoint = self._acquire(tried)
+            if endpoint is None:
+                raise last_error
+            _add_phase(timings, "queue", time.perf_counter() - wait_start)
+            request_start = time.perf_counter()
+            try:
+                result = endpoint.client.generate(prompt, timings=timings, **kwargs)
+            except Exception as e:
+                self._release(endpoint, time.perf_counter() - request_start, e)
+                if not self._is_endpoint_error(e):
+                    raise
+                tried.append(endpoint)
+                last_error = e
+                continue
+            self._release(endpoint, time.perf_counter() - request_start)
+            return result
+
+    def async_session(self, limit: int = 100):
+        """创建共享的异步会话（各端点的请求头逐个请求携带）"""
+        return self.endpoints[0].client.async_session(limit=limit)
+
+    async def agenerate(self, prompt: str, session=None, timings: Optional[dict] = None, **kwargs) -> str:
+        """generate 的 asyncio 版本"""
+        tried: List[Endpoint] = []
+        last_error: Optional[Exception] = None
+        while True:
+            wait_start = time.perf_counter()
+            endpoint = await self._aacquire(tried)
+            if endpoint is None:
+                raise last_error
+            _add_phase(timings, "queue", time.perf_counter() - wait_start)
+            request_start = time.perf_counter()
+            try:
+                result = await endpoint.client.agenerate(prompt, session=session, timings=timings, **kwargs)
+            except Exception as e:
+                self._release(endpoint, time.perf_counter() - request_start, e)
+                if not self._is_endpoint_error(e):
+                    raise
+                tried.append(endpoint)
+                last_error = e
+                continue
+            self._release(endpoint, time.perf_counter() - request_start)
+            return result
+
+    def configure_pool(self, pool_size: int):
+        """各端点的连接池按生成并发数设置，不超过端点自身的并发上限"""
+        for endpoint in self.endpoints:
+            size = pool_size if endpoint.max_concurrency is None else min(pool_size, endpoint.max_concurrency)
+            endpoint.client.configure_pool(size)
+
+    def get_pool_stats(self) -> dict:
+        """各端点连接池统计的合计"""
+        totals = {}
+        for endpoint in self.endpoints:
+            for key, value in endpoint.client.get_pool_stats().items():
+                totals[key] = totals.get(key, 0) + value
+        return totals
+
+    def get_usage_stats(self) -> dict:
+        """各端点token消耗的合计"""
+        totals = {}
+        for endpoint in self.endpoints:
+            for key, value in endpoint.client.get_usage_stats().items():
+                totals[key] = totals.get(key, 0) + value
+        return totals
+
+    def get_endpoint_stats(self) -> List[dict]:
+        """各端点的权重、在途数、请求数、错误数、耗时与健康状态"""
+        now = time.monotonic()
+        with self._condition:
+            return [endpoint.get_stats(now) for endpoint in self.endpoints]
+
+    def close(self):
+        for endpoint in self.endpoints:
+            endpoint.client.close()
+
+    def test_connection(self) -> tuple[bool, str]:
+        """逐个测试端点，至少一个可用即视为成功"""
+        failed = []
+        for endpoint in self.endpoints:
+            success, message = endpoint.client.test_connection()
+            if not success:
+                failed.append(f"{endpoint.name}: {message}")
+        if len(failed) == len(self.endpoints):
+            return False, "；".join(failed)
+        if failed:
+            return True, f"{len(self.endpoints) - len(failed)}/{len(self.endpoints)}个端点可用，不可用的端点：" + "；".join(failed)
+        return True, "连接成功"
+
+
+def create_client(api_url: str, api_key: str, model: str, rpm: Optional[int] = None,
+                  tpm: Optional[int] = None, stream: bool = False) -> UniversalAPIClient:
+    """创建客户端并设置限速（模块级函数，可通过 functools.partial 传给分片进程）"""
+    client = UniversalAPIClient(api_url, api_key, model, stream=stream)
+    client.set_rate_limit(rpm, tpm)
+    return client
+
+
+def create_endpoint_pool(endpoints: List[dict]) -> EndpointPool:
+    """
+    按端点配置创建端点池（模块级函数，可通过 functools.partial 传给分片进程）
+    :param endpoints: 每项包含 api_url、api_key、model，可选 weight、max_concurrency、rpm、tpm、stream、name
+    """
+    return EndpointPool([
+        Endpoint(
+            create_client(e["api_url"], e["api_key"], e["model"], e.get("rpm"), e.get("tpm"), bool(e.get("stream"))),
+            weight=float(e.get("weight") or 1.0),
+            max_concurrency=e.get("max_concurrency"),
+            name=e.get("name", "")
+        )
+        for e in endpoints
+    ])
+
+
 # API配置类（运行时存储在内存）
 class APIConfig:
     """API配置管理（内存存储，不持久化）"""
@@ -89,18 +1180,27 @@ class APIConfig:
         self._client: Optional[UniversalAPIClient] = None
         self._api_url: Optional[str] = None
         self._model: Optional[str] = None
+        self._rate_limit: tuple = (None, None)  # (rpm, tpm)
+        self._endpoints: Optional[List[dict]] = None  # 端点池配置（含密钥，仅内存）
 
-    def configure(self, api_url: str, api_key: str, model: str) -> tuple[bool, str]:
+    def configure(self, api_url: str, api_key: str, model: str,
+                  rpm: Optional[int] = None, tpm: Optional[int] = None, stream: bool = False) -> tuple[bool, str]:
         """
         配置API
         :param api_url: API地址
         :param api_key: API密钥
         :param model: 模型名称
+        :param rpm: 每分钟请求数配额（可选）
+        :param tpm: 每分钟token数配额（可选）
+        :param stream: 是否使用流式响应（JSON完整后提前结束，节省输出token）
         """
         try:
-            self._client = UniversalAPIClient(api_url, api_key, model)
+            self._client = UniversalAPIClient(api_url, api_key, model, stream=stream)
+            self._client.set_rate_limit(rpm, tpm)
             self._api_url = api_url
             self._model = model
+            self._rate_limit = (rpm, tpm)
+            self._endpoints = None
 
             success, message = self._client.test_connection()
             if success:
@@ -112,6 +1212,37 @@ class APIConfig:
             self._client = None
             return False, str(e)
 
+    def configure_endpoints(self, endpoints: List[dict]) -> tuple[bool, str]:
+        """
+        配置多端点池，请求按权重与在途数路由，出错的端点自动暂停并转到其他端点
+        :param endpoints: 每项包含 api_url、api_key、model，可选 weight、max_concurrency、rpm、tpm、stream、name
+        """
+        for i, endpoint in enumerate(endpoints or []):
+            if not all(endpoint.get(key) for key in ("api_url", "api_key", "model")):
+                return False, f"第{i + 1}个端点参数不完整，需要 api_url, api_key, model"
+        if not endpoints:
+            return False, "端点列表为空"
+        names = [endpoint["name"] for endpoint in endpoints if endpoint.get("name")]
+        duplicates = sorted({name for name in names if names.count(name) > 1})
+        if duplicates:
+            return False, f"端点名称重复: {', '.join(duplicates)}"
+        try:
+            pool = create_endpoint_pool(endpoints)
+            success, message = pool.test_connection()
+            if not success:
+                pool.close()
+                self._client = None
+                return False, f"连接测试失败: {message}"
+            self._client = pool
+            self._api_url = None
+            self._model = pool.model
+            self._rate_limit = (None, None)
+            self._endpoints = [dict(endpoint) for endpoint in endpoints]
+            return True, "配置成功" if message == "连接成功" else f"配置成功（{message}）"
+        except Exception as e:
+            self._client = None
+            return False, str(e)
+
     def is_configured(self) -> bool:
         """检查是否已配置"""
         return self._client is not None
@@ -120,6 +1251,24 @@ class APIConfig:
         """获取客户端"""
         return self._client
 
+    def client_factory(self, processes: int = 1):
+        """
+        供分片进程各自创建客户端的工厂（可被pickle）
+        :param processes: 进程数，限速配额在各进程间平分
+        """
+        if not self.is_configured():
+            return None
+        if self._endpoints is not None:
+            # 各端点的限速配额与并发上限同样在进程间平分
+            return functools.partial(create_endpoint_pool, [
+                {**endpoint, **{key: max(1, int(endpoint[key]) // processes)
+                                for key in ("rpm", "tpm", "max_concurrency") if endpoint.get(key)}}
+                for endpoint in self._endpoints
+            ])
+        rpm, tpm = (max(1, limit // processes) if limit else None for limit in self._rate_limit)
+        return functools.partial(create_client, self._client.api_url, self._client.api_key, self._model,
+                                 rpm, tpm, self._client.stream)
+
     def generate(self, prompt: str, **kwargs) -> str:
         """生成内容"""
         if not self.is_configured():
@@ -128,16 +1277,33 @@ class APIConfig:
 
     def clear(self):
         """清除配置"""
+        if self._client is not None:
+            self._client.close()
         self._client = None
         self._api_url = None
         self._model = None
+        self._rate_limit = (None, None)
+        self._endpoints = None
+
+    def get_endpoint_stats(self) -> Optional[List[dict]]:
+        """端点池中各端点的统计，未配置端点池时为空"""
+        if isinstance(self._client, EndpointPool):
+            return self._client.get_endpoint_stats()
+        return None
 
     def get_config_info(self) -> dict:
         """获取配置信息（不包含敏感信息）"""
-        return {
+        info = {
             "api_url": self._api_url,
-            "model": self._model
+            "model": self._model,
+            "stream": getattr(self._client, 'stream', False)
         }
+        if self._endpoints is not None:
+            info["endpoints"] = [
+                {key: endpoint.get(key) for key in ("name", "api_url", "model", "weight", "max_concurrency", "stream")}
+                for endpoint in self._endpoints
+            ]
+        return info
 
 
 # 全局API配置实例（内存存储）
@@ -3,15 +3,20 @@ Flask Web应用 - 交互式话题召回Key生成工具
 """
 
 import os
-import json
 import uuid
+import functools
 from dataclasses import asdict
-from flask import Flask, render_template, request, jsonify, send_file
+from flask import Flask, Response, render_template, request, jsonify, send_file
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
 
 from api_clients import api_config
 from generator import KeyGenerator, GenerationResult
+from response_cache import ResponseCache
+from result_writers import ResultTailer, detect_format, export_results
+from progress_stream import ProgressBroadcaster
+from metrics import MetricsRegistry, gauge_families, render_families
+from jobs import ConcurrencyBudget, JobManager
 
 app = Flask(__name__)
 CORS(app)
@@ -23,27 +28,79 @@ app.config['UPLOAD_FOLDER'] = os.path.join(os.path.dirname(os.path.dirname(__fil
 # 确保上传目录存在
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
-# 全局状态管理
-class GlobalState:
-    def __init__(self):
-        self.generator = KeyGenerator(save_interval=20)
-        self.prompt_template = ""
-        self.variable_mapping = {}
-        self.input_file = ""
-        self.output_file = ""
-        self.generation_status = "idle"  # idle, previewing, generating, completed, error
-        self.status_message = ""
-        self.task_id = ""
-
-    def reset(self):
-        """重置状态"""
-        self.generator.clear()
-        self.prompt_template = ""
-        self.variable_mapping = {}
-        self.generation_status = "idle"
-        self.status_message = ""
-
-state = GlobalState()
+# 响应缓存（重复运行时Prompt未变化的行直接复用结果）
+response_cache = ResponseCache(os.path.join(app.config['UPLOAD_FOLDER'], '.response_cache.sqlite'))
+
+# 进程级指标（/metrics），每个任务另有一份以 job 标签区分的任务级指标
+metrics = MetricsRegistry()
+
+# 所有任务共享的并发预算（合计在途请求数），按优先级加权公平分配
+budget = ConcurrencyBudget(int(os.environ.get('AIGC_MAX_CONCURRENCY', 64)))
+
+
+def create_generator(job_id, share):
+    return KeyGenerator(save_interval=20, cache=response_cache, metrics=metrics, budget=share, job_id=job_id)
+
+
+# 任务管理：每次上传创建一个任务，各自有独立的生成器、工作目录（上传文件与断点）和进度流
+jobs = JobManager(
+    os.path.join(app.config['UPLOAD_FOLDER'], 'jobs'),
+    create_generator,
+    budget=budget,
+    broadcaster_factory=ProgressBroadcaster
+)
+
+
+def request_job_id():
+    """从查询参数、JSON请求体或表单中读取任务ID"""
+    body = request.get_json(silent=True) or {}
+    return request.args.get('job_id') or body.get('job_id') or request.form.get('job_id')
+
+
+def with_job(view):
+    """
+    按请求中的 job_id 查找任务并作为第一个参数传给路由函数
+    未指定 job_id 时仅在只有一个任务时使用该任务（兼容单任务用法），
+    存在多个任务时要求指定，避免生成、取消、重置或删除落到别人的任务上
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        job_id = request_job_id()
+        if job_id:
+            job = jobs.get(job_id)
+            if job is None:
+                return jsonify({'success': False, 'message': f'任务不存在: {job_id}'}), 404
+        else:
+            existing = jobs.list()
+            if not existing:
+                return jsonify({'success': False, 'message': '请先上传文件'}), 400
+            if len(existing) > 1:
+                return jsonify({'success': False, 'message': '存在多个任务，请指定 job_id'}), 400
+            job = existing[0]
+        return view(job, *args, **kwargs)
+    return wrapper
+
+
+def positive_int(data, key, default=None, minimum=1):
+    """
+    读取请求中的正整数参数
+    :param default: 未提供（或为空）时的默认值
+    :param minimum: 允许的最小值（如补跑轮数可以为0）
+    :raises ValueError: 参数不是大于等于 minimum 的整数
+    """
+    value = data.get(key)
+    if value is None or value == '':
+        return default
+    message = f'{key} 必须是大于等于{minimum}的整数'
+    if isinstance(value, bool) or (isinstance(value, float) and not value.is_integer()):
+        raise ValueError(message)
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(message)
+    if number < minimum:
+        raise ValueError(message)
+    return number
 
 
 # 默认Prompt模板路径
@@ -68,11 +125,37 @@ def index():
 
 @app.route('/api/config', methods=['POST'])
 def configure_api():
-    """配置API"""
+    """配置API（单个端点，或 endpoints 列表配置多端点池）"""
     data = request.json
+    endpoints = data.get('endpoints')
+    if endpoints:
+        # 每项：api_url、api_key、model，可选 name、weight、max_concurrency、rpm、tpm、stream
+        try:
+            endpoints = [
+                {
+                    **{key: str(e.get(key, '')).strip() for key in ('api_url', 'api_key', 'model', 'name')},
+                    'weight': float(e.get('weight') or 1),
+                    'stream': bool(e.get('stream')),
+                    **{key: positive_int(e, key) for key in ('max_concurrency', 'rpm', 'tpm')}
+                }
+                for e in endpoints
+            ]
+        except ValueError as e:
+            return jsonify({'success': False, 'message': f'端点参数格式错误: {e}'})
+        except (TypeError, AttributeError):
+            return jsonify({'success': False, 'message': '端点参数格式错误'})
+        success, message = api_config.configure_endpoints(endpoints)
+        return jsonify({'success': success, 'message': message})
+
     api_url = data.get('api_url', '').strip()
     api_key = data.get('api_key', '').strip()
     model = data.get('model', '').strip()
+    try:
+        rpm = positive_int(data, 'rpm')  # 每分钟请求数配额（可选）
+        tpm = positive_int(data, 'tpm')  # 每分钟token数配额（可选）
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)})
+    stream = bool(data.get('stream'))  # 流式响应，JSON完整后提前结束（可选）
 
     if not all([api_url, api_key, model]):
         return jsonify({
@@ -80,7 +163,12 @@ def configure_api():
             'message': '参数不完整，需要 api_url, api_key, model'
         })
 
-    success, message = api_config.configure(api_url, api_key, model)
+    success, message = api_config.configure(
+        api_url, api_key, model,
+        rpm=rpm,
+        tpm=tpm,
+        stream=stream
+    )
 
     return jsonify({
         'success': success,
@@ -127,34 +215,51 @@ def upload_file():
     if not file.filename.endswith('.xlsx'):
         return jsonify({'success': False, 'message': '只支持.xlsx文件'})
 
-    # 保存文件
+    # 指定 job_id 时在该任务中重新加载，否则创建新任务（不影响其他正在运行的任务）
+    job_id = request_job_id()
+    if job_id:
+        job = jobs.get(job_id)
+        if job is None:
+            return jsonify({'success': False, 'message': f'任务不存在: {job_id}'}), 404
+        if job.is_running:
+            return jsonify({'success': False, 'message': '该任务正在生成，不能重新上传'})
+        job.reset()
+    else:
+        try:
+            job = jobs.create(name=file.filename, priority=request.form.get('priority', 'normal'))
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)})
+
+    # 保存文件到任务工作目录（断点也写在此目录）
     filename = secure_filename(file.filename)
-    filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+    filepath = os.path.join(job.work_dir, filename)
     file.save(filepath)
 
-    # 加载文件
-    state.reset()
-    success, message = state.generator.load_input(filepath)
+    # 加载文件（大文件可开启流式模式，生成时边读边请求）
+    streaming = request.form.get('streaming', 'false').lower() in ('1', 'true', 'yes')
+    success, message = job.generator.load_input(filepath, streaming=streaming)
 
     if not success:
         return jsonify({'success': False, 'message': message})
 
-    state.input_file = filepath
-    state.generation_status = "file_loaded"
+    job.input_file = filepath
+    job.generation_status = "file_loaded"
 
     return jsonify({
         'success': True,
         'message': message,
         'data': {
-            'total_rows': state.generator.total_rows,
-            'headers': state.generator.headers,
-            'preview': state.generator.get_data_preview(5)
+            'job_id': job.job_id,
+            'total_rows': job.generator.total_rows,
+            'headers': job.generator.headers,
+            'preview': job.generator.get_data_preview(5)
         }
     })
 
 
 @app.route('/api/preview', methods=['POST'])
-def preview():
+@with_job
+def preview(job):
     """预览前N个生成结果"""
     if not api_config.is_configured():
         return jsonify({'success': False, 'message': '请先配置API'})
@@ -163,23 +268,25 @@ def preview():
     template = data.get('prompt', '')
     variables_raw = data.get('variables', [])
     n = data.get('count', 3)
+    use_cache = data.get('use_cache', True)  # 为False时跳过缓存重新请求
 
     # 转换变量映射
     variables = {v['name']: v['column'] for v in variables_raw}
 
-    state.prompt_template = template
-    state.variable_mapping = variables
-    state.generation_status = "previewing"
+    job.prompt_template = template
+    job.variable_mapping = variables
+    job.generation_status = "previewing"
 
     try:
-        results, message = state.generator.preview_first_n(
+        results, message = job.generator.preview_first_n(
             api_config.get_client(),
             n=n,
             template=template,
-            variables=variables
+            variables=variables,
+            use_cache=use_cache
         )
 
-        state.generation_status = "preview_completed"
+        job.generation_status = "preview_completed"
 
         return jsonify({
             'success': True,
@@ -190,51 +297,152 @@ def preview():
             }
         })
     except Exception as e:
-        state.generation_status = "error"
-        state.status_message = str(e)
+        job.set_status("error", str(e))
         return jsonify({'success': False, 'message': str(e)})
 
 
 @app.route('/api/generate', methods=['POST'])
-def start_generation():
+@with_job
+def start_generation(job):
     """开始批量生成"""
     if not api_config.is_configured():
         return jsonify({'success': False, 'message': '请先配置API'})
 
-    if state.generator.total_rows == 0:
+    # 流式上传的文件缺少尺寸信息时 total_rows 为0，但仍可生成
+    if job.generator.total_rows == 0 and not job.input_file:
         return jsonify({'success': False, 'message': '请先上传文件'})
+    if job.is_running:
+        return jsonify({'success': False, 'message': '该任务正在生成中'})
 
     data = request.json
-    start_index = data.get('start_index', 0)
-    max_workers = data.get('max_workers', 5)  # 并发数，默认5
+    adaptive = data.get('adaptive', True)  # 是否根据延迟与限流情况自适应调整并发
+    use_cache = data.get('use_cache', True)  # 为False时跳过缓存重新请求
+    dedup = data.get('dedup', True)  # Prompt相同的行只请求一次
+    engine = data.get('engine', 'thread')  # 生成引擎：thread（线程池）、async（asyncio）或 batch（批处理接口）
+    tail_output = data.get('tail_output')  # 边生成边写出结果的文件名（csv/jsonl），可选
+    priority = data.get('priority')  # 任务优先级（low/normal/high），可选
+    retry_policy = job.generator.retry_policy
+    try:
+        start_index = positive_int(data, 'start_index', 0, minimum=0)
+        max_workers = positive_int(data, 'max_workers', 5)  # 并发数，默认5（自适应模式下为初始并发数）
+        max_limit = positive_int(data, 'max_limit', 64)  # 自适应并发上限
+        max_concurrency = positive_int(data, 'max_concurrency', 100)  # async引擎的最大在途请求数
+        poll_interval = positive_int(data, 'poll_interval', 30)  # batch引擎查询批处理状态的间隔（秒）
+        processes = positive_int(data, 'processes', 1)  # 大于1时按行分片到多个进程并行生成（每个进程使用上述并发参数）
+        pack_size = positive_int(data, 'pack_size', 1)  # thread引擎每个请求打包的行数，大于1时模板只发送一次
+        # 重试策略（可选）：单行最大尝试次数与失败行补跑轮数
+        max_attempts = positive_int(data, 'max_attempts', retry_policy.max_attempts)
+        requeue_passes = positive_int(data, 'requeue_passes', retry_policy.requeue_passes, minimum=0)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+
+    if engine not in ('thread', 'async', 'batch'):
+        return jsonify({'success': False, 'message': f'不支持的生成引擎: {engine}'})
+    if engine == 'batch' and processes > 1:
+        return jsonify({'success': False, 'message': 'batch引擎不支持多进程分片'})
+
+    tailer = None
+    if tail_output:
+        try:
+            tailer = ResultTailer(job.generator, os.path.join(job.work_dir, os.path.basename(tail_output)))
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)})
+
+    # 检查与占用是原子的：同一任务的并发请求只有一个能启动生成
+    if not job.claim_run():
+        return jsonify({'success': False, 'message': '该任务正在生成中'})
+    if priority:
+        try:
+            jobs.set_priority(job, priority)
+        except ValueError as e:
+            job.release_run()
+            return jsonify({'success': False, 'message': str(e)})
+
+    retry_policy.max_attempts = max_attempts
+    retry_policy.requeue_passes = requeue_passes
 
     def progress_callback(current, total, success_count, error_count):
-        # 进度更新会通过 /api/progress 获取
-        pass
+        # 唤醒进度流连接；轮询方式仍可通过 /api/progress 获取
+        job.broadcaster.notify()
 
-    state.generation_status = "generating"
+    job.set_status("generating", "")
 
     def run_generation():
+        if tailer is not None:
+            tailer.start()
         try:
-            success, message = state.generator.start_generation(
-                api_config.get_client(),
-                state.prompt_template,
-                state.variable_mapping,
-                start_index=start_index,
-                on_progress=progress_callback,
-                max_workers=max_workers  # 传递并发参数
-            )
+            if processes > 1:
+                # 分片进程各自发起请求，不占用全局并发预算；RPM/TPM配额在进程间平分
+                success, message = job.generator.start_generation_sharded(
+                    api_config.client_factory(processes),
+                    job.prompt_template,
+                    job.variable_mapping,
+                    shards=processes,
+                    on_progress=progress_callback,
+                    engine=engine,
+                    max_workers=max_workers,
+                    adaptive=adaptive,
+                    max_limit=max_limit,
+                    max_concurrency=max_concurrency,
+                    use_cache=use_cache,
+                    dedup=dedup,
+                    pack_size=pack_size,
+                    start_index=start_index
+                )
+            elif engine == 'batch':
+                success, message = job.generator.start_generation_batch(
+                    api_config.get_client(),
+                    job.prompt_template,
+                    job.variable_mapping,
+                    start_index=start_index,
+                    on_progress=progress_callback,
+                    poll_interval=poll_interval,
+                    use_cache=use_cache,
+                    dedup=dedup
+                )
+            elif engine == 'async':
+                success, message = job.generator.run_generation_async(
+                    api_config.get_client(),
+                    job.prompt_template,
+                    job.variable_mapping,
+                    start_index=start_index,
+                    on_progress=progress_callback,
+                    max_concurrency=max_concurrency,
+                    use_cache=use_cache,
+                    dedup=dedup
+                )
+            else:
+                success, message = job.generator.start_generation(
+                    api_config.get_client(),
+                    job.prompt_template,
+                    job.variable_mapping,
+                    start_index=start_index,
+                    on_progress=progress_callback,
+                    max_workers=max_workers,  # 传递并发参数
+                    adaptive=adaptive,
+                    max_limit=max_limit,
+                    use_cache=use_cache,
+                    dedup=dedup,
+                    pack_size=pack_size
+                )
 
             if success:
-                state.generation_status = "completed"
-                state.status_message = message
+                job.set_status("completed", message)
+            elif job.generator.is_cancelled:
+                job.set_status("cancelled", message)
             else:
-                state.generation_status = "error"
-                state.status_message = message
+                job.set_status("error", message)
 
         except Exception as e:
-            state.generation_status = "error"
-            state.status_message = str(e)
+            job.set_status("error", str(e))
+
+        finally:
+            try:
+                if tailer is not None:
+                    tailer.close()
+                    job.output_file = tailer.output_path
+            finally:
+                job.release_run()
 
     # 在后台运行
     import threading
@@ -245,32 +453,172 @@ def start_generation():
         'success': True,
         'message': '生成任务已启动',
         'data': {
-            'total': state.generator.total_rows,
+            'total': job.generator.total_rows,
             'start_index': start_index,
-            'max_workers': max_workers
+            'max_workers': max_workers,
+            'adaptive': adaptive,
+            'max_limit': max_limit,
+            'engine': engine,
+            'max_concurrency': max_concurrency,
+            'processes': processes,
+            'pack_size': pack_size,
+            'tail_output': tail_output
         }
     })
 
 
+@app.route('/api/generate/pause', methods=['POST'])
+@with_job
+def pause_generation(job):
+    """暂停生成：不再提交新任务，在途请求继续完成"""
+    if not job.generator.pause_generation():
+        return jsonify({'success': False, 'message': '当前没有进行中的生成任务'})
+    job.generation_status = "paused"
+    return jsonify({'success': True, 'message': '生成已暂停'})
+
+
+@app.route('/api/generate/resume', methods=['POST'])
+@with_job
+def resume_generation(job):
+    """继续已暂停的生成"""
+    if not job.generator.resume_generation():
+        return jsonify({'success': False, 'message': '当前没有进行中的生成任务'})
+    job.set_status("generating")
+    return jsonify({'success': True, 'message': '生成已继续'})
+
+
+@app.route('/api/generate/cancel', methods=['POST'])
+@with_job
+def cancel_generation(job):
+    """取消生成：撤回排队任务，在途请求完成后保存断点"""
+    if not job.generator.cancel_generation():
+        return jsonify({'success': False, 'message': '当前没有进行中的生成任务'})
+    return jsonify({'success': True, 'message': '正在取消，等待在途请求完成'})
+
+
+def progress_payload(job):
+    """任务的进度数据（轮询与进度流共用）"""
+    progress = job.generator.get_progress()
+    client = api_config.get_client()
+    return {
+        **progress,
+        'pool': client.get_pool_stats() if client else None,
+        'rate_limit': client.rate_limiter.get_stats() if client and client.rate_limiter else None,
+        'endpoints': api_config.get_endpoint_stats(),
+        'job_id': job.job_id,
+        'priority': job.priority,
+        'budget': budget.get_stats()['jobs'].get(job.job_id),
+        'status': job.generation_status,
+        'message': job.status_message
+    }
+
+
 @app.route('/api/progress', methods=['GET'])
-def get_progress():
+@with_job
+def get_progress(job):
     """获取生成进度"""
-    progress = state.generator.get_progress()
+    return jsonify({
+        'success': True,
+        'data': progress_payload(job)
+    })
+
+
+@app.route('/api/progress/stream', methods=['GET'])
+@with_job
+def progress_stream(job):
+    """
+    SSE进度流
+    事件类型：progress（首次为完整进度，之后只含变化的字段）、rows（合并的行完成事件）、state（任务状态变化）
+    """
+    return Response(
+        job.broadcaster.stream(functools.partial(progress_payload, job)),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
 
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Prometheus文本格式的指标：进程级（aigc_*）与各任务最近一次运行（aigc_job_*，job 标签为任务ID）"""
+    client = api_config.get_client()
+    token_counters = []
+    if client:
+        usage = client.get_usage_stats()
+        token_counters = [
+            ("tokens_total", {"type": "prompt"}, usage["prompt_tokens"]),
+            ("tokens_total", {"type": "completion"}, usage["completion_tokens"]),
+            ("stream_early_stops_total", {}, usage.get("early_stops", 0))
+        ]
+    families = [metrics.families(token_counters)]
+
+    budget_stats = budget.get_stats()
+    families.append(gauge_families(metrics.prefix, {
+        "concurrency_budget": ("全局并发预算", [({}, budget_stats["limit"])]),
+        "concurrency_in_use": ("已分配的并发名额", [({}, budget_stats["in_use"])]),
+        "concurrency_waiting": ("等待并发名额的请求数", [({}, budget_stats["waiting"])])
+    }))
+
+    endpoint_stats = api_config.get_endpoint_stats()
+    if endpoint_stats:
+        labeled = [({"endpoint": e["name"]}, e) for e in endpoint_stats]
+        families.append(gauge_families(metrics.prefix, {
+            "endpoint_in_flight": ("端点在途请求数", [(labels, e["in_flight"]) for labels, e in labeled]),
+            "endpoint_requests": ("端点累计请求数", [(labels, e["requests"]) for labels, e in labeled]),
+            "endpoint_errors": ("端点累计错误数", [(labels, e["errors"]) for labels, e in labeled]),
+            "endpoint_latency_seconds": ("端点请求耗时（EWMA）",
+                                         [(labels, e["latency"]) for labels, e in labeled]),
+            "endpoint_healthy": ("端点是否可用（未处于出错暂停期）",
+                                 [(labels, int(e["healthy"])) for labels, e in labeled])
+        }))
+
+    gauges = {
+        "rows": ("任务总行数", []),
+        "rows_completed": ("已完成行数", []),
+        "throughput_rows_per_second": ("最近吞吐量（行/秒）", []),
+        "generating": ("是否正在生成", [])
+    }
+    job_prefix = None
+    for job in jobs.list():
+        job_metrics = job.generator.job_metrics
+        if job_metrics is None:
+            continue
+        job_prefix = job_metrics.prefix
+        progress = job.generator.get_progress()
+        families.append(job_metrics.families())
+        gauges["rows"][1].append((job_metrics.labels, progress["total"]))
+        gauges["rows_completed"][1].append((job_metrics.labels, progress["current"]))
+        gauges["throughput_rows_per_second"][1].append((job_metrics.labels, progress["throughput"]))
+        gauges["generating"][1].append((job_metrics.labels, int(progress["is_generating"])))
+    if job_prefix is not None:
+        families.append(gauge_families(job_prefix, gauges))
+
+    return Response(render_families(*families), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/api/cache', methods=['GET'])
+def get_cache_stats():
+    """获取响应缓存统计"""
     return jsonify({
         'success': True,
-        'data': {
-            **progress,
-            'status': state.generation_status,
-            'message': state.status_message
-        }
+        'data': response_cache.get_stats()
+    })
+
+
+@app.route('/api/cache/clear', methods=['POST'])
+def clear_cache():
+    """清空响应缓存"""
+    response_cache.clear()
+    return jsonify({
+        'success': True,
+        'message': '缓存已清空'
     })
 
 
 @app.route('/api/checkpoint/list', methods=['GET'])
-def list_checkpoints():
+@with_job
+def list_checkpoints(job):
     """列出可用的断点文件"""
-    checkpoint = state.generator.get_latest_checkpoint()
+    checkpoint = job.generator.get_latest_checkpoint()
 
     if checkpoint:
         return jsonify({
@@ -292,89 +640,134 @@ def list_checkpoints():
 
 
 @app.route('/api/checkpoint/load', methods=['POST'])
-def load_checkpoint():
+@with_job
+def load_checkpoint(job):
     """加载断点"""
     data = request.json
     checkpoint_path = data.get('checkpoint_path')
 
     if not checkpoint_path:
         # 自动查找最新断点
-        checkpoint_path = state.generator.get_latest_checkpoint()
+        checkpoint_path = job.generator.get_latest_checkpoint()
 
     if not checkpoint_path:
         return jsonify({'success': False, 'message': '没有找到断点文件'})
 
-    success, message = state.generator.load_checkpoint(checkpoint_path)
+    success, message = job.generator.load_checkpoint(checkpoint_path)
 
     if success:
         # 恢复状态
-        last_checkpoint = state.generator._last_checkpoint
-        if last_checkpoint:
-            with open(last_checkpoint, 'r', encoding='utf-8') as f:
-                checkpoint_data = json.load(f)
-                state.prompt_template = checkpoint_data.get('prompt_template', '')
-                state.variable_mapping = checkpoint_data.get('variable_mapping', {})
+        job.prompt_template = job.generator.checkpoint_template
+        job.variable_mapping = job.generator.checkpoint_variables
 
-        state.generation_status = "checkpoint_loaded"
+        job.generation_status = "checkpoint_loaded"
 
     return jsonify({
         'success': success,
         'message': message,
         'data': {
-            'progress': state.generator.get_progress() if success else None
+            'progress': job.generator.get_progress() if success else None,
+            'prompt_template': job.prompt_template if success else None,
+            'variable_mapping': job.variable_mapping if success else None
         }
     })
 
 
 @app.route('/api/export', methods=['POST'])
-def export_result():
+@with_job
+def export_result(job):
     """导出结果"""
-    if not state.generator.results:
+    if not job.generator.results:
         return jsonify({'success': False, 'message': '没有可导出的结果'})
 
     data = request.json
-    filename = data.get('filename', '话题keygen_result.xlsx')
+    export_format = data.get('format')  # xlsx/csv/jsonl/parquet，为空时按文件扩展名判断
+    filename = data.get('filename') or f"话题keygen_result.{export_format or 'xlsx'}"
+    job.generator.export_phases = bool(data.get('include_phases'))  # 是否附加各阶段耗时列
+
+    try:
+        export_format = detect_format(filename, export_format)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)})
+    if not filename.lower().endswith('.' + export_format):
+        filename = f"{os.path.splitext(filename)[0]}.{export_format}"
 
-    output_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+    output_path = os.path.join(job.work_dir, os.path.basename(filename))
 
-    success, message = state.generator.export_result(output_path, state.input_file)
+    success, message = export_results(job.generator, output_path, export_format, job.input_file)
 
     if success:
-        state.output_file = output_path
+        job.output_file = output_path
 
     return jsonify({
         'success': success,
         'message': message,
         'data': {
-            'filename': filename
+            'filename': filename,
+            'format': export_format
         } if success else None
     })
 
 
 @app.route('/api/download', methods=['GET'])
-def download_result():
+@with_job
+def download_result(job):
     """下载结果文件"""
-    if not state.output_file or not os.path.exists(state.output_file):
+    if not job.output_file or not os.path.exists(job.output_file):
         return jsonify({'success': False, 'message': '结果文件不存在'})
 
     return send_file(
-        state.output_file,
+        job.output_file,
         as_attachment=True,
-        download_name=os.path.basename(state.output_file),
-        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        download_name=os.path.basename(job.output_file)
     )
 
 
 @app.route('/api/reset', methods=['POST'])
-def reset_state():
-    """重置状态"""
-    state.reset()
+@with_job
+def reset_state(job):
+    """重置任务状态"""
+    if job.is_running:
+        return jsonify({'success': False, 'message': '该任务正在生成，请先取消'})
+    job.reset()
     return jsonify({
         'success': True,
         'message': '状态已重置'
     })
 
 
+@app.route('/api/jobs', methods=['GET'])
+def list_jobs():
+    """列出全部任务及全局并发预算的分配情况"""
+    return jsonify({
+        'success': True,
+        'data': {
+            'jobs': [job.to_dict() for job in jobs.list()],
+            'budget': budget.get_stats()
+        }
+    })
+
+
+@app.route('/api/jobs/priority', methods=['POST'])
+@with_job
+def set_job_priority(job):
+    """调整任务优先级（运行中立即生效）"""
+    try:
+        jobs.set_priority(job, (request.json or {}).get('priority', 'normal'))
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)})
+    return jsonify({'success': True, 'message': f'优先级已设置为 {job.priority}'})
+
+
+@app.route('/api/jobs/delete', methods=['POST'])
+@with_job
+def delete_job(job):
+    """删除任务（正在生成的任务需先取消；工作目录中的文件保留）"""
+    if not jobs.remove(job.job_id):
+        return jsonify({'success': False, 'message': '该任务正在生成，请先取消'})
+    return jsonify({'success': True, 'message': '任务已删除'})
+
+
 if __name__ == '__main__':
     import sys
     port = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
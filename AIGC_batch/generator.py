@@ -6,13 +6,32 @@ Key生成核心逻辑模块
 import openpyxl
 import json
 import os
+import logging
+import re
 import glob
 import time
+import hashlib
+import random
+import queue
+import atexit
+import asyncio
+import contextlib
+import itertools
+import threading
+import multiprocessing
 import concurrent.futures
-from typing import List, Dict, Any, Optional, Tuple
-from dataclasses import dataclass, asdict
+from typing import List, Dict, Any, Optional, Tuple, Iterator, ClassVar
+from dataclasses import dataclass, asdict, replace
 from datetime import datetime
 
+# 既作为包内模块（AIGC_batch.generator）导入，也由 app.py 按顶层模块导入
+try:
+    from .api_clients import APIRequestError, _add_phase
+except ImportError:
+    from api_clients import APIRequestError, _add_phase
+
+logger = logging.getLogger(__name__)
+
 
 @dataclass
 class GenerationResult:
@@ -25,12 +44,22 @@ class GenerationResult:
     timestamp: float = 0
     generation_time: float = 0  # 生成耗时（秒）
     parsed_result: Dict[str, Any] = None  # 解析后的JSON结果
+    error_type: Optional[str] = None  # 错误类别（rate_limit/timeout/server_error等）
+    attempts: int = 1  # 请求尝试次数（含重试与补跑）
+    cached: bool = False  # 是否命中响应缓存
+    deduplicated: bool = False  # 是否复用了同一运行内相同Prompt的结果
+    # 各阶段耗时（秒）：queue/render/connect/ttfb/ttft/receive/parse/retry_wait，重试时网络阶段累加
+    phases: Dict[str, float] = None
+    # 结果已并入哪一份JSON列集合（生成器重置列集合时更换标记），不参与比较与序列化
+    _columns_token: ClassVar[Optional[object]] = None
 
     def __post_init__(self):
         if self.timestamp == 0:
             self.timestamp = time.time()
         if self.parsed_result is None:
             self.parsed_result = {}
+        if self.phases is None:
+            self.phases = {}
 
 
 @dataclass
@@ -66,19 +95,872 @@ class CheckpointData:
             "error": result.error,
             "timestamp": result.timestamp,
             "generation_time": result.generation_time,
-            "parsed_result": result.parsed_result
+            "parsed_result": result.parsed_result,
+            "error_type": result.error_type,
+            "attempts": result.attempts,
+            "cached": result.cached,
+            "deduplicated": result.deduplicated
         }
 
 
+@dataclass
+class RetryPolicy:
+    """重试策略：指数退避加随机抖动，优先遵循服务端 Retry-After"""
+    max_attempts: int = 3  # 单次调度内的最大尝试次数
+    base_delay: float = 1.0  # 首次重试的基础等待（秒）
+    max_delay: float = 30.0  # 指数退避的等待上限（秒）
+    max_retry_after: float = 120.0  # 服务端 Retry-After 的最大遵循时长（秒）
+    requeue_passes: int = 1  # 主流程结束后对仍失败行的补跑轮数
+    requeue_concurrency_ratio: float = 0.5  # 补跑时的并发比例
+
+    # 可重试的错误类别（与 APIRequestError 一致），其余错误（如参数错误、鉴权失败）直接判定失败
+    RETRYABLE_ERRORS = APIRequestError.RETRYABLE
+
+    def is_retryable(self, error_type: Optional[str]) -> bool:
+        return error_type in self.RETRYABLE_ERRORS
+
+    def next_delay(self, attempt: int, error: Exception) -> Optional[float]:
+        """
+        计算下次重试前的等待时间
+        :param attempt: 已尝试次数
+        :param error: 本次请求的异常
+        :return: 等待秒数，不再重试时为空
+        """
+        if attempt >= self.max_attempts or not self.is_retryable(getattr(error, 'error_type', None)):
+            return None
+
+        retry_after = getattr(error, 'retry_after', None)
+        if retry_after is not None:
+            return min(retry_after, self.max_retry_after)
+
+        # 等幅抖动：一半固定退避，一半随机，避免并发请求同时重试
+        backoff = min(self.max_delay, self.base_delay * (2 ** (attempt - 1)))
+        return backoff / 2 + random.uniform(0, backoff / 2)
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    AIMD自适应并发限制器
+    延迟与错误率正常时逐步加性提升并发上限，遇到限流、超时、服务端错误或延迟突增时乘性回退
+    """
+
+    # 视为过载信号的错误类别
+    OVERLOAD_ERRORS = ("rate_limit", "timeout", "server_error")
+
+    def __init__(self, initial_limit: int = 5, min_limit: int = 1, max_limit: int = 64,
+                 backoff_ratio: float = 0.5, latency_tolerance: float = 2.0):
+        """
+        :param initial_limit: 初始并发上限
+        :param min_limit: 并发下限
+        :param max_limit: 并发上限
+        :param backoff_ratio: 过载时的乘性回退系数
+        :param latency_tolerance: 延迟超过基线的倍数时视为延迟突增
+        """
+        self.min_limit = max(min_limit, 1)
+        self.max_limit = max(max_limit, self.min_limit)
+        self.backoff_ratio = backoff_ratio
+        self.latency_tolerance = latency_tolerance
+        self._limit = min(max(initial_limit, self.min_limit), self.max_limit)
+        self._in_flight = 0
+        self._healthy_streak = 0
+        self._saturated = False  # 本窗口内在途请求是否达到过上限
+        self._baseline_latency = 0.0  # 成功请求延迟的慢速EWMA
+        self._latency_samples = 0
+        self._last_backoff = 0.0
+        self._increases = 0
+        self._backoffs = 0
+        self._condition = threading.Condition()
+
+    @property
+    def limit(self) -> int:
+        return self._limit
+
+    def acquire(self) -> float:
+        """
+        等待并占用一个并发名额
+        :return: 请求开始时间，需传回 release
+        """
+        with self._condition:
+            while self._in_flight >= self._limit:
+                self._condition.wait()
+            self._in_flight += 1
+            if self._in_flight >= self._limit:
+                self._saturated = True
+        return time.time()
+
+    def release(self, start_time: float, latency: float, error_type: Optional[str] = None):
+        """
+        释放名额并根据请求结果调整并发上限
+        :param start_time: acquire 返回的开始时间
+        :param latency: 请求耗时
+        :param error_type: 错误类别，成功时为空
+        """
+        with self._condition:
+            self._in_flight -= 1
+
+            if error_type in self.OVERLOAD_ERRORS or self._is_latency_spike(latency, error_type):
+                # 回退前已发出的请求不再重复触发回退
+                if start_time >= self._last_backoff:
+                    self._limit = max(self.min_limit, int(self._limit * self.backoff_ratio))
+                    self._last_backoff = time.time()
+                    self._backoffs += 1
+                self._healthy_streak = 0
+            elif error_type is None:
+                self._healthy_streak += 1
+                # 窗口内并发跑满过且连续健康时才加性增加
+                if self._saturated and self._healthy_streak >= self._limit and self._limit < self.max_limit:
+                    self._limit += 1
+                    self._healthy_streak = 0
+                    self._saturated = False
+                    self._increases += 1
+
+            self._condition.notify_all()
+
+    def _is_latency_spike(self, latency: float, error_type: Optional[str]) -> bool:
+        """判断是否延迟突增，同时用成功请求的延迟更新基线"""
+        if error_type is not None:
+            return False
+        spike = self._latency_samples >= 10 and latency > self._baseline_latency * self.latency_tolerance
+        if self._latency_samples == 0:
+            self._baseline_latency = latency
+        else:
+            self._baseline_latency += 0.05 * (latency - self._baseline_latency)
+        self._latency_samples += 1
+        return spike
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取并发控制状态"""
+        with self._condition:
+            return {
+                "limit": self._limit,
+                "in_flight": self._in_flight,
+                "min_limit": self.min_limit,
+                "max_limit": self.max_limit,
+                "baseline_latency": round(self._baseline_latency, 3),
+                "increases": self._increases,
+                "backoffs": self._backoffs
+            }
+
+
+class PromptTemplate:
+    """
+    预编译的Prompt模板
+    编译时把模板拆成字面量与变量片段，渲染时一次 format 拼接，变量值中的占位符不会被再次替换
+    """
+
+    # {{变量名}} 语法的占位符（编译时校验必须有映射）
+    DOUBLE_BRACE_PATTERN = re.compile(r"\{\{([^{}]+)\}\}")
+
+    def __init__(self, template: str, variables: Dict[str, str], headers: Optional[List[str]] = None):
+        """
+        :param template: Prompt模板，支持 {{变量名}} 与 {变量名} 两种语法
+        :param variables: 变量映射 {模板变量: 列名}
+        :param headers: 输入表头，提供时校验映射的列都存在
+        :raises ValueError: 占位符没有映射或映射的列不存在
+        """
+        self.template = template
+        self.variables = dict(variables)
+        self.names: List[str] = []  # 模板中出现的变量名（按首次出现顺序，不重复）
+
+        unmapped = sorted({name for name in self.DOUBLE_BRACE_PATTERN.findall(template)
+                           if name not in self.variables})
+        if unmapped:
+            raise ValueError(f"模板变量未配置映射: {', '.join(unmapped)}")
+        if headers:
+            missing = sorted({column for column in self.variables.values() if column not in headers})
+            if missing:
+                raise ValueError(f"映射的列不存在: {', '.join(missing)}")
+
+        # 按变量名长度倒序匹配，{{变量名}} 优先于 {变量名}
+        names = sorted(self.variables, key=len, reverse=True)
+        self.columns: List[str] = []
+        pieces = []
+        position = 0
+        if names:
+            alternatives = "|".join(re.escape(name) for name in names)
+            pattern = re.compile(r"\{\{(%s)\}\}|\{(%s)\}" % (alternatives, alternatives))
+            for match in pattern.finditer(template):
+                pieces.append(self._escape(template[position:match.start()]))
+                name = match.group(1) or match.group(2)
+                pieces.append("{%d}" % len(self.columns))
+                self.columns.append(self.variables[name])
+                if name not in self.names:
+                    self.names.append(name)
+                position = match.end()
+        pieces.append(self._escape(template[position:]))
+        self._format = "".join(pieces)
+
+    @staticmethod
+    def _escape(literal: str) -> str:
+        """转义字面量中的花括号，避免被 format 解析"""
+        return literal.replace("{", "{{").replace("}", "}}")
+
+    def render(self, row_data: Dict[str, str]) -> str:
+        """渲染一行数据"""
+        values = []
+        for column in self.columns:
+            value = row_data.get(column, "")
+            values.append("" if value is None else value)
+        return self._format.format(*values)
+
+
+class PromptPacker:
+    """
+    多行打包：K 行共用一次请求，模板（说明部分）只发送一次，各行只附带变量取值，
+    要求模型返回按编号对应的JSON数组，再拆回每行的结果
+    """
+
+    INSTRUCTION = (
+        "\n\n---\n"
+        "以下共有 {count} 组输入，每组以JSON给出上面模板中各变量的取值（index 为组编号）。"
+        "请对每一组分别、独立地按上面的要求生成结果。\n"
+        "只返回一个JSON数组，每组对应一个元素：{{\"index\": 组编号, \"result\": 该组按要求生成的JSON结果}}，"
+        "必须包含全部 {count} 组，不要输出数组以外的任何内容。\n\n"
+    )
+
+    def __init__(self, template: PromptTemplate):
+        """
+        :param template: 预编译的模板（提供模板原文与变量到列的映射）
+        """
+        self.template = template
+
+    def build(self, rows: List[Dict[str, str]]) -> str:
+        """
+        构建打包后的Prompt
+        :param rows: 各组的行数据，组编号从1开始
+        """
+        lines = []
+        for number, row_data in enumerate(rows, 1):
+            values = {"index": number}
+            for name in self.template.names:
+                value = row_data.get(self.template.variables[name], "")
+                values[name] = "" if value is None else str(value)
+            lines.append(json.dumps(values, ensure_ascii=False))
+        return self.template.template + self.INSTRUCTION.format(count=len(rows)) + "\n".join(lines)
+
+    @staticmethod
+    def split(response: str, count: int) -> Dict[int, str]:
+        """
+        拆分打包请求的响应
+        :param response: 模型返回的内容
+        :param count: 组数
+        :return: {组下标(从0开始): 该组的结果文本}；格式错误、编号越界或重复、结果为空的组不在其中
+        """
+        start, end = response.find('['), response.rfind(']')
+        if start == -1 or end <= start:
+            return {}
+        try:
+            items = json.loads(response[start:end + 1])
+        except json.JSONDecodeError:
+            return {}
+        if not isinstance(items, list):
+            return {}
+
+        outputs: Dict[int, str] = {}
+        duplicated = set()
+        for item in items:
+            if not isinstance(item, dict):
+                continue
+            number, result = item.get("index"), item.get("result")
+            if isinstance(number, bool) or not isinstance(number, int) or not 1 <= number <= count:
+                continue
+            if result is None or result in ("", {}, []):
+                continue
+            if number - 1 in outputs:
+                duplicated.add(number - 1)
+                continue
+            outputs[number - 1] = result if isinstance(result, str) else json.dumps(result, ensure_ascii=False)
+        # 同一编号出现多次时无法判断哪个正确，该组退回逐行请求
+        for index in duplicated:
+            outputs.pop(index, None)
+        return outputs
+
+
+class PromptDeduplicator:
+    """
+    单次运行内按渲染后的Prompt去重（single-flight）
+    相同Prompt只发起一次请求，结果分发给所有重复行；只在调度线程中使用
+    """
+
+    def __init__(self):
+        self._leaders: Dict[bytes, int] = {}  # Prompt哈希 -> 发起请求的首行索引
+        self._followers: Dict[int, List[Tuple[int, Dict[str, str]]]] = {}  # 请求中的首行 -> 等待结果的重复行
+
+    def register(self, prompt: str, row_index: int, row_data: Dict[str, str]) -> Optional[int]:
+        """
+        登记一行
+        :return: 需要发起请求时为空；重复行返回首行索引（首行仍在请求中时该行已加入等待列表）
+        """
+        key = hashlib.sha1(prompt.encode('utf-8')).digest()
+        leader = self._leaders.setdefault(key, row_index)
+        if leader == row_index:
+            self._followers[row_index] = []
+            return None
+        if leader in self._followers:
+            self._followers[leader].append((row_index, row_data))
+        return leader
+
+    def is_pending(self, leader: int) -> bool:
+        """首行是否仍在请求中"""
+        return leader in self._followers
+
+    def complete(self, leader: int) -> List[Tuple[int, Dict[str, str]]]:
+        """首行完成，取出等待结果的重复行"""
+        return self._followers.pop(leader, [])
+
+
+class ProgressTracker:
+    """
+    进度的增量统计
+    结果到达时更新完成数、成功/失败数、耗时与重试次数，并按时间窗口计算吞吐量的EWMA；
+    读取统计为常数时间，与结果总数无关
+    """
+
+    def __init__(self, ewma_alpha: float = 0.3, tick_interval: float = 1.0):
+        """
+        :param ewma_alpha: 吞吐量EWMA的平滑系数
+        :param tick_interval: 吞吐量采样窗口（秒）
+        """
+        self.ewma_alpha = ewma_alpha
+        self.tick_interval = tick_interval
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self, results: Optional[List[Optional[GenerationResult]]] = None):
+        """
+        重新开始统计
+        :param results: 已有结果（断点恢复），计入完成数但不计入本次运行的吞吐量
+        """
+        with self._lock:
+            self.success = 0
+            self.error = 0
+            self.total_generation_time = 0.0
+            self.retries = 0
+            self.phase_totals: Dict[str, float] = {}  # 各阶段耗时合计
+            self.phase_rows = 0  # 带阶段耗时的结果数
+            self.run_completed = 0  # 本次运行新完成的行数
+            self.start_time = time.time()
+            self.end_time: Optional[float] = None
+            self._throughput = None
+            self._tick_time = self.start_time
+            self._tick_count = 0
+            for result in results or []:
+                if result is not None:
+                    self._apply(result, 1)
+
+    def _apply(self, result: GenerationResult, sign: int):
+        if result.success:
+            self.success += sign
+            self.total_generation_time += sign * result.generation_time
+        else:
+            self.error += sign
+        self.retries += sign * max(result.attempts - 1, 0)
+        if result.phases:
+            self.phase_rows += sign
+            for name, seconds in result.phases.items():
+                self.phase_totals[name] = self.phase_totals.get(name, 0.0) + sign * seconds
+
+    def record(self, result: Optional[GenerationResult], previous: Optional[GenerationResult] = None):
+        """
+        记录一个完成的任务
+        :param result: 生成结果，为空表示任务本身异常（计为失败）
+        :param previous: 被覆盖的旧结果（补跑时）
+        """
+        now = time.time()
+        with self._lock:
+            if previous is not None:
+                self._apply(previous, -1)
+            else:
+                self.run_completed += 1
+            if result is None:
+                self.error += 1
+            else:
+                self._apply(result, 1)
+
+            self._tick_count += 1
+            elapsed = now - self._tick_time
+            if elapsed >= self.tick_interval:
+                self._throughput = self._smooth(self._tick_count / elapsed)
+                self._tick_time = now
+                self._tick_count = 0
+
+    def _smooth(self, rate: float) -> float:
+        if self._throughput is None:
+            return rate
+        return self.ewma_alpha * rate + (1 - self.ewma_alpha) * self._throughput
+
+    def finish(self):
+        """运行结束，固定本次运行的平均吞吐量"""
+        with self._lock:
+            self.end_time = time.time()
+
+    @property
+    def completed(self) -> int:
+        return self.success + self.error
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取统计（常数时间）"""
+        now = time.time()
+        with self._lock:
+            throughput = self._throughput
+            elapsed = now - self._tick_time
+            if elapsed >= self.tick_interval:
+                # 当前窗口已结束但还没有新结果触发更新，按窗口内的完成数预估（无完成时逐步衰减）
+                throughput = self._smooth(self._tick_count / elapsed)
+            run_time = (self.end_time or now) - self.start_time
+            return {
+                "completed": self.success + self.error,
+                "success": self.success,
+                "error": self.error,
+                "total_generation_time": self.total_generation_time,
+                "avg_generation_time": self.total_generation_time / self.success if self.success else 0,
+                "retries": self.retries,
+                # 每行各阶段的平均耗时
+                "phases": {name: total / self.phase_rows for name, total in self.phase_totals.items()}
+                if self.phase_rows > 0 else {},
+                "throughput": throughput or 0.0,
+                "rows_per_second": self.run_completed / run_time if run_time > 0 else 0.0
+            }
+
+
+class CheckpointJournal:
+    """
+    追加写断点日志
+    每个完成的结果只向 .checkpoint_<run_id>.jsonl 追加一行，按批次fsync；
+    日志行数增长到与快照相当时压缩为 .checkpoint_<run_id>.json 快照并清空日志，
+    均摊下来每行的断点开销与表格大小无关
+    """
+
+    def __init__(self, directory: str, meta: Dict[str, Any], fsync_interval: int = 20,
+                 compact_min_rows: int = 1000):
+        """
+        :param directory: 断点目录
+        :param meta: 运行信息（total_rows/start_index/input_file/prompt_template/variable_mapping）
+        :param fsync_interval: 每追加多少行执行一次fsync
+        :param compact_min_rows: 日志至少累计多少行才压缩为快照
+        """
+        self.meta = meta
+        self.fsync_interval = max(1, fsync_interval)
+        self.compact_min_rows = compact_min_rows
+        run_id = time.time_ns()
+        self.snapshot_path = os.path.join(directory, f".checkpoint_{run_id}.json")
+        self.journal_path = self.snapshot_path + "l"
+        self.snapshot_rows = 0  # 最近一次快照包含的行数
+        self.journal_rows = 0  # 快照之后追加的行数
+        self._unsynced = 0
+        self._file = open(self.journal_path, 'w', encoding='utf-8')
+        self._write_meta()
+
+    def _write_meta(self):
+        self._file.write(json.dumps({"meta": self.meta}, ensure_ascii=False) + "\n")
+        self._unsynced += 1
+        self.sync()
+
+    def sync(self):
+        """刷新缓冲区，有未落盘的行时执行fsync"""
+        self._file.flush()
+        if self._unsynced:
+            os.fsync(self._file.fileno())
+            self._unsynced = 0
+
+    def append(self, result: GenerationResult):
+        """追加一条结果（同一行再次追加时，回放以最后一条为准）"""
+        record = CheckpointData.from_generation_result(result)
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.journal_rows += 1
+        self._unsynced += 1
+        if self._unsynced >= self.fsync_interval:
+            self.sync()
+
+    def should_compact(self) -> bool:
+        """日志行数不少于快照行数时压缩，快照大小按倍数增长，重写总量保持线性"""
+        return self.journal_rows >= max(self.compact_min_rows, self.snapshot_rows)
+
+    def compact(self, results: List[Optional[GenerationResult]], current_index: Optional[int] = None):
+        """
+        将全部结果写为快照（先写临时文件再原子替换），然后清空日志
+        :param results: 当前全部结果
+        :param current_index: 断点进度，默认为起始索引加已完成行数
+        """
+        records = [CheckpointData.from_generation_result(r) for r in results if r]
+        if current_index is None:
+            current_index = self.meta.get("start_index", 0) + len(records)
+
+        checkpoint = CheckpointData(
+            timestamp=time.time(),
+            total_rows=self.meta.get("total_rows", 0),
+            current_index=current_index,
+            results=records,
+            input_file=self.meta.get("input_file", ""),
+            prompt_template=self.meta.get("prompt_template", ""),
+            variable_mapping=self.meta.get("variable_mapping", {})
+        )
+
+        temp_path = self.snapshot_path + ".tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(checkpoint.to_dict(), f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.snapshot_path)
+
+        # 快照已落盘，日志中的内容都已包含在快照里
+        self._file.seek(0)
+        self._file.truncate()
+        self._write_meta()
+        self.snapshot_rows = len(records)
+        self.journal_rows = 0
+
+    def close(self):
+        """刷盘并关闭日志；日志已全部压缩进快照时删除日志文件"""
+        if self._file.closed:
+            return
+        self.sync()
+        self._file.close()
+        if self.journal_rows == 0 and os.path.exists(self.snapshot_path):
+            os.remove(self.journal_path)
+
+    @staticmethod
+    def checkpoint_paths(path: str) -> Tuple[str, str]:
+        """由快照或日志路径得到 (快照路径, 日志路径)"""
+        snapshot_path = path[:-1] if path.endswith(".jsonl") else path
+        return snapshot_path, snapshot_path + "l"
+
+    @classmethod
+    def replay(cls, path: str) -> CheckpointData:
+        """
+        读取断点：加载快照，再按顺序回放日志，同一行以最后一条记录为准
+        :param path: 快照或日志路径
+        :return: 合并后的断点数据
+        """
+        snapshot_path, journal_path = cls.checkpoint_paths(path)
+        checkpoint = None
+        results: Dict[int, Dict[str, Any]] = {}
+
+        if os.path.exists(snapshot_path):
+            with open(snapshot_path, 'r', encoding='utf-8') as f:
+                checkpoint = CheckpointData.from_dict(json.load(f))
+            results = {r["row_index"]: r for r in checkpoint.results}
+
+        start_index = None
+        if os.path.exists(journal_path):
+            with open(journal_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # 进程崩溃时最后一行可能只写了一半
+                        break
+                    if "meta" in record:
+                        meta = record["meta"]
+                        start_index = meta.get("start_index", 0)
+                        if checkpoint is None:
+                            checkpoint = CheckpointData(
+                                timestamp=time.time(),
+                                total_rows=meta.get("total_rows", 0),
+                                current_index=start_index,
+                                results=[],
+                                input_file=meta.get("input_file", ""),
+                                prompt_template=meta.get("prompt_template", ""),
+                                variable_mapping=meta.get("variable_mapping", {})
+                            )
+                    else:
+                        results[record["row_index"]] = record
+
+        if checkpoint is None:
+            raise FileNotFoundError(f"断点文件不存在: {path}")
+
+        checkpoint.results = [results[i] for i in sorted(results)]
+        if start_index is not None:
+            checkpoint.current_index = start_index + len(checkpoint.results)
+        return checkpoint
+
+
+class CheckpointWriter:
+    """
+    后台断点写入线程
+    结果收集循环只把结果放入有界队列，写入线程合并同一行的重复结果，
+    累计到 flush_rows 行或距上次刷盘超过 flush_interval 秒时批量写入日志
+    """
+
+    def __init__(self, journal: CheckpointJournal, flush_rows: int = 20, flush_interval: float = 1.0,
+                 max_queue: int = 10000, initial_results: Optional[List[GenerationResult]] = None,
+                 metrics=None):
+        """
+        :param journal: 断点日志
+        :param flush_rows: 累计多少行刷盘一次
+        :param flush_interval: 最长刷盘间隔（秒）
+        :param max_queue: 队列上限，写入跟不上时阻塞结果收集
+        :param initial_results: 已持久化的结果（断点续传时恢复的结果），创建时立即写入本次运行的快照
+        :param metrics: 指标注册表，记录每次刷盘与压缩的耗时
+        """
+        self.journal = journal
+        self.metrics = metrics
+        self.flush_rows = max(1, flush_rows)
+        self.flush_interval = flush_interval
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        # 已写入日志的全部结果，压缩快照时使用，不与结果收集线程共享
+        self._records: Dict[int, GenerationResult] = {
+            r.row_index: r for r in (initial_results or []) if r is not None
+        }
+        self._submitted = 0
+        self._persisted = 0
+        self._flushes = 0
+        self._last_flush = time.time()
+        self._closed = False
+        self.error: Optional[Exception] = None
+        if self._records:
+            # 恢复的结果先写成快照再接收新结果，否则进程在首次压缩前退出时最新断点只含本次新增的行
+            self._compact()
+        self._thread = threading.Thread(target=self._run, name="checkpoint-writer", daemon=True)
+        self._thread.start()
+        # 进程退出时也保证最后一次刷盘
+        atexit.register(self.close)
+
+    def submit(self, result: GenerationResult):
+        """提交一个完成的结果，队列已满时等待写入线程消费"""
+        self._put(("result", result))
+        self._submitted += 1
+
+    def snapshot(self, current_index: Optional[int] = None):
+        """立即刷盘并压缩出快照，等待完成后返回"""
+        done = threading.Event()
+        self._put(("snapshot", (current_index, done)))
+        while not done.wait(0.1):
+            self._raise_if_failed()
+        self._raise_if_failed()
+
+    def close(self, current_index: Optional[int] = None):
+        """最终刷盘：写完队列中的结果、压缩出最终快照并关闭日志"""
+        if self._closed:
+            return
+        self._closed = True
+        atexit.unregister(self.close)
+        if self._thread.is_alive():
+            self._queue.put(("close", current_index))
+            self._thread.join()
+        self._raise_if_failed()
+
+    def _put(self, item):
+        if self._closed:
+            raise RuntimeError("断点写入线程已关闭")
+        while True:
+            self._raise_if_failed()
+            try:
+                self._queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def _raise_if_failed(self):
+        if self.error is not None:
+            raise RuntimeError(f"断点写入失败: {self.error}")
+
+    def _run(self):
+        pending: Dict[int, GenerationResult] = {}
+        pending_count = 0
+        try:
+            while True:
+                timeout = None
+                if pending:
+                    timeout = max(0.0, self.flush_interval - (time.time() - self._last_flush))
+                try:
+                    kind, payload = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    kind, payload = None, None
+
+                if kind == "result":
+                    # 合并：补跑覆盖同一行时只写最后一条
+                    pending[payload.row_index] = payload
+                    pending_count += 1
+                    if (pending_count < self.flush_rows
+                            and time.time() - self._last_flush < self.flush_interval):
+                        continue
+
+                self._flush(pending, pending_count)
+                pending, pending_count = {}, 0
+
+                if kind == "snapshot":
+                    current_index, done = payload
+                    self._compact(current_index)
+                    done.set()
+                elif kind == "close":
+                    self._compact(payload)
+                    return
+        except Exception as e:
+            self.error = e
+        finally:
+            self.journal.close()
+
+    def _observe(self, seconds: float):
+        if self.metrics is not None:
+            self.metrics.observe("checkpoint_seconds", seconds)
+
+    def _compact(self, current_index: Optional[int] = None):
+        start_time = time.perf_counter()
+        self.journal.compact(list(self._records.values()), current_index)
+        self._observe(time.perf_counter() - start_time)
+
+    def _flush(self, pending: Dict[int, GenerationResult], count: int):
+        if pending:
+            start_time = time.perf_counter()
+            for result in pending.values():
+                self.journal.append(result)
+                self._records[result.row_index] = result
+            self.journal.sync()
+            if self.journal.should_compact():
+                self.journal.compact(list(self._records.values()))
+            self._flushes += 1
+            self._observe(time.perf_counter() - start_time)
+        self._persisted += count
+        self._last_flush = time.time()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取写入状态：lag_rows 为已完成但尚未落盘的行数"""
+        lag_rows = self._submitted - self._persisted
+        return {
+            "submitted": self._submitted,
+            "persisted": self._persisted,
+            "lag_rows": lag_rows,
+            "lag_seconds": round(time.time() - self._last_flush, 3) if lag_rows > 0 else 0,
+            "queued": self._queue.qsize(),
+            "flushes": self._flushes,
+            "snapshot_rows": self.journal.snapshot_rows,
+            "journal_rows": self.journal.journal_rows
+        }
+
+
+def _shard_ranges(total_rows: int, shards: int) -> List[Tuple[int, int]]:
+    """
+    把 [0, total_rows) 划分为至多 shards 个连续区间，各区间行数相差不超过1
+    连续区间使每个分片进程只读取文件中属于自己的行
+    """
+    shards = max(1, min(shards, total_rows))
+    size, extra = divmod(total_rows, shards)
+    ranges = []
+    start = 0
+    for shard in range(shards):
+        end = start + size + (1 if shard < extra else 0)
+        ranges.append((start, end))
+        start = end
+    return ranges
+
+
+def _run_shard(shard: int, start_index: int, end_index: Optional[int], config: Dict[str, Any],
+               result_queue, paused, cancelled):
+    """
+    分片工作进程：用独立的生成器与断点目录处理 [start_index, end_index) 的行（end_index 为空时读到文件末尾）
+    结果分批经 result_queue 发回协调进程（("rows", 分片, 结果列表)，结束时 ("done", 分片, 成功, 消息)）；
+    paused / cancelled 为进程间事件，对应协调进程的暂停与取消
+    """
+    batch: List[GenerationResult] = []
+    batch_lock = threading.Lock()
+    last_sent = [time.monotonic()]
+
+    def send(force: bool = False):
+        with batch_lock:
+            if not batch or (not force and len(batch) < config["batch_rows"]
+                             and time.monotonic() - last_sent[0] < config["batch_interval"]):
+                return
+            rows = batch[:]
+            batch.clear()
+            last_sent[0] = time.monotonic()
+        result_queue.put(("rows", shard, rows))
+
+    def on_result(result: GenerationResult):
+        with batch_lock:
+            batch.append(result)
+        send()
+
+    stop = threading.Event()
+    try:
+        cache = None
+        if config["cache_path"]:
+            cache = config["cache_factory"](config["cache_path"])
+        generator = config["generator_factory"](save_interval=config["save_interval"],
+                                                retry_policy=config["retry_policy"], cache=cache)
+        generator.checkpoint_dir = config["checkpoint_dir"]
+        os.makedirs(generator.checkpoint_dir, exist_ok=True)
+        # 流式读取：每个进程只解析文件中属于自己的行
+        success, message = generator.load_input(config["input_file"], config["sheet_name"], streaming=True)
+        if not success:
+            raise RuntimeError(message)
+
+        template, variables = config["template"], config["variables"]
+        if config["resume"]:
+            # 各分片从自己的断点独立续传，恢复的结果先发给协调进程
+            checkpoint = generator.get_latest_checkpoint()
+            if checkpoint is not None:
+                generator.load_checkpoint(checkpoint)
+                if generator.checkpoint_template == template and generator.checkpoint_variables == variables:
+                    restored = [r for r in generator.results
+                                if r.row_index >= start_index and (end_index is None or r.row_index < end_index)]
+                    if restored:
+                        result_queue.put(("rows", shard, restored))
+        generator.add_result_listener(on_result)
+
+        def follow_control():
+            # 把协调进程的暂停/取消同步到本进程的生成器
+            while not stop.wait(0.05):
+                if cancelled.is_set():
+                    generator.cancel_generation()
+                elif paused.is_set():
+                    generator.pause_generation()
+                else:
+                    generator.resume_generation()
+
+        threading.Thread(target=follow_control, daemon=True).start()
+        if cancelled.is_set():
+            success, message = False, "生成已取消"
+        else:
+            api_client = config["client_factory"]()
+            options = dict(start_index=start_index, end_index=end_index, use_cache=config["use_cache"],
+                           dedup=config["dedup"], resume=config["resume"])
+            if config["engine"] == "async":
+                success, message = generator.run_generation_async(
+                    api_client, template, variables, max_concurrency=config["max_concurrency"], **options)
+            else:
+                success, message = generator.start_generation(
+                    api_client, template, variables, max_workers=config["max_workers"],
+                    adaptive=config["adaptive"], max_limit=config["max_limit"], pack_size=config["pack_size"],
+                    **options)
+            if hasattr(api_client, 'close'):
+                api_client.close()
+        send(force=True)
+        result_queue.put(("done", shard, success, message))
+    except Exception as e:
+        send(force=True)
+        result_queue.put(("done", shard, False, f"分片进程异常: {e}"))
+    finally:
+        stop.set()
+
+
 class KeyGenerator:
     """Key生成器"""
 
-    def __init__(self, save_interval: int = 20):
+    # 流式模式下加载时保留的预览行数
+    STREAMING_PREVIEW_ROWS = 20
+
+    # 线程池引擎的提交窗口：最多排队 并发数 × 该系数 个任务，完成一个补充一个
+    SUBMIT_WINDOW_FACTOR = 2
+
+    def __init__(self, save_interval: int = 20, retry_policy: Optional[RetryPolicy] = None, cache=None,
+                 metrics=None, budget=None, job_id: Optional[str] = None):
         """
         初始化生成器
         :param save_interval: 自动保存间隔行数
+        :param retry_policy: 重试策略，默认最多尝试3次并补跑一轮
+        :param cache: 响应缓存（ResponseCache），为空时不使用缓存
+        :param metrics: 进程级指标注册表（MetricsRegistry），每次运行创建子注册表，为空时不统计
+        :param budget: 多任务共享的并发预算份额（BudgetShare），每个请求前获取名额，为空时不限制
+        :param job_id: 所属任务ID，作为任务级指标的 job 标签
         """
         self.save_interval = save_interval
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.cache = cache
+        self.metrics = metrics
+        self.budget = budget
+        self.job_id = job_id
+        self._job_metrics = None  # 最近一次运行的指标
         self.input_data: List[Dict[str, str]] = []
         self.headers: List[str] = []
         self.results: List[GenerationResult] = []
@@ -86,40 +968,138 @@ class KeyGenerator:
         self._current_file: Optional[str] = None
         self._is_generating: bool = False
         self._last_checkpoint: Optional[str] = None
-
-    def load_input(self, file_path: str, sheet_name: Optional[str] = None) -> Tuple[bool, str]:
+        self.checkpoint_dir: Optional[str] = None  # 断点目录，默认与输入文件同目录
+        self._checkpoint_writer: Optional[CheckpointWriter] = None
+        self._checkpoint_stats: Optional[Dict[str, Any]] = None
+        self.checkpoint_template: str = ""  # 最近加载的断点对应的模板与变量映射
+        self.checkpoint_variables: Dict[str, str] = {}
+        self._resume_results: Dict[int, GenerationResult] = {}  # 断点恢复的结果，按行索引
+        self._skip_rows: set = set()  # 本次运行跳过的已完成行
+        self._json_columns: set = set()  # 已出现过的JSON列（扁平化结果按需计算，不随行数缓存）
+        self._columns_token = object()  # 当前列集合的标记，见 _track_columns
+        # 结果收集、边生成边写出（ResultTailer）与导出在不同线程更新/读取JSON列集合
+        self._columns_lock = threading.Lock()
+        self._result_listeners: List[Any] = []  # 每记录一个结果时回调（边生成边写出结果）
+        self.export_phases: bool = False  # 导出时是否附加各阶段耗时列
+        self._run_event = threading.Event()  # 置位表示运行中，清除表示暂停提交新任务
+        self._run_event.set()
+        self._cancel_requested: bool = False
+        self._sheet_name: Optional[str] = None
+        self._streaming: bool = False
+        self._progress = ProgressTracker()
+        self._run_start_time: float = 0
+        self._run_requeued: int = 0
+        self._run_deduplicated: int = 0
+        self._run_cache_hits: int = 0
+        self._run_cache_misses: int = 0
+        self._run_packing: Optional[Dict[str, int]] = None  # 多行打包的统计，未打包时为空
+        self._stats_lock = threading.Lock()
+        self._limiter: Optional[AdaptiveConcurrencyLimiter] = None
+        self._compiled_template: Optional[PromptTemplate] = None
+        self._batch: Optional[Dict[str, Any]] = None  # 批处理模式下最近一次查询到的批处理状态
+
+    def load_input(self, file_path: str, sheet_name: Optional[str] = None,
+                   streaming: bool = False) -> Tuple[bool, str]:
         """
         加载输入文件
         :param file_path: xlsx文件路径
         :param sheet_name: 工作表名称，默认第一个
+        :param streaming: 流式模式，只读取表头和预览行，数据行在生成时按需逐行读取
         :return: (成功, 消息)
         """
         try:
             if not os.path.exists(file_path):
                 return False, f"文件不存在: {file_path}"
 
-            wb = openpyxl.load_workbook(file_path)
-            sheet = wb[sheet_name] if sheet_name else wb.active
-
-            # 读取表头
-            self.headers = [sheet.cell(1, col).value for col in range(1, sheet.max_column + 1)]
-
-            # 读取数据
-            self.input_data = []
-            for row_idx in range(2, sheet.max_row + 1):
-                row_data = {}
-                for col_idx, header in enumerate(self.headers, 1):
-                    row_data[header] = sheet.cell(row_idx, col_idx).value
-                self.input_data.append(row_data)
+            # 只读模式按行流式解析，不构建完整的单元格对象
+            wb = openpyxl.load_workbook(file_path, read_only=True)
+            try:
+                sheet = wb[sheet_name] if sheet_name else wb.active
+                rows = sheet.iter_rows(values_only=True)
+
+                # 读取表头
+                header_row = next(rows, None)
+                self.headers = list(header_row) if header_row else []
+
+                # 读取数据
+                self.input_data = []
+                if streaming:
+                    # 只保留预览行，其余数据在 iter_input_rows 中按需读取
+                    for values in itertools.islice(rows, self.STREAMING_PREVIEW_ROWS):
+                        self.input_data.append(self._row_to_dict(values))
+                    max_row = sheet.max_row
+                    self.total_rows = max_row - 1 if max_row else 0
+                else:
+                    for values in rows:
+                        self.input_data.append(self._row_to_dict(values))
+                    self.total_rows = len(self.input_data)
+            finally:
+                wb.close()
 
-            self.total_rows = len(self.input_data)
             self._current_file = file_path
+            self._sheet_name = sheet_name
+            self._streaming = streaming
 
+            if streaming:
+                return True, f"成功加载 {self.total_rows} 行数据（流式模式）"
             return True, f"成功加载 {self.total_rows} 行数据"
 
         except Exception as e:
             return False, f"加载文件失败: {e}"
 
+    def _row_to_dict(self, values: tuple) -> Dict[str, str]:
+        """将一行单元格值按表头转换为字典（只读模式下行尾空单元格会被省略）"""
+        row_data = {}
+        for col_idx, header in enumerate(self.headers):
+            row_data[header] = values[col_idx] if col_idx < len(values) else None
+        return row_data
+
+    def iter_input_rows(self, start_index: int = 0,
+                        end_index: Optional[int] = None) -> Iterator[Tuple[int, Dict[str, str]]]:
+        """
+        惰性遍历输入数据行
+        :param start_index: 起始索引
+        :param end_index: 结束索引（不含），为空时读到末尾
+        :return: (行索引, 行数据) 迭代器；流式模式下边读取文件边产出
+        """
+        if not self._streaming:
+            stop = len(self.input_data) if end_index is None else min(end_index, len(self.input_data))
+            for row_index in range(start_index, stop):
+                yield row_index, self.input_data[row_index]
+            return
+
+        wb = openpyxl.load_workbook(self._current_file, read_only=True)
+        try:
+            sheet = wb[self._sheet_name] if self._sheet_name else wb.active
+            row_index = start_index
+            # +2：跳过表头，且openpyxl行号从1开始
+            max_row = end_index + 1 if end_index is not None else None
+            for values in sheet.iter_rows(min_row=start_index + 2, max_row=max_row, values_only=True):
+                yield row_index, self._row_to_dict(values)
+                row_index += 1
+                # 文件未记录尺寸信息时，总行数随读取进度增长
+                if row_index > self.total_rows:
+                    self.total_rows = row_index
+        finally:
+            wb.close()
+
+    def count_input_rows(self) -> int:
+        """
+        实际数据行数：流式模式下完整读一遍文件计数，不依赖文件记录的尺寸信息（可能缺失或过期），
+        并据此更新 total_rows
+        """
+        if not self._streaming:
+            return len(self.input_data)
+        wb = openpyxl.load_workbook(self._current_file, read_only=True)
+        try:
+            sheet = wb[self._sheet_name] if self._sheet_name else wb.active
+            # 重新计算尺寸，不使用文件中记录的 <dimension>
+            sheet.reset_dimensions()
+            self.total_rows = sum(1 for _ in sheet.iter_rows(min_row=2, values_only=True))
+        finally:
+            wb.close()
+        return self.total_rows
+
     def get_data_preview(self, n: int = 5) -> List[Dict[str, str]]:
         """获取数据预览"""
         return self.input_data[:n]
@@ -132,22 +1112,25 @@ class KeyGenerator:
         :param row_data: 行数据
         :return: 渲染后的Prompt
         """
-        prompt = template
-        for var_name, column_name in variables.items():
-            # 支持 {{变量名}} 语法
-            placeholder1 = f"{{{{{var_name}}}}}"
-            # 也支持 {变量名} 语法
-            placeholder2 = f"{{{var_name}}}"
-
-            value = row_data.get(column_name, "")
-            if value is None:
-                value = ""
-
-            prompt = prompt.replace(placeholder1, str(value))
-            prompt = prompt.replace(placeholder2, str(value))
-
+        start_time = time.perf_counter()
+        prompt = self.compile_template(template, variables).render(row_data)
+        self._observe("render_seconds", time.perf_counter() - start_time)
         return prompt
 
+    def compile_template(self, template: str, variables: Dict[str, str]) -> PromptTemplate:
+        """
+        编译Prompt模板（同一模板与变量映射只编译一次）
+        :param template: Prompt模板
+        :param variables: 变量映射 {模板变量: 列名}
+        :return: 编译后的模板
+        :raises ValueError: 模板校验失败
+        """
+        compiled = self._compiled_template
+        if compiled is None or compiled.template != template or compiled.variables != variables:
+            compiled = PromptTemplate(template, variables, self.headers)
+            self._compiled_template = compiled
+        return compiled
+
     def _parse_json_result(self, result_str: str) -> Dict[str, Any]:
         """
         尝试解析JSON结果
@@ -170,70 +1153,657 @@ class KeyGenerator:
                 pass
             return {}
 
+    def _success_result(self, row_index: int, row_data: Dict[str, str], result: str,
+                        generation_time: float, phases: Optional[Dict[str, float]] = None) -> GenerationResult:
+        """构建成功结果（解析JSON）"""
+        # 解析JSON结果
+        start_time = time.perf_counter()
+        parsed_result = self._parse_json_result(result)
+        parse_time = time.perf_counter() - start_time
+        self._observe("parse_seconds", parse_time)
+        _add_phase(phases, "parse", parse_time)
+
+        return GenerationResult(
+            row_index=row_index,
+            input_data=row_data,
+            result=result,
+            success=True,
+            generation_time=generation_time,  # 计算耗时
+            parsed_result=parsed_result,  # 添加解析后的JSON
+            phases=phases
+        )
+
+    def _error_result(self, row_index: int, row_data: Dict[str, str], error: Exception,
+                      generation_time: float) -> GenerationResult:
+        """构建失败结果"""
+        return GenerationResult(
+            row_index=row_index,
+            input_data=row_data,
+            result="",
+            success=False,
+            error=str(error),
+            generation_time=generation_time,  # 计算耗时
+            error_type=getattr(error, 'error_type', None)
+        )
+
+    def _cache_key(self, api_client, prompt: str) -> Optional[str]:
+        """计算响应缓存键，未启用缓存时为空"""
+        if self.cache is None:
+            return None
+        return self.cache.make_key(
+            prompt,
+            getattr(api_client, 'model', ''),
+            getattr(api_client, 'temperature', None),
+            getattr(api_client, 'max_tokens', None)
+        )
+
+    def _cached_result(self, cache_key: Optional[str], use_cache: bool, row_index: int,
+                       row_data: Dict[str, str], start_time: float,
+                       phases: Optional[Dict[str, float]] = None) -> Optional[GenerationResult]:
+        """查询响应缓存，命中时直接构建结果（不发起请求）"""
+        if cache_key is None or not use_cache:
+            return None
+        cached = self.cache.get(cache_key)
+        with self._stats_lock:
+            if cached is None:
+                self._run_cache_misses += 1
+            else:
+                self._run_cache_hits += 1
+        if cached is None:
+            return None
+        generation_result = self._success_result(row_index, row_data, cached, time.time() - start_time, phases)
+        generation_result.cached = True
+        generation_result.attempts = 0
+        return generation_result
+
+    def _store_cache(self, cache_key: Optional[str], api_client, result: str):
+        """成功的响应写入缓存"""
+        if cache_key is not None:
+            self.cache.set(cache_key, result, getattr(api_client, 'model', ''))
+
     def generate_single(self, api_client, row_index: int, template: str,
-                       variables: Dict[str, str]) -> GenerationResult:
+                       variables: Dict[str, str],
+                       row_data: Optional[Dict[str, str]] = None,
+                       use_cache: bool = True, prompt: Optional[str] = None,
+                       phases: Optional[Dict[str, float]] = None) -> GenerationResult:
         """
         生成单行数据
         :param api_client: API客户端
         :param row_index: 行索引
         :param template: Prompt模板
         :param variables: 变量映射
+        :param row_data: 行数据（流式模式下由调用方传入，默认从 input_data 读取）
+        :param use_cache: 是否读取响应缓存（为False时仍会用新结果刷新缓存）
+        :param prompt: 已渲染的Prompt（调度时去重已渲染过），为空时按模板渲染
+        :param phases: 调度阶段已记录的耗时（排队、渲染），其余阶段在此累加
         :return: 生成结果
         """
-        row_data = self.input_data[row_index]
+        if row_data is None:
+            row_data = self.input_data[row_index]
 
+        phases = dict(phases or {})
         start_time = time.time()  # 开始时间
+        attempt = 0
         try:
-            prompt = self.render_prompt(template, variables, row_data)
-            result = api_client.generate(prompt)
+            if prompt is None:
+                render_start = time.perf_counter()
+                prompt = self.render_prompt(template, variables, row_data)
+                _add_phase(phases, "render", time.perf_counter() - render_start)
+            cache_key = self._cache_key(api_client, prompt)
+            cached_result = self._cached_result(cache_key, use_cache, row_index, row_data, start_time, phases)
+            if cached_result is not None:
+                return cached_result
+
+            while True:
+                attempt += 1
+                try:
+                    result = self._call_api(api_client, prompt, phases)
+                    break
+                except Exception as e:
+                    delay = self.retry_policy.next_delay(attempt, e)
+                    if delay is None:
+                        raise
+                    self._count("retries_total")
+                    _add_phase(phases, "retry_wait", delay)
+                    time.sleep(delay)
             end_time = time.time()  # 结束时间
-            
-            # 解析JSON结果
-            parsed_result = self._parse_json_result(result)
-            
-            return GenerationResult(
-                row_index=row_index,
-                input_data=row_data,
-                result=result,
-                success=True,
-                generation_time=end_time - start_time,  # 计算耗时
-                parsed_result=parsed_result  # 添加解析后的JSON
-            )
+            self._store_cache(cache_key, api_client, result)
+            generation_result = self._success_result(row_index, row_data, result, end_time - start_time, phases)
+        except Exception as e:
+            end_time = time.time()  # 结束时间
+            generation_result = self._error_result(row_index, row_data, e, end_time - start_time)
+        generation_result.attempts = max(attempt, 1)
+        generation_result.phases = phases
+        return generation_result
+
+    def generate_pack(self, api_client, rows: List[Tuple[int, Dict[str, str], Optional[str], Dict[str, float]]],
+                      template: str, variables: Dict[str, str], use_cache: bool = True
+                      ) -> Tuple[List[GenerationResult], List[Tuple[int, Dict[str, str], str, Dict[str, float]]]]:
+        """
+        多行打包生成：缓存命中的行直接返回，其余行合成一个Prompt请求，按组编号拆回每行的结果
+        :param api_client: API客户端
+        :param rows: (行索引, 行数据, 已渲染的Prompt或空, 已记录的阶段耗时)
+        :param template: Prompt模板
+        :param variables: 变量映射
+        :param use_cache: 是否读取响应缓存
+        :return: (生成结果, 需要逐行请求的行)；响应缺失、格式错误的组，以及不足两行的包退回逐行请求
+        """
+        start_time = time.time()
+        results = []
+        pending = []
+        for row_index, row_data, prompt, phases in rows:
+            phases = dict(phases)
+            if prompt is None:
+                render_start = time.perf_counter()
+                prompt = self.render_prompt(template, variables, row_data)
+                _add_phase(phases, "render", time.perf_counter() - render_start)
+            cache_key = self._cache_key(api_client, prompt)
+            cached_result = self._cached_result(cache_key, use_cache, row_index, row_data, start_time, phases)
+            if cached_result is not None:
+                results.append(cached_result)
+            else:
+                pending.append((row_index, row_data, prompt, phases, cache_key))
+        if len(pending) < 2:
+            return results, [(i, row_data, prompt, phases) for i, row_data, prompt, phases, _ in pending]
+
+        packer = PromptPacker(self.compile_template(template, variables))
+        render_start = time.perf_counter()
+        pack_prompt = packer.build([row_data for _, row_data, _, _, _ in pending])
+        pack_phases = {"render": time.perf_counter() - render_start}
+        # 响应包含每行的结果，输出上限按行数放大，避免截断后整包退回逐行请求
+        row_max_tokens = getattr(api_client, 'max_tokens', None)
+        max_tokens = row_max_tokens * len(pending) if row_max_tokens else None
+        attempt = 0
+        try:
+            while True:
+                attempt += 1
+                try:
+                    response = self._call_api(api_client, pack_prompt, pack_phases, max_tokens)
+                    break
+                except Exception as e:
+                    delay = self.retry_policy.next_delay(attempt, e)
+                    if delay is None:
+                        raise
+                    self._count("retries_total")
+                    _add_phase(pack_phases, "retry_wait", delay)
+                    time.sleep(delay)
+        except Exception as e:
+            # 打包请求本身失败（重试用尽），各行记为失败，可重试的错误在补跑轮次中重新请求
+            generation_time = (time.time() - start_time) / len(pending)
+            for row_index, row_data, _, phases, _ in pending:
+                result = self._error_result(row_index, row_data, e, generation_time)
+                result.attempts = attempt
+                result.phases = phases
+                results.append(result)
+            return results, []
+
+        outputs = packer.split(response, len(pending))
+        # 请求耗时与各阶段耗时按行均摊
+        generation_time = (time.time() - start_time) / len(pending)
+        shared_phases = {name: seconds / len(pending) for name, seconds in pack_phases.items()}
+        fallback = []
+        for position, (row_index, row_data, prompt, phases, cache_key) in enumerate(pending):
+            output = outputs.get(position)
+            if output is None:
+                fallback.append((row_index, row_data, prompt, phases))
+                continue
+            for name, seconds in shared_phases.items():
+                _add_phase(phases, name, seconds)
+            self._store_cache(cache_key, api_client, output)
+            result = self._success_result(row_index, row_data, output, generation_time, phases)
+            result.attempts = attempt
+            results.append(result)
+
+        with self._stats_lock:
+            packing = self._run_packing
+            if packing is not None:
+                packing["requests"] += 1
+                packing["rows"] += len(pending) - len(fallback)
+                packing["fallback_rows"] += len(fallback)
+                # 实际发送的Prompt字符数（打包Prompt加退回逐行请求的Prompt）与不打包时的字符数
+                packing["prompt_chars"] += len(pack_prompt) + sum(len(prompt) for _, _, prompt, _ in fallback)
+                packing["unpacked_prompt_chars"] += sum(len(prompt) for _, _, prompt, _, _ in pending)
+        self._count("packed_rows_total", len(pending) - len(fallback), outcome="packed")
+        if fallback:
+            self._count("packed_rows_total", len(fallback), outcome="fallback")
+        return results, fallback
+
+    def _call_api(self, api_client, prompt: str, phases: Optional[Dict[str, float]] = None,
+                  max_tokens: Optional[int] = None) -> str:
+        """
+        发起一次API请求，自适应模式下先由并发限制器控制本任务的在途数量，多任务时再从共享预算获取名额
+        （被本任务限制器挡住的请求不占用共享名额；归还时先还预算再还限制器）
+        :param phases: 累加阶段耗时，等待限制器与名额计入排队；客户端不提供细分时整个请求计入首字节
+        :param max_tokens: 本次请求的最大输出token数（同时用于限速预估），为空时使用客户端的设置
+        """
+        options = {"max_tokens": max_tokens} if max_tokens is not None else {}
+        limiter = self._limiter
+        budget = self.budget
+        wait_start = time.perf_counter()
+        if limiter is not None:
+            limiter.acquire()
+        # 未完成请求（等待名额时中断）按未知错误归还限制器，不参与并发上限调整
+        latency, error_type = 0.0, "unknown"
+        start_time = time.time()
+        try:
+            if budget is not None:
+                budget.acquire()
+            try:
+                # 从拿到全部名额起计时，排队时间不计入请求延迟
+                start_time = time.time()
+                if budget is not None or limiter is not None:
+                    _add_phase(phases, "queue", time.perf_counter() - wait_start)
+                timed = phases is not None and getattr(api_client, 'supports_timings', False)
+                before = self._ttft_snapshot(phases) if timed else None
+                try:
+                    if timed:
+                        result = api_client.generate(prompt, timings=phases, **options)
+                    else:
+                        result = api_client.generate(prompt, **options)
+                except Exception as e:
+                    latency = time.time() - start_time
+                    error_type = getattr(e, 'error_type', None) or "unknown"
+                    self._record_request(latency, e)
+                    if not timed:
+                        _add_phase(phases, "ttfb", latency)
+                    raise
+                latency, error_type = time.time() - start_time, None
+                self._record_request(latency)
+                if not timed:
+                    _add_phase(phases, "ttfb", latency)
+                else:
+                    self._observe_ttft(phases, before)
+                return result
+            finally:
+                if budget is not None:
+                    budget.release()
+        finally:
+            if limiter is not None:
+                limiter.release(start_time, latency, error_type)
+
+    # 流式响应中从发出请求到首个Token经过的阶段
+    TTFT_PHASES = ("connect", "ttfb", "ttft")
+
+    @classmethod
+    def _ttft_snapshot(cls, phases: Dict[str, float]) -> Dict[str, Optional[float]]:
+        return {name: phases.get(name) for name in cls.TTFT_PHASES}
+
+    def _observe_ttft(self, phases: Dict[str, float], before: Dict[str, Optional[float]]):
+        """本次请求累加了 ttft 阶段（流式响应）时，从发出到首个Token的耗时计入 ttft_seconds"""
+        if phases.get("ttft") == before["ttft"]:
+            return
+        self._observe("ttft_seconds",
+                      sum(phases.get(name, 0.0) - (before[name] or 0.0) for name in self.TTFT_PHASES))
+
+    def _active_metrics(self):
+        """运行中记录到本次运行的指标，否则（如预览）只记录到进程级指标"""
+        return self._job_metrics if self._is_generating and self._job_metrics is not None else self.metrics
+
+    def _observe(self, name: str, seconds: float):
+        metrics = self._active_metrics()
+        if metrics is not None:
+            metrics.observe(name, seconds)
+
+    def _count(self, name: str, amount: float = 1, **labels):
+        metrics = self._active_metrics()
+        if metrics is not None:
+            metrics.inc(name, amount, **labels)
+
+    def _record_request(self, latency: Optional[float], error: Optional[Exception] = None):
+        """记录一次API请求的耗时与HTTP状态类别（无状态码的失败按错误类别计；耗时未知时只计数）"""
+        metrics = self._active_metrics()
+        if metrics is None:
+            return
+        if error is None:
+            status_class = "2xx"
+        elif getattr(error, 'status_code', None):
+            status_class = f"{error.status_code // 100}xx"
+        else:
+            status_class = getattr(error, 'error_type', None) or "error"
+        if latency is not None:
+            metrics.observe("request_latency_seconds", latency)
+        metrics.inc("requests_total", status_class=status_class)
+
+    async def agenerate_single(self, api_client, row_index: int, template: str,
+                               variables: Dict[str, str],
+                               row_data: Optional[Dict[str, str]] = None,
+                               session=None, use_cache: bool = True,
+                               prompt: Optional[str] = None,
+                               phases: Optional[Dict[str, float]] = None) -> GenerationResult:
+        """
+        异步生成单行数据（generate_single 的 asyncio 版本）
+        :param api_client: API客户端，提供 agenerate 时直接await，否则放入线程池执行 generate
+        :param row_index: 行索引
+        :param template: Prompt模板
+        :param variables: 变量映射
+        :param row_data: 行数据
+        :param session: 共享的异步HTTP会话
+        :param use_cache: 是否读取响应缓存
+        :param prompt: 已渲染的Prompt，为空时按模板渲染
+        :param phases: 调度阶段已记录的耗时（渲染），其余阶段在此累加
+        :return: 生成结果
+        """
+        if row_data is None:
+            row_data = self.input_data[row_index]
+
+        phases = dict(phases or {})
+        start_time = time.time()  # 开始时间
+        attempt = 0
+        try:
+            if prompt is None:
+                render_start = time.perf_counter()
+                prompt = self.render_prompt(template, variables, row_data)
+                _add_phase(phases, "render", time.perf_counter() - render_start)
+            cache_key = self._cache_key(api_client, prompt)
+            cached_result = self._cached_result(cache_key, use_cache, row_index, row_data, start_time, phases)
+            if cached_result is not None:
+                return cached_result
+
+            while True:
+                attempt += 1
+                try:
+                    result = await self._acall_api(api_client, prompt, session, phases)
+                    break
+                except Exception as e:
+                    delay = self.retry_policy.next_delay(attempt, e)
+                    if delay is None:
+                        raise
+                    self._count("retries_total")
+                    _add_phase(phases, "retry_wait", delay)
+                    await asyncio.sleep(delay)
+            end_time = time.time()  # 结束时间
+            self._store_cache(cache_key, api_client, result)
+            generation_result = self._success_result(row_index, row_data, result, end_time - start_time, phases)
         except Exception as e:
             end_time = time.time()  # 结束时间
-            return GenerationResult(
-                row_index=row_index,
-                input_data=row_data,
-                result="",
-                success=False,
-                error=str(e),
-                generation_time=end_time - start_time  # 计算耗时
-            )
+            generation_result = self._error_result(row_index, row_data, e, end_time - start_time)
+        generation_result.attempts = max(attempt, 1)
+        generation_result.phases = phases
+        return generation_result
+
+    async def _acall_api(self, api_client, prompt: str, session=None,
+                         phases: Optional[Dict[str, float]] = None) -> str:
+        """
+        异步发起一次API请求（_call_api 的 asyncio 版本）
+        提供 agenerate 时直接await，否则放入线程池执行 generate
+        """
+        budget = self.budget
+        if budget is not None:
+            wait_start = time.perf_counter()
+            await budget.aacquire()
+            _add_phase(phases, "queue", time.perf_counter() - wait_start)
+        try:
+            timed = phases is not None and getattr(api_client, 'supports_timings', False)
+            before = self._ttft_snapshot(phases) if timed else None
+            request_start = time.time()
+            try:
+                if hasattr(api_client, 'agenerate'):
+                    if timed:
+                        result = await api_client.agenerate(prompt, session=session, timings=phases)
+                    else:
+                        result = await api_client.agenerate(prompt, session=session)
+                else:
+                    loop = asyncio.get_running_loop()
+                    result = await loop.run_in_executor(None, api_client.generate, prompt)
+                    timed = False
+            except Exception as e:
+                self._record_request(time.time() - request_start, e)
+                if not timed:
+                    _add_phase(phases, "ttfb", time.time() - request_start)
+                raise
+            self._record_request(time.time() - request_start)
+            if not timed:
+                _add_phase(phases, "ttfb", time.time() - request_start)
+            else:
+                self._observe_ttft(phases, before)
+            return result
+        finally:
+            if budget is not None:
+                budget.release()
 
     def preview_first_n(self, api_client, n: int = 3, template: str = "",
-                       variables: Dict[str, str] = None) -> Tuple[List[GenerationResult], str]:
+                       variables: Dict[str, str] = None,
+                       use_cache: bool = True) -> Tuple[List[GenerationResult], str]:
         """
         预览前N行
         :param api_client: API客户端
         :param n: 预览行数
         :param template: Prompt模板
         :param variables: 变量映射
+        :param use_cache: 是否读取响应缓存
         :return: (结果列表, 消息)
         """
         if variables is None:
             variables = {}
 
-        preview_count = min(n, len(self.input_data))
+        # 先校验模板，变量映射有误时直接报错
+        self.compile_template(template, variables)
+
         results = []
 
-        for i in range(preview_count):
-            result = self.generate_single(api_client, i, template, variables)
+        for i, row_data in itertools.islice(self.iter_input_rows(), n):
+            result = self.generate_single(api_client, i, template, variables, row_data, use_cache)
             results.append(result)
 
         return results, f"预览完成，共 {len(results)} 行"
 
+    def _begin_run(self, start_index: int, template: str, variables: Dict[str, str],
+                   resume: bool = True, end_index: Optional[int] = None) -> List[GenerationResult]:
+        """
+        初始化一次批量生成的运行状态
+        断点加载后以相同模板继续生成时，合并恢复的结果并跳过已成功的行，只调度缺失或失败的行
+        :return: 合并进本次运行的恢复结果
+        """
+        self._is_generating = True
+        self._cancel_requested = False
+        self._run_event.set()
+        end = self.total_rows if end_index is None else min(end_index, self.total_rows)
+        self.results = [None] * max(end - start_index, 0)  # 预分配结果列表
+
+        restored = []
+        if resume and template == self.checkpoint_template and variables == self.checkpoint_variables:
+            restored = [r for i, r in sorted(self._resume_results.items())
+                        if i >= start_index and (end_index is None or i < end_index)]
+        self._resume_results = {}
+        for r in restored:
+            result_index = r.row_index - start_index
+            if result_index >= len(self.results):
+                self.results.extend([None] * (result_index + 1 - len(self.results)))
+            self.results[result_index] = r
+        self._progress.reset(restored)
+        self._skip_rows = {r.row_index for r in restored if r.success}
+        self._reset_json_columns()
+        self._run_start_time = time.time()  # 总开始时间
+        if self.metrics is not None:
+            self._job_metrics = self.metrics.child(
+                job=self.job_id or time.strftime("%Y%m%d-%H%M%S", time.localtime(self._run_start_time)))
+        self._run_requeued = 0
+        self._run_deduplicated = 0
+        self._run_cache_hits = 0
+        self._run_cache_misses = 0
+        self._run_packing = None
+        return restored
+
+    def pause_generation(self) -> bool:
+        """暂停：不再提交新任务，已在途的请求继续完成"""
+        if not self._is_generating:
+            return False
+        self._run_event.clear()
+        return True
+
+    def resume_generation(self) -> bool:
+        """从暂停处继续提交任务"""
+        if not self._is_generating:
+            return False
+        self._run_event.set()
+        return True
+
+    def cancel_generation(self) -> bool:
+        """取消：撤回尚未开始的任务，等待在途请求完成后保存断点结束，未完成的行可从断点续传"""
+        if not self._is_generating:
+            return False
+        self._cancel_requested = True
+        self._run_event.set()
+        return True
+
+    @property
+    def is_cancelled(self) -> bool:
+        """最近一次运行是否被取消"""
+        return self._cancel_requested
+
+    def _can_submit(self) -> bool:
+        return self._run_event.is_set() and not self._cancel_requested
+
+    def _wait_while_paused(self):
+        """暂停期间阻塞，恢复或取消时返回"""
+        while not self._run_event.wait(0.1):
+            pass
+
+    async def _await_while_paused(self):
+        while not self._run_event.is_set():
+            await asyncio.sleep(0.05)
+
+    def _pending_rows(self, start_index: int,
+                      end_index: Optional[int] = None) -> Iterator[Tuple[int, Dict[str, str]]]:
+        """需要调度的行：跳过断点中已成功的行"""
+        for row_index, row_data in self.iter_input_rows(start_index, end_index):
+            if row_index not in self._skip_rows:
+                yield row_index, row_data
+
+    def _record_result(self, result_index: int, result: Optional[GenerationResult],
+                       template: str, variables: Dict[str, str], start_index: int, on_progress=None):
+        """
+        记录一个完成的任务：写入结果、更新计数、回调进度、定期保存断点
+        :param result_index: 结果在 self.results 中的位置
+        :param result: 生成结果，为空表示任务本身异常
+        """
+        progress = self._progress
+        if result is None:
+            progress.record(None)
+            self._count("rows_total", status="error")
+            if on_progress:
+                on_progress(progress.completed, self.total_rows, progress.success, progress.error)
+            return
+
+        if result_index >= len(self.results):
+            # 总行数未知的流式文件，按需扩展结果列表
+            self.results.extend([None] * (result_index + 1 - len(self.results)))
+
+        # 补跑的行覆盖之前的失败结果，累计尝试次数
+        previous = self.results[result_index]
+        if previous is not None:
+            result.attempts += previous.attempts
+        self.results[result_index] = result
+        progress.record(result, previous)
+        self._count("rows_total", status="success" if result.success else "error")
+        self._track_columns(result)
+        for listener in self._result_listeners:
+            listener(result)
+
+        # 交给后台线程追加写断点日志
+        if self._checkpoint_writer is not None:
+            self._checkpoint_writer.submit(result)
+
+        # 进度回调
+        if on_progress:
+            on_progress(progress.completed, self.total_rows, progress.success, progress.error)
+
+    def _fan_out(self, leader_result: Optional[GenerationResult], followers: List[Tuple[int, Dict[str, str]]],
+                 template: str, variables: Dict[str, str], start_index: int, on_progress=None):
+        """将首行结果分发给Prompt相同的重复行"""
+        for row_index, row_data in followers:
+            result = None
+            if leader_result is not None:
+                result = replace(
+                    leader_result,
+                    row_index=row_index,
+                    input_data=row_data,
+                    parsed_result=dict(leader_result.parsed_result),
+                    timestamp=time.time(),
+                    generation_time=0,
+                    attempts=0,
+                    deduplicated=True,
+                    phases={}
+                )
+            self._run_deduplicated += 1
+            self._record_result(row_index - start_index, result, template, variables, start_index, on_progress)
+
+    def _requeue_candidates(self) -> List[Tuple[int, Dict[str, str]]]:
+        """主流程结束后仍因可重试错误失败的行"""
+        return [
+            (r.row_index, r.input_data) for r in self.results
+            if r is not None and not r.success and self.retry_policy.is_retryable(r.error_type)
+        ]
+
+    def _requeue_concurrency(self, concurrency: int) -> int:
+        """补跑时使用的降低后的并发数"""
+        return max(1, int(concurrency * self.retry_policy.requeue_concurrency_ratio))
+
+    def _checkpoint_dir(self) -> str:
+        if self.checkpoint_dir:
+            return self.checkpoint_dir
+        return os.path.dirname(self._current_file) if self._current_file else "."
+
+    def _start_checkpoint_writer(self, template: str, variables: Dict[str, str], start_index: int,
+                                 restored: Optional[List[GenerationResult]] = None) -> CheckpointWriter:
+        """为本次运行创建断点日志与后台写入线程，并清理更早运行留下的断点"""
+        checkpoint_dir = self._checkpoint_dir()
+        self._cleanup_old_checkpoints(checkpoint_dir, keep=3)
+        journal = CheckpointJournal(checkpoint_dir, {
+            "total_rows": self.total_rows,
+            "start_index": start_index,
+            "input_file": self._current_file or "",
+            "prompt_template": template,
+            "variable_mapping": variables
+        }, fsync_interval=self.save_interval)
+        self._last_checkpoint = journal.journal_path
+        return CheckpointWriter(journal, flush_rows=self.save_interval, initial_results=restored,
+                                metrics=self._job_metrics)
+
+    def _stop_checkpoint_writer(self, current_index: Optional[int] = None):
+        """运行结束时等待写入线程写完剩余结果，压缩出最终快照并关闭日志"""
+        writer, self._checkpoint_writer = self._checkpoint_writer, None
+        if writer is None:
+            return
+        try:
+            writer.close(current_index)
+            self._last_checkpoint = writer.journal.snapshot_path
+        finally:
+            self._checkpoint_stats = writer.get_stats()
+
+    def _finish_run(self, template: str, variables: Dict[str, str]) -> Tuple[bool, str]:
+        """正常结束：最终保存断点并返回汇总消息"""
+        # 最终保存
+        self._progress.finish()
+        self._stop_checkpoint_writer(self.total_rows)
+
+        total_end_time = time.time()  # 总结束时间
+        total_time = total_end_time - self._run_start_time
+
+        self._is_generating = False
+        if self._cancel_requested:
+            return False, f"生成已取消，成功: {self._progress.success}，失败: {self._progress.error}，已保存当前进度"
+        return True, f"生成完成，成功: {self._progress.success}，失败: {self._progress.error}，总耗时: {total_time:.2f}秒"
+
+    def _abort_run(self, template: str, variables: Dict[str, str], start_index: int,
+                   error: Exception) -> Tuple[bool, str]:
+        """异常中断：保存当前进度并返回错误消息"""
+        self._is_generating = False
+        self._progress.finish()
+        # 保存当前进度（断点写入本身失败时不掩盖原始错误）
+        try:
+            self._stop_checkpoint_writer()
+        except Exception as save_error:
+            logger.exception("生成中断后保存进度失败")
+            return False, f"生成中断: {error}，保存进度失败: {save_error}"
+        return False, f"生成中断: {error}，已保存当前进度"
+
     def start_generation(self, api_client, template: str, variables: Dict[str, str],
-                        start_index: int = 0, on_progress=None, max_workers: int = 5) -> Tuple[bool, str]:
+                        start_index: int = 0, on_progress=None, max_workers: int = 5,
+                        adaptive: bool = False, max_limit: int = 64,
+                        use_cache: bool = True, dedup: bool = True,
+                        resume: bool = True, end_index: Optional[int] = None,
+                        pack_size: int = 1) -> Tuple[bool, str]:
         """
         开始批量生成
         :param api_client: API客户端
@@ -241,99 +1811,618 @@ class KeyGenerator:
         :param variables: 变量映射
         :param start_index: 起始索引（用于断点续传）
         :param on_progress: 进度回调
-        :param max_workers: 最大并发数
+        :param max_workers: 最大并发数（自适应模式下为初始并发数）
+        :param adaptive: 是否启用AIMD自适应并发
+        :param max_limit: 自适应模式下的并发上限
+        :param use_cache: 是否读取响应缓存
+        :param dedup: 是否对Prompt相同的行只请求一次
+        :param resume: 加载断点后是否跳过已成功的行（模板与变量映射需与断点一致）
+        :param end_index: 结束索引（不含），只处理 [start_index, end_index) 的行（分片进程使用）
+        :param pack_size: 每个请求打包的行数，大于1时K行共用一次请求，模板只发送一次
         :return: (成功, 消息)
         """
         if self._is_generating:
             return False, "生成任务正在进行中"
 
-        self._is_generating = True
-        self.results = [None] * (len(self.input_data) - start_index)  # 预分配结果列表
-        success_count = 0
-        error_count = 0
-        total_start_time = time.time()  # 总开始时间
+        try:
+            self.compile_template(template, variables)
+        except ValueError as e:
+            return False, f"模板校验失败: {e}"
+
+        restored = self._begin_run(start_index, template, variables, resume, end_index)
+        self._checkpoint_writer = self._start_checkpoint_writer(template, variables, start_index, restored)
+        if pack_size > 1:
+            self._run_packing = {"pack_size": pack_size, "requests": 0, "rows": 0, "fallback_rows": 0,
+                                 "prompt_chars": 0, "unpacked_prompt_chars": 0}
+
+        if adaptive:
+            self._limiter = AdaptiveConcurrencyLimiter(initial_limit=max_workers, max_limit=max_limit)
+            pool_workers = self._limiter.max_limit
+        else:
+            self._limiter = None
+            pool_workers = max_workers
+
+        # 连接池与并发数一致，每个工作线程都能复用一条长连接；
+        # 多任务共享客户端时按全局预算设置，避免各任务反复重建连接池
+        if hasattr(api_client, 'configure_pool'):
+            api_client.configure_pool(self.budget.limit if self.budget is not None else pool_workers)
 
         try:
-            def process_item(index):
-                """处理单个任务"""
-                result = self.generate_single(api_client, index, template, variables)
-                return index - start_index, result
-
-            # 使用线程池并发处理
-            with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-                # 提交所有任务
-                future_to_index = {
-                    executor.submit(process_item, i): i 
-                    for i in range(start_index, len(self.input_data))
-                }
-
-                # 处理完成的任务
-                for future in concurrent.futures.as_completed(future_to_index):
-                    try:
-                        result_index, result = future.result()
-                        self.results[result_index] = result
+            def process_item(index, row_data, prompt, phases, submitted_at):
+                """
+                处理单个任务（自适应模式下线程数按上限创建，实际在途请求数由限制器控制）
+                :return: ([(结果位置, 结果)], 需要逐行重新请求的行)
+                """
+                phases["queue"] = time.perf_counter() - submitted_at  # 等待空闲工作线程
+                result = self.generate_single(api_client, index, template, variables, row_data,
+                                              use_cache, prompt, phases)
+                return [(index - start_index, result)], []
+
+            def process_pack(items, submitted_at):
+                """处理一个多行打包任务，返回值同 process_item"""
+                queued = time.perf_counter() - submitted_at
+                for _, _, _, phases in items:
+                    phases["queue"] = queued
+                results, fallback = self.generate_pack(api_client, items, template, variables, use_cache)
+                return [(r.row_index - start_index, r) for r in results], fallback
+
+            def run_pass(rows, workers):
+                """
+                使用线程池并发处理一批行
+                排队的任务数不超过提交窗口，完成一个补充一个，内存占用与总行数无关；
+                暂停时停止补充，取消时撤回尚未开始的任务
+                """
+                deduplicator = PromptDeduplicator() if dedup else None
+                window = max(1, workers * self.SUBMIT_WINDOW_FACTOR)
+                rows = iter(rows)
+                exhausted = False
+                pack = []  # 打包模式下凑满 pack_size 行再提交
+                with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+                    future_to_index = {}
+
+                    def submit_pack():
+                        future = executor.submit(process_pack, pack[:], time.perf_counter())
+                        future_to_index[future] = [i for i, _, _, _ in pack]
+                        pack.clear()
+
+                    while True:
+                        # 补充任务直到窗口填满（流式模式下边读取文件边提交，先读到的行先开始请求）
+                        while not exhausted and len(future_to_index) < window and self._can_submit():
+                            item = next(rows, None)
+                            if item is None:
+                                exhausted = True
+                                if pack:
+                                    submit_pack()
+                                break
+                            i, row_data = item
+                            prompt = None
+                            phases = {}
+                            if deduplicator is not None:
+                                render_start = time.perf_counter()
+                                prompt = self.render_prompt(template, variables, row_data)
+                                phases["render"] = time.perf_counter() - render_start
+                                leader = deduplicator.register(prompt, i, row_data)
+                                if leader is not None:
+                                    # 重复行不提交；首行已完成时直接复用其结果
+                                    if not deduplicator.is_pending(leader):
+                                        self._fan_out(self.results[leader - start_index], [(i, row_data)],
+                                                      template, variables, start_index, on_progress)
+                                    continue
+                            if pack_size > 1:
+                                pack.append((i, row_data, prompt, phases))
+                                if len(pack) >= pack_size:
+                                    submit_pack()
+                                continue
+                            future = executor.submit(process_item, i, row_data, prompt, phases, time.perf_counter())
+                            future_to_index[future] = [i]
+
+                        if self._cancel_requested:
+                            # 撤回排队中的任务，这些行保持未完成，可从断点续传
+                            for future in [f for f in future_to_index if f.cancel()]:
+                                del future_to_index[future]
+
+                        if not future_to_index:
+                            if exhausted or self._cancel_requested:
+                                break
+                            self._wait_while_paused()
+                            continue
+
+                        # 处理完成的任务
+                        done, _ = concurrent.futures.wait(
+                            future_to_index, return_when=concurrent.futures.FIRST_COMPLETED
+                        )
+                        for future in done:
+                            indices = future_to_index.pop(future)
+                            try:
+                                records, fallback = future.result()
+                            except Exception:
+                                records, fallback = [(i - start_index, None) for i in indices], []
+                            for result_index, result in records:
+                                self._record_result(result_index, result, template, variables,
+                                                    start_index, on_progress)
+                                if deduplicator is not None:
+                                    followers = deduplicator.complete(result_index + start_index)
+                                    self._fan_out(result, followers, template, variables, start_index, on_progress)
+                            # 打包响应中缺失或格式错误的行逐行重新请求
+                            for i, row_data, prompt, phases in fallback:
+                                future = executor.submit(process_item, i, row_data, prompt, phases,
+                                                         time.perf_counter())
+                                future_to_index[future] = [i]
+
+            run_pass(self._pending_rows(start_index, end_index), pool_workers)
+
+            # 对仍因限流、超时等可重试错误失败的行，降低并发补跑
+            for _ in range(self.retry_policy.requeue_passes):
+                pending = self._requeue_candidates()
+                if not pending or self._cancel_requested:
+                    break
+                self._run_requeued += len(pending)
+                concurrency = self._limiter.limit if self._limiter else pool_workers
+                run_pass(pending, self._requeue_concurrency(concurrency))
+
+            return self._finish_run(template, variables)
+
+        except Exception as e:
+            return self._abort_run(template, variables, start_index, e)
+
+    async def start_generation_async(self, api_client, template: str, variables: Dict[str, str],
+                                     start_index: int = 0, on_progress=None,
+                                     max_concurrency: int = 100, use_cache: bool = True,
+                                     dedup: bool = True, resume: bool = True,
+                                     end_index: Optional[int] = None) -> Tuple[bool, str]:
+        """
+        asyncio引擎批量生成：单线程事件循环内保持大量请求同时在途
+        与 start_generation 共用进度回调、断点与 GenerationResult 约定
+        :param api_client: API客户端
+        :param template: Prompt模板
+        :param variables: 变量映射
+        :param start_index: 起始索引（用于断点续传）
+        :param on_progress: 进度回调
+        :param max_concurrency: 最大在途请求数
+        :param use_cache: 是否读取响应缓存
+        :param dedup: 是否对Prompt相同的行只请求一次
+        :param resume: 加载断点后是否跳过已成功的行（模板与变量映射需与断点一致）
+        :param end_index: 结束索引（不含），只处理 [start_index, end_index) 的行（分片进程使用）
+        :return: (成功, 消息)
+        """
+        if self._is_generating:
+            return False, "生成任务正在进行中"
+
+        try:
+            self.compile_template(template, variables)
+        except ValueError as e:
+            return False, f"模板校验失败: {e}"
 
-                        if result.success:
-                            success_count += 1
-                        else:
-                            error_count += 1
+        restored = self._begin_run(start_index, template, variables, resume, end_index)
+        self._checkpoint_writer = self._start_checkpoint_writer(template, variables, start_index, restored)
+        self._limiter = None
 
-                        # 进度回调
-                        current_completed = success_count + error_count
-                        if on_progress:
-                            on_progress(current_completed, len(self.input_data), success_count, error_count)
+        try:
+            if hasattr(api_client, 'async_session'):
+                session_context = api_client.async_session(limit=max_concurrency)
+            else:
+                session_context = contextlib.nullcontext()
+
+            async with session_context as session:
+                async def worker(rows, deduplicator):
+                    """从共享的行迭代器中持续取任务，直到数据读完；暂停时等待，取消时退出"""
+                    while True:
+                        await self._await_while_paused()
+                        if self._cancel_requested:
+                            return
+                        item = next(rows, None)
+                        if item is None:
+                            return
+                        index, row_data = item
+                        prompt = None
+                        phases = {}
+                        if deduplicator is not None:
+                            render_start = time.perf_counter()
+                            prompt = self.render_prompt(template, variables, row_data)
+                            phases["render"] = time.perf_counter() - render_start
+                            leader = deduplicator.register(prompt, index, row_data)
+                            if leader is not None:
+                                # 重复行不发请求；首行已完成时直接复用其结果
+                                if not deduplicator.is_pending(leader):
+                                    self._fan_out(self.results[leader - start_index], [(index, row_data)],
+                                                  template, variables, start_index, on_progress)
+                                continue
+
+                        result = await self.agenerate_single(
+                            api_client, index, template, variables, row_data,
+                            session=session, use_cache=use_cache, prompt=prompt, phases=phases
+                        )
+                        self._record_result(index - start_index, result, template, variables,
+                                            start_index, on_progress)
+                        if deduplicator is not None:
+                            self._fan_out(result, deduplicator.complete(index),
+                                          template, variables, start_index, on_progress)
+
+                async def run_pass(rows, concurrency):
+                    rows = iter(rows)
+                    deduplicator = PromptDeduplicator() if dedup else None
+                    await asyncio.gather(*(worker(rows, deduplicator) for _ in range(concurrency)))
+
+                await run_pass(self._pending_rows(start_index, end_index), max_concurrency)
+
+                # 对仍因限流、超时等可重试错误失败的行，降低并发补跑
+                for _ in range(self.retry_policy.requeue_passes):
+                    pending = self._requeue_candidates()
+                    if not pending or self._cancel_requested:
+                        break
+                    self._run_requeued += len(pending)
+                    await run_pass(pending, self._requeue_concurrency(max_concurrency))
+
+            return self._finish_run(template, variables)
 
-                        # 定期保存断点
-                        if current_completed % self.save_interval == 0:
-                            self.save_checkpoint(template, variables, start_index + current_completed)
-                    except Exception as e:
-                        error_count += 1
-                        if on_progress:
-                            on_progress(success_count + error_count, len(self.input_data), success_count, error_count)
+        except Exception as e:
+            return self._abort_run(template, variables, start_index, e)
 
-            # 最终保存
-            self.save_checkpoint(template, variables, len(self.input_data))
+    def run_generation_async(self, *args, **kwargs) -> Tuple[bool, str]:
+        """在新的事件循环中同步运行 start_generation_async（供后台线程调用）"""
+        return asyncio.run(self.start_generation_async(*args, **kwargs))
 
-            total_end_time = time.time()  # 总结束时间
-            total_time = total_end_time - total_start_time
+    def start_generation_sharded(self, client_factory, template: str, variables: Dict[str, str],
+                                 shards: Optional[int] = None, on_progress=None, engine: str = "thread",
+                                 max_workers: int = 5, adaptive: bool = False, max_limit: int = 64,
+                                 max_concurrency: int = 100, use_cache: bool = True, dedup: bool = True,
+                                 resume: bool = True, pack_size: int = 1, start_index: int = 0) -> Tuple[bool, str]:
+        """
+        多进程分片生成：把输入行划分为连续区间，每个分片在独立进程中运行自己的生成器与断点日志，
+        JSON解析与断点序列化分散到多个CPU核心；本进程作为协调者按行索引合并结果，
+        导出、进度、结果监听与暂停/取消和单进程运行一致
+        :param client_factory: 无参数、可被pickle的客户端工厂（如 functools.partial），每个分片进程各自创建客户端
+        :param template: Prompt模板
+        :param variables: 变量映射
+        :param shards: 分片（进程）数，默认CPU核心数
+        :param on_progress: 进度回调
+        :param engine: 分片内的生成引擎：thread 或 async
+        :param max_workers: 每个分片的线程池并发数（thread引擎）
+        :param adaptive: 每个分片是否启用AIMD自适应并发（thread引擎）
+        :param max_limit: 自适应模式下每个分片的并发上限
+        :param max_concurrency: 每个分片的最大在途请求数（async引擎）
+        :param use_cache: 是否读取响应缓存（各进程打开同一个缓存文件）
+        :param dedup: 是否对Prompt相同的行只请求一次（分片内去重）
+        :param resume: 是否从各分片自己的断点续传（分片数需与上次一致）
+        :param pack_size: 每个请求打包的行数（thread引擎）
+        :param start_index: 起始行索引，之前的行不生成
+        :return: (成功, 消息)
+        """
+        if self._is_generating:
+            return False, "生成任务正在进行中"
+        if not self._current_file:
+            return False, "分片模式需要从文件加载输入数据"
+        if engine not in ("thread", "async"):
+            return False, f"不支持的生成引擎: {engine}"
 
-            self._is_generating = False
-            return True, f"生成完成，成功: {success_count}，失败: {error_count}，总耗时: {total_time:.2f}秒"
+        try:
+            self.compile_template(template, variables)
+        except ValueError as e:
+            return False, f"模板校验失败: {e}"
+
+        # 流式加载的总行数来自文件记录的尺寸信息，可能为0或过期，分片前先数出实际行数
+        total_rows = self.count_input_rows()
+        if start_index >= total_rows:
+            return False, f"没有需要生成的行（共 {total_rows} 行，起始行 {start_index}）"
+        ranges = [(start_index + start, start_index + end)
+                  for start, end in _shard_ranges(total_rows - start_index, shards or os.cpu_count() or 1)]
+        # 最后一个分片读到文件末尾，文件在计数后追加的行也不会遗漏
+        ranges[-1] = (ranges[-1][0], None)
+        # 断点目录按分片数（与起始行）区分，参数不变时每个分片的行区间不变，可各自续传
+        shard_name = f".shards_{len(ranges)}" if start_index == 0 else f".shards_{len(ranges)}_from_{start_index}"
+        shard_root = os.path.join(self._checkpoint_dir(), shard_name)
+        config = {
+            "generator_factory": type(self),
+            "save_interval": self.save_interval,
+            "retry_policy": self.retry_policy,
+            "cache_factory": type(self.cache) if self.cache is not None else None,
+            "cache_path": getattr(self.cache, 'db_path', None),
+            "input_file": self._current_file,
+            "sheet_name": self._sheet_name,
+            "template": template,
+            "variables": variables,
+            "client_factory": client_factory,
+            "engine": engine,
+            "max_workers": max_workers,
+            "adaptive": adaptive,
+            "max_limit": max_limit,
+            "max_concurrency": max_concurrency,
+            "use_cache": use_cache,
+            "dedup": dedup,
+            "resume": resume,
+            "pack_size": pack_size,
+            "batch_rows": max(self.save_interval, 1),
+            "batch_interval": 0.2
+        }
 
+        self._begin_run(0, template, variables, resume=False)
+        self._limiter = None
+        # spawn：子进程不继承本进程的线程与连接
+        context = multiprocessing.get_context("spawn")
+        result_queue = context.Queue()
+        paused, cancelled = context.Event(), context.Event()
+        processes = {}
+        try:
+            for shard, (start, end) in enumerate(ranges):
+                shard_config = dict(config, checkpoint_dir=os.path.join(shard_root, f"shard_{shard}"))
+                process = context.Process(target=_run_shard, daemon=True,
+                                          args=(shard, start, end, shard_config, result_queue, paused, cancelled))
+                process.start()
+                processes[shard] = process
+
+            outcomes: Dict[int, Tuple[bool, str]] = {}
+            while len(outcomes) < len(processes):
+                if self._cancel_requested:
+                    cancelled.set()
+                elif self._run_event.is_set():
+                    paused.clear()
+                else:
+                    paused.set()
+                try:
+                    message = result_queue.get(timeout=0.1)
+                except queue.Empty:
+                    # 进程异常退出（如被杀死）且没有发回结束消息
+                    for shard, process in processes.items():
+                        if shard not in outcomes and not process.is_alive() and result_queue.empty():
+                            outcomes[shard] = (False, f"分片进程退出，退出码 {process.exitcode}")
+                    continue
+                if message[0] == "rows":
+                    self.merge_results(message[2], on_progress)
+                else:
+                    _, shard, success, text = message
+                    outcomes[shard] = (success, text)
+
+            for process in processes.values():
+                process.join()
         except Exception as e:
+            for process in processes.values():
+                if process.is_alive():
+                    process.terminate()
             self._is_generating = False
-            # 保存当前进度
-            self.save_checkpoint(template, variables, start_index + len([r for r in self.results if r]))
-            return False, f"生成中断: {e}，已保存当前进度"
+            self._progress.finish()
+            return False, f"生成中断: {e}"
 
-    def save_checkpoint(self, template: str, variables: Dict[str, str], current_index: int):
-        """保存断点"""
-        checkpoint_dir = os.path.dirname(self._current_file) if self._current_file else "."
-        checkpoint_path = os.path.join(
-            checkpoint_dir,
-            f".checkpoint_{int(time.time())}.json"
-        )
+        self._progress.finish()
+        self._is_generating = False
+        total_time = time.time() - self._run_start_time
+        failed = [f"分片{shard + 1}: {text}" for shard, (success, text) in sorted(outcomes.items())
+                  if not success]
+        summary = f"成功: {self._progress.success}，失败: {self._progress.error}"
+        if self._cancel_requested:
+            return False, f"生成已取消，{summary}，各分片已保存当前进度"
+        if failed:
+            return False, f"部分分片未完成，{summary}；" + "；".join(failed)
+        return True, f"生成完成（{len(ranges)}个进程），{summary}，总耗时: {total_time:.2f}秒"
+
+    # 批处理模式的提交记录文件名（在断点目录中），进程重启后据此接回未结束的批处理
+    BATCH_STATE_FILE = ".batch_state.json"
+
+    def start_generation_batch(self, api_client, template: str, variables: Dict[str, str],
+                               start_index: int = 0, on_progress=None, poll_interval: float = 30.0,
+                               use_cache: bool = True, dedup: bool = True,
+                               resume: bool = True) -> Tuple[bool, str]:
+        """
+        批处理（Batch API）模式：把待生成的Prompt写成JSONL批处理文件上传，轮询批处理状态，
+        结束后按 custom_id 把输出对应回行并生成 GenerationResult，结果同样写入断点并可导出
+        提交记录保存在断点目录，进程重启后以相同模板运行会接回尚未结束的批处理而不是重新提交；
+        失败的行留在断点中，再次运行时只提交失败与缺失的行
+        :param api_client: 支持批处理的API客户端（submit_batch/get_batch/cancel_batch/fetch_batch_results）
+        :param template: Prompt模板
+        :param variables: 变量映射
+        :param start_index: 起始索引
+        :param on_progress: 进度回调（每次轮询后回调一次）
+        :param poll_interval: 轮询批处理状态的间隔（秒）
+        :param use_cache: 是否读取响应缓存（命中的行不提交）
+        :param dedup: 是否对Prompt相同的行只提交一次
+        :param resume: 加载断点后是否跳过已成功的行，并接回未结束的批处理
+        :return: (成功, 消息)
+        """
+        if self._is_generating:
+            return False, "生成任务正在进行中"
+        if not hasattr(api_client, 'submit_batch'):
+            return False, "当前API客户端不支持批处理模式"
 
-        # 将结果转换为字典格式，确保parsed_result被正确保存
-        results_dict = [CheckpointData.from_generation_result(r) for r in self.results if r]
+        try:
+            self.compile_template(template, variables)
+        except ValueError as e:
+            return False, f"模板校验失败: {e}"
 
-        checkpoint = CheckpointData(
-            timestamp=time.time(),
-            total_rows=self.total_rows,
-            current_index=current_index,
-            results=results_dict,
-            input_file=self._current_file or "",
-            prompt_template=template,
-            variable_mapping=variables
-        )
+        restored = self._begin_run(start_index, template, variables, resume)
+        self._checkpoint_writer = self._start_checkpoint_writer(template, variables, start_index, restored)
+        self._limiter = None
+        self._batch = None
 
-        with open(checkpoint_path, 'w', encoding='utf-8') as f:
-            json.dump(checkpoint.to_dict(), f, ensure_ascii=False, indent=2)
+        try:
+            state_path = os.path.join(self._checkpoint_dir(), self.BATCH_STATE_FILE)
+            state = self._load_batch_state(state_path, template, variables) if resume else None
+            if state is None:
+                state = self._submit_batch(api_client, template, variables, start_index, use_cache, dedup,
+                                           state_path, on_progress)
+            if state is not None:
+                batch = self._poll_batch(api_client, state["batch_id"], poll_interval, on_progress)
+                self._collect_batch(api_client, batch, state, start_index, template, variables, on_progress)
+                self._remove_batch_files(state_path, state)
+            return self._finish_run(template, variables)
 
-        self._last_checkpoint = checkpoint_path
+        except Exception as e:
+            return self._abort_run(template, variables, start_index, e)
 
-        # 清理旧断点（保留最近3个）
-        self._cleanup_old_checkpoints(checkpoint_dir, keep=3)
+    def _load_batch_state(self, state_path: str, template: str,
+                          variables: Dict[str, str]) -> Optional[Dict[str, Any]]:
+        """读取未结束的批处理提交记录，输入文件或模板不一致时忽略"""
+        if not os.path.exists(state_path):
+            return None
+        with open(state_path, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+        if (state.get("input_file") != (self._current_file or "") or state.get("prompt_template") != template
+                or state.get("variable_mapping") != variables):
+            return None
+        return state
+
+    def _submit_batch(self, api_client, template: str, variables: Dict[str, str], start_index: int,
+                      use_cache: bool, dedup: bool, state_path: str, on_progress=None) -> Optional[Dict[str, Any]]:
+        """
+        渲染待生成的行并提交批处理：缓存命中的行直接记录，Prompt相同的行只提交一次
+        :return: 提交记录（批处理ID与 custom_id -> 行索引），没有需要提交的行时为空
+        """
+        directory = self._checkpoint_dir()
+        requests_path = os.path.join(directory, f".batch_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}.jsonl")
+        requests: Dict[str, Dict[str, Any]] = {}  # custom_id -> {"rows": 行索引列表, "cache_key": 缓存键}
+        prompt_ids: Dict[str, str] = {}
+        with open(requests_path, 'w', encoding='utf-8') as f:
+            for row_index, row_data in self._pending_rows(start_index):
+                phases = {}
+                start_time = time.time()
+                render_start = time.perf_counter()
+                prompt = self.render_prompt(template, variables, row_data)
+                _add_phase(phases, "render", time.perf_counter() - render_start)
+                if dedup and prompt in prompt_ids:
+                    requests[prompt_ids[prompt]]["rows"].append(row_index)
+                    continue
+                cache_key = self._cache_key(api_client, prompt)
+                cached_result = self._cached_result(cache_key, use_cache, row_index, row_data, start_time, phases)
+                if cached_result is not None:
+                    self._record_result(row_index - start_index, cached_result, template, variables,
+                                        start_index, on_progress)
+                    continue
+                custom_id = f"row-{row_index}"
+                prompt_ids[prompt] = custom_id
+                requests[custom_id] = {"rows": [row_index], "cache_key": cache_key}
+                f.write(json.dumps(api_client.build_batch_request(custom_id, prompt), ensure_ascii=False) + "\n")
+
+        if not requests:
+            os.remove(requests_path)
+            return None
+
+        batch = api_client.submit_batch(requests_path)
+        self._batch = batch
+        state = {
+            "batch_id": batch["id"],
+            "requests_file": requests_path,
+            "input_file": self._current_file or "",
+            "prompt_template": template,
+            "variable_mapping": variables,
+            "requests": requests
+        }
+        # 先写临时文件再替换，避免中断时留下不完整的记录
+        temp_path = state_path + ".tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(temp_path, state_path)
+        return state
+
+    def _poll_batch(self, api_client, batch_id: str, poll_interval: float, on_progress=None) -> Dict[str, Any]:
+        """
+        轮询批处理状态直到结束；取消生成时同时取消远端批处理并等待其结束
+        :return: 最后一次查询到的批处理对象
+        """
+        cancel_sent = False
+        while True:
+            batch = self._batch_request(api_client.get_batch, batch_id)
+            self._batch = batch
+            if on_progress:
+                progress = self._progress
+                on_progress(progress.completed, self.total_rows, progress.success, progress.error)
+            if batch["status"] in api_client.BATCH_TERMINAL_STATUSES:
+                return batch
+            if self._cancel_requested and not cancel_sent:
+                self._batch_request(api_client.cancel_batch, batch_id)
+                cancel_sent = True
+            # 分段等待，取消请求可以及时响应
+            deadline = time.monotonic() + poll_interval
+            while time.monotonic() < deadline and (cancel_sent or not self._cancel_requested):
+                time.sleep(min(0.1, poll_interval))
+
+    def _batch_request(self, request, *args):
+        """
+        发起批处理的查询/取消/下载请求，可重试的错误（限流、5xx、超时、网络）按重试策略退避后重试，
+        避免批处理仍在远端运行时因一次瞬时错误中断整个生成
+        :param request: 客户端的批处理方法
+        :return: 请求结果
+        """
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                return request(*args)
+            except Exception as e:
+                delay = self.retry_policy.next_delay(attempt, e)
+                if delay is None:
+                    raise
+                self._count("retries_total")
+                time.sleep(delay)
+
+    def _collect_batch(self, api_client, batch: Dict[str, Any], state: Dict[str, Any], start_index: int,
+                       template: str, variables: Dict[str, str], on_progress=None):
+        """下载批处理结果，按 custom_id 对应回行并记录结果；没有返回结果的行记为失败"""
+        outcomes = self._batch_request(api_client.fetch_batch_results, batch)
+        row_ids = {row_index: custom_id for custom_id, request in state["requests"].items()
+                   for row_index in request["rows"]}
+        for row_index, row_data in self.iter_input_rows(start_index):
+            custom_id = row_ids.get(row_index)
+            if custom_id is None:
+                continue
+            request = state["requests"][custom_id]
+            outcome = outcomes.get(custom_id)
+            if outcome is None:
+                # 过期或取消时未执行的行，记为可重试的失败，再次运行时重新提交
+                result = self._error_result(
+                    row_index, row_data, TimeoutError(f"批处理未返回该行结果（批处理状态: {batch['status']}）"), 0)
+                result.error_type = "timeout"
+            elif isinstance(outcome, Exception):
+                result = self._error_result(row_index, row_data, outcome, 0)
+            else:
+                result = self._success_result(row_index, row_data, outcome, 0)
+            if row_index == request["rows"][0]:
+                # 批处理中单个请求的耗时未知，只计数
+                if outcome is not None:
+                    self._record_request(None, outcome if isinstance(outcome, Exception) else None)
+                if isinstance(outcome, str):
+                    self._store_cache(request["cache_key"], api_client, outcome)
+            else:
+                result.deduplicated = True
+                result.attempts = 0
+                self._run_deduplicated += 1
+            self._record_result(row_index - start_index, result, template, variables, start_index, on_progress)
+
+    def _remove_batch_files(self, state_path: str, state: Dict[str, Any]):
+        """批处理结果已写入断点后删除提交记录与请求文件"""
+        for path in (state_path, state.get("requests_file")):
+            if path and os.path.exists(path):
+                os.remove(path)
+
+    def merge_results(self, results: List[GenerationResult], on_progress=None):
+        """
+        按行索引合并其他进程（分片）产生的结果，更新进度并通知结果监听器
+        同一行的新结果覆盖旧结果（如分片续传后补跑成功的行）
+        :param results: 生成结果，row_index 为在整个输入中的行索引
+        :param on_progress: 进度回调
+        """
+        progress = self._progress
+        for result in results:
+            if result.row_index >= len(self.results):
+                self.results.extend([None] * (result.row_index + 1 - len(self.results)))
+            previous = self.results[result.row_index]
+            self.results[result.row_index] = result
+            progress.record(result, previous)
+            self._count("rows_total", status="success" if result.success else "error")
+            for listener in self._result_listeners:
+                listener(result)
+        if on_progress and results:
+            on_progress(progress.completed, self.total_rows, progress.success, progress.error)
+
+    def save_checkpoint(self, template: str, variables: Dict[str, str], current_index: int):
+        """保存断点：生成中压缩当前日志为快照，否则写出一份独立快照"""
+        if self._checkpoint_writer is not None:
+            self._checkpoint_writer.snapshot(current_index)
+            self._last_checkpoint = self._checkpoint_writer.journal.snapshot_path
+            return
+
+        self._checkpoint_writer = self._start_checkpoint_writer(template, variables, 0)
+        for r in self.results:
+            if r is not None:
+                self._checkpoint_writer.submit(r)
+        self._stop_checkpoint_writer(current_index)
 
     def load_checkpoint(self, checkpoint_path: str) -> Tuple[bool, str]:
         """
@@ -345,17 +2434,17 @@ class KeyGenerator:
             if not os.path.exists(checkpoint_path):
                 return False, f"断点文件不存在: {checkpoint_path}"
 
-            with open(checkpoint_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-
-            checkpoint = CheckpointData.from_dict(data)
+            # 快照加日志回放，兼容只有快照的旧版断点
+            checkpoint = CheckpointJournal.replay(checkpoint_path)
 
-            # 恢复输入数据
-            if checkpoint.input_file and os.path.exists(checkpoint.input_file):
+            # 恢复输入数据（已加载同一文件时不重复读取）
+            if (checkpoint.input_file and checkpoint.input_file != self._current_file
+                    and os.path.exists(checkpoint.input_file)):
                 self.load_input(checkpoint.input_file)
 
             # 恢复结果，确保parsed_result字段被正确处理
             self.results = []
+            self._reset_json_columns()
             for r in checkpoint.results:
                 # 兼容旧版断点数据（没有parsed_result字段）
                 if 'parsed_result' not in r:
@@ -363,7 +2452,16 @@ class KeyGenerator:
                 # 恢复GenerationResult对象
                 self.results.append(GenerationResult(**r))
 
-            return True, f"加载断点成功，当前进度: {checkpoint.current_index}/{checkpoint.total_rows}"
+            # 已完成行的索引：下次以相同模板生成时跳过已成功的行，只补齐缺失与失败的行
+            self._resume_results = {r.row_index: r for r in self.results}
+            self._progress.reset(self.results)
+            done = sum(1 for r in self.results if r.success)
+
+            self.checkpoint_template = checkpoint.prompt_template
+            self.checkpoint_variables = checkpoint.variable_mapping
+            self._last_checkpoint = checkpoint_path
+
+            return True, f"加载断点成功，已完成: {done}/{checkpoint.total_rows}"
 
         except Exception as e:
             return False, f"加载断点失败: {e}"
@@ -371,13 +2469,27 @@ class KeyGenerator:
     def get_latest_checkpoint(self, checkpoint_dir: Optional[str] = None) -> Optional[str]:
         """获取最新断点文件"""
         if checkpoint_dir is None:
-            checkpoint_dir = os.path.dirname(self._current_file) if self._current_file else "."
+            checkpoint_dir = self._checkpoint_dir()
 
-        checkpoints = glob.glob(os.path.join(checkpoint_dir, ".checkpoint_*.json"))
-        if not checkpoints:
+        runs = self._checkpoint_runs(checkpoint_dir)
+        if not runs:
             return None
 
-        return max(checkpoints, key=os.path.getmtime)
+        # 优先返回快照路径，尚未压缩过的运行返回日志路径（加载时两者都会回放）
+        snapshot_path, journal_path = CheckpointJournal.checkpoint_paths(runs[0])
+        return snapshot_path if os.path.exists(snapshot_path) else journal_path
+
+    def _checkpoint_runs(self, directory: str) -> List[str]:
+        """按最近修改时间排序的断点文件，同一运行的快照与日志只保留一个"""
+        latest: Dict[str, Tuple[float, str]] = {}
+        for path in glob.glob(os.path.join(directory, ".checkpoint_*.json*")):
+            if path.endswith(".tmp"):
+                continue
+            snapshot_path, _ = CheckpointJournal.checkpoint_paths(path)
+            mtime = os.path.getmtime(path)
+            if snapshot_path not in latest or mtime > latest[snapshot_path][0]:
+                latest[snapshot_path] = (mtime, path)
+        return [path for _, path in sorted(latest.values(), reverse=True)]
 
     def _flatten_json(self, data: Dict[str, Any], prefix: str = '') -> Dict[str, Any]:
         """
@@ -396,85 +2508,175 @@ class KeyGenerator:
         return flattened
 
     def _cleanup_old_checkpoints(self, directory: str, keep: int = 3):
-        """清理旧断点文件"""
-        checkpoints = glob.glob(os.path.join(directory, ".checkpoint_*.json"))
-        if len(checkpoints) <= keep:
+        """清理旧断点文件（按运行保留最近的快照与日志）"""
+        runs = self._checkpoint_runs(directory)
+        if len(runs) <= keep:
             return
 
         # 按修改时间排序，删除最旧的
-        checkpoints.sort(key=os.path.getmtime, reverse=True)
-        for old_checkpoint in checkpoints[keep:]:
-            try:
-                os.remove(old_checkpoint)
-            except:
-                pass
+        for old_checkpoint in runs[keep:]:
+            for path in CheckpointJournal.checkpoint_paths(old_checkpoint):
+                try:
+                    os.remove(path)
+                except:
+                    pass
+
+    # 导出时追加在原有列之后的结果列
+    RESULT_COLUMNS = ["召回Key", "状态", "错误信息", "生成耗时(秒)", "尝试次数"]
+
+    # 单行耗时分解的阶段与导出列名（export_phases 为True时追加在结果列之后）
+    PHASE_COLUMNS = {
+        "queue": "排队耗时(秒)",
+        "render": "渲染耗时(秒)",
+        "connect": "建连发送耗时(秒)",
+        "ttfb": "首字节耗时(秒)",
+        "ttft": "首Token等待(秒)",
+        "receive": "接收耗时(秒)",
+        "parse": "解析耗时(秒)",
+        "retry_wait": "重试等待(秒)"
+    }
+
+    def _flatten_result(self, result: GenerationResult) -> Dict[str, Any]:
+        """
+        扁平化单个结果的JSON字段（按需计算，不缓存，内存不随行数增长），同时增量更新JSON列集合
+        :param result: 生成结果
+        :return: 扁平化后的JSON字典，失败或无JSON时为空
+        """
+        flattened = self._flatten_json(result.parsed_result) if result.success and result.parsed_result else {}
+        if flattened:
+            with self._columns_lock:
+                self._json_columns.update(flattened)
+        return flattened
+
+    def _track_columns(self, result: GenerationResult):
+        """把结果的JSON列并入列集合并做标记，导出时不再为补齐列集合重复扁平化"""
+        self._flatten_result(result)
+        result._columns_token = self._columns_token
+
+    def _reset_json_columns(self):
+        """清空JSON列集合，之前标记过的结果需要重新并入"""
+        with self._columns_lock:
+            self._json_columns = set()
+            self._columns_token = object()
+
+    def _complete_columns(self, results):
+        """补齐未经过生成记录的结果（断点恢复等）的JSON列，已并入的结果不再扁平化"""
+        for result in results:
+            if result._columns_token is not self._columns_token:
+                self._track_columns(result)
+
+    def json_columns(self) -> List[str]:
+        """已出现过的JSON列（排序后的快照，可在生成中调用）"""
+        with self._columns_lock:
+            return sorted(self._json_columns)
+
+    @property
+    def result_columns(self) -> List[str]:
+        """导出的结果列：RESULT_COLUMNS，开启 export_phases 时加上各阶段耗时"""
+        if self.export_phases:
+            return self.RESULT_COLUMNS + list(self.PHASE_COLUMNS.values())
+        return self.RESULT_COLUMNS
+
+    def _base_cells(self, result: GenerationResult) -> List[Any]:
+        """result_columns 对应的基础结果值"""
+        cells = [
+            result.result,
+            "成功" if result.success else "失败",
+            result.error or "",
+            f"{result.generation_time:.2f}" if result.generation_time > 0 else "",
+            result.attempts
+        ]
+        if self.export_phases:
+            cells += [f"{result.phases[name]:.4f}" if name in result.phases else ""
+                      for name in self.PHASE_COLUMNS]
+        return cells
+
+    def _result_cells(self, result: GenerationResult, json_keys: List[str]) -> List[Any]:
+        """一行结果对应的导出单元格：基础结果列加JSON列"""
+        flattened = self._flatten_result(result)
+        return self._base_cells(result) + [str(flattened[key]) if key in flattened else None for key in json_keys]
+
+    def export_rows(self) -> Tuple[List[GenerationResult], List[str]]:
+        """
+        按行索引排序的结果（同一行只保留最新结果）与完整的JSON列
+        :return: (结果列表, 排序后的JSON列名)
+        """
+        results = {r.row_index: r for r in list(self.results) if r is not None}
+        self._complete_columns(results.values())
+        return [results[i] for i in sorted(results)], self.json_columns()
+
+    def export_record(self, result: GenerationResult) -> Dict[str, Any]:
+        """
+        一行结果的导出记录，供CSV/JSONL等按列名写出的格式使用
+        :param result: 生成结果
+        :return: {行索引, 原始输入列, 结果列, JSON.<扁平化键>} 字典，JSON值保留原始类型
+        """
+        record = {"行索引": result.row_index}
+        record.update((h, result.input_data.get(h, "")) for h in self.headers)
+        record.update(zip(self.result_columns, self._base_cells(result)))
+        record.update((f"JSON.{key}", value) for key, value in self._flatten_result(result).items())
+        return record
+
+    def add_result_listener(self, listener):
+        """注册结果监听：每记录一个结果（含补跑覆盖）时以 GenerationResult 调用"""
+        self._result_listeners.append(listener)
+
+    def remove_result_listener(self, listener):
+        if listener in self._result_listeners:
+            self._result_listeners.remove(listener)
 
     def export_result(self, output_path: str, input_path: Optional[str] = None) -> Tuple[bool, str]:
         """
         导出结果到xlsx
+        以write-only模式逐行写入，原文件以只读模式逐行读取，内存占用不随行数增长
         :param output_path: 输出文件路径
-        :param input_path: 输入文件路径（如果提供，则复制原文件结构）
+        :param input_path: 输入文件路径（如果提供，则保留原文件的全部列）
         :return: (成功, 消息)
         """
         try:
+            results = {r.row_index: r for r in list(self.results) if r is not None}
+            # 生成时已逐行记录JSON列；断点恢复等未经过生成的结果在这里补齐列集合，写出时每行再扁平化一次
+            self._complete_columns(results.values())
+
+            # 排序JSON键以便一致的列顺序
+            json_keys = self.json_columns()
+            result_header = self.result_columns + [f"JSON.{key}" for key in json_keys]
+
+            wb = openpyxl.Workbook(write_only=True)
+            sheet = wb.create_sheet(self._sheet_name or "Sheet")
+
             if input_path and os.path.exists(input_path):
-                # 复制原文件并添加结果列
-                wb = openpyxl.load_workbook(input_path)
-                sheet = wb.active
-                # 找到最后一列
-                base_col = sheet.max_column + 1
+                # 逐行复制原文件并在末尾追加结果列
+                source = openpyxl.load_workbook(input_path, read_only=True)
+                try:
+                    if self._sheet_name and self._sheet_name in source.sheetnames:
+                        source_sheet = source[self._sheet_name]
+                    else:
+                        source_sheet = source.active
+                    width = source_sheet.max_column or 0
+                    rows = source_sheet.iter_rows(values_only=True)
+
+                    header = list(next(rows, ()))
+                    width = max(width, len(header))
+                    sheet.append(header + [None] * (width - len(header)) + result_header)
+
+                    for row_index, values in enumerate(rows):
+                        values = list(values)
+                        values += [None] * (width - len(values))
+                        result = results.get(row_index)
+                        sheet.append(values + (self._result_cells(result, json_keys) if result else []))
+                finally:
+                    source.close()
             else:
-                # 创建新文件
-                wb = openpyxl.Workbook()
-                sheet = wb.active
-                # 写入表头
-                if self.headers:
-                    for col_idx, header in enumerate(self.headers, 1):
-                        sheet.cell(1, col_idx, header)
-                base_col = len(self.headers) + 1
-
-            # 首先添加基础结果列
-            sheet.cell(1, base_col, "召回Key")
-            sheet.cell(1, base_col + 1, "状态")
-            sheet.cell(1, base_col + 2, "错误信息")
-            sheet.cell(1, base_col + 3, "生成耗时(秒)")
-            
-            # 收集所有解析后的JSON键
-            json_keys = set()
-            for result in self.results:
-                if result and result.success and result.parsed_result:
-                    flattened = self._flatten_json(result.parsed_result)
-                    json_keys.update(flattened.keys())
-            
-            # 排序JSON键以便一致的列顺序
-            json_keys = sorted(json_keys)
-            
-            # 添加JSON列的表头
-            json_col = base_col + 4
-            json_key_map = {}
-            for i, key in enumerate(json_keys):
-                sheet.cell(1, json_col + i, f"JSON.{key}")
-                json_key_map[key] = json_col + i
-            
-            # 写入结果数据
-            for result in self.results:
-                if result is None:
-                    continue
-                
-                row_idx = result.row_index + 2  # +2 因为有表头且索引从0开始
-                
-                # 写入基础结果
-                sheet.cell(row_idx, base_col, result.result)
-                sheet.cell(row_idx, base_col + 1, "成功" if result.success else "失败")
-                sheet.cell(row_idx, base_col + 2, result.error or "")
-                sheet.cell(row_idx, base_col + 3, f"{result.generation_time:.2f}" if result.generation_time > 0 else "")
-                
-                # 写入解析后的JSON数据
-                if result.success and result.parsed_result:
-                    flattened = self._flatten_json(result.parsed_result)
-                    for key, value in flattened.items():
-                        if key in json_key_map:
-                            sheet.cell(row_idx, json_key_map[key], str(value))
+                # 没有原文件时按表头从结果中还原输入列
+                sheet.append(self.headers + result_header)
+                for row_index in range(max(results, default=-1) + 1):
+                    result = results.get(row_index)
+                    if result is None:
+                        sheet.append([])
+                        continue
+                    values = [result.input_data.get(h, "") for h in self.headers]
+                    sheet.append(values + self._result_cells(result, json_keys))
 
             wb.save(output_path)
             
@@ -486,26 +2688,74 @@ class KeyGenerator:
         except Exception as e:
             return False, f"导出失败: {e}"
 
+    @property
+    def is_generating(self) -> bool:
+        """是否正在批量生成"""
+        return self._is_generating
+
+    @property
+    def job_metrics(self):
+        """最近一次运行的指标注册表，未启用指标时为空"""
+        return self._job_metrics
+
     def get_progress(self) -> Dict[str, Any]:
-        """获取当前进度"""
-        completed_results = [r for r in self.results if r is not None]
-        completed = len(completed_results)
-        
-        # 计算总生成耗时
-        total_generation_time = sum(r.generation_time for r in completed_results if r.success)
-        avg_generation_time = total_generation_time / len([r for r in completed_results if r.success]) if completed > 0 else 0
-        
+        """获取当前进度（由增量统计直接读取，常数时间）"""
+        stats = self._progress.get_stats()
+        completed = stats["completed"]
+        throughput = stats["throughput"]
+        remaining = max(self.total_rows - completed, 0)
+
         return {
             "total": self.total_rows,
             "current": completed,
             "progress": round(completed / self.total_rows * 100, 2) if self.total_rows > 0 else 0,
-            "success": sum(1 for r in completed_results if r.success),
-            "error": sum(1 for r in completed_results if not r.success),
+            "success": stats["success"],
+            "error": stats["error"],
             "is_generating": self._is_generating,
-            "total_generation_time": round(total_generation_time, 2),
-            "avg_generation_time": round(avg_generation_time, 2)
+            "is_paused": self._is_generating and not self._run_event.is_set(),
+            "total_generation_time": round(stats["total_generation_time"], 2),
+            "avg_generation_time": round(stats["avg_generation_time"], 2),
+            "throughput": round(throughput, 2),  # 最近吞吐量（行/秒，EWMA）
+            "rows_per_second": round(stats["rows_per_second"], 2),  # 本次运行的平均吞吐量
+            "eta_seconds": round(remaining / throughput, 1) if self._is_generating and throughput > 0 else None,
+            "retries": stats["retries"],
+            "phases": {name: round(seconds, 4) for name, seconds in stats["phases"].items()},  # 每行各阶段平均耗时
+            # 本次运行的请求耗时分位数（秒）
+            "latency": self._job_metrics.get_stats()["histograms"].get("request_latency_seconds")
+            if self._job_metrics is not None else None,
+            # 流式响应的首Token耗时分位数（秒），未使用流式时为空
+            "ttft": self._job_metrics.get_stats()["histograms"].get("ttft_seconds")
+            if self._job_metrics is not None else None,
+            "batch": {
+                "id": self._batch.get("id"),
+                "status": self._batch.get("status"),
+                "request_counts": self._batch.get("request_counts")
+            } if self._batch is not None else None,  # 批处理模式下最近一次查询到的批处理状态
+            "packing": self._packing_stats(),
+            "requeued": self._run_requeued,
+            "deduplicated": self._run_deduplicated,
+            "skipped": len(self._skip_rows),
+            "concurrency": self._limiter.get_stats() if self._limiter else None,
+            "checkpoint": self._checkpoint_writer.get_stats() if self._checkpoint_writer else self._checkpoint_stats,
+            "cache": {
+                "hits": self._run_cache_hits,
+                "misses": self._run_cache_misses
+            } if self.cache is not None else None
         }
 
+    def _packing_stats(self) -> Optional[Dict[str, Any]]:
+        """多行打包节省的请求数与Prompt字符数，未打包时为空"""
+        with self._stats_lock:
+            if self._run_packing is None:
+                return None
+            stats = dict(self._run_packing)
+        # 不打包时每行一个请求：节省的请求数 = 打包拆出的行数 - 打包请求数
+        stats["requests_saved"] = stats["rows"] - stats["requests"]
+        stats["prompt_chars_saved"] = stats["unpacked_prompt_chars"] - stats["prompt_chars"]
+        stats["prompt_chars_saved_ratio"] = round(
+            stats["prompt_chars_saved"] / stats["unpacked_prompt_chars"], 4) if stats["unpacked_prompt_chars"] else 0
+        return stats
+
     def clear(self):
         """清空状态"""
         self.input_data = []
@@ -513,4 +2763,14 @@ class KeyGenerator:
         self.results = []
         self.total_rows = 0
         self._current_file = None
+        self._sheet_name = None
+        self._streaming = False
         self._is_generating = False
+        self._resume_results = {}
+        self._skip_rows = set()
+        self._reset_json_columns()
+        self._progress.reset()
+        self.checkpoint_template = ""
+        self.checkpoint_variables = {}
+        self._job_metrics = None
+        self._batch = None
@@ -0,0 +1,376 @@
+"""
+多任务调度模块
+每次上传创建一个独立任务（生成器、模板、工作目录与状态各自独立），
+所有任务的API请求共享一个全局并发预算，按优先级加权公平分配
+"""
+
+import os
+import time
+import uuid
+import asyncio
+import contextlib
+import itertools
+import threading
+import collections
+from typing import Any, Callable, Dict, List, Optional
+
+# 既作为包内模块（AIGC_batch.jobs）导入，也由 app.py 按顶层模块导入
+try:
+    from .api_clients import _wake_future
+except ImportError:
+    from api_clients import _wake_future
+
+
+class BudgetShare:
+    """单个任务在全局并发预算中的份额，由生成器在每次请求前后获取与归还"""
+
+    def __init__(self, budget: 'ConcurrencyBudget', job_id: str, weight: float = 1.0):
+        self.budget = budget
+        self.job_id = job_id
+        self.weight = weight
+        self.in_flight = 0  # 已分配（在途）的名额
+        self.granted = 0  # 累计分配次数
+        self._waiting = 0  # 排队等待的请求数
+        self._tickets = 0  # 已分配但尚未被等待方取走的名额
+        self._last_grant = 0  # 最近一次分配的序号，权重比相同时轮流分配
+        self._async_waiters = collections.deque()  # 异步等待方的 (事件循环, Future)，分配名额时唤醒
+
+    @property
+    def limit(self) -> int:
+        """全局并发上限（连接池按此大小创建，多个任务共用同一连接池）"""
+        return self.budget.limit
+
+    def acquire(self):
+        """获取一个名额，没有空闲名额时阻塞等待分配"""
+        with self.budget._condition:
+            self._waiting += 1
+            self.budget._dispatch()
+            while self._tickets == 0:
+                self.budget._condition.wait()
+            self._tickets -= 1
+
+    async def aacquire(self):
+        """异步获取一个名额（asyncio引擎使用，不阻塞事件循环，分配名额时由 Future 唤醒）"""
+        loop = asyncio.get_running_loop()
+        future = None
+        with self.budget._condition:
+            self._waiting += 1
+            self.budget._dispatch()
+        try:
+            while True:
+                with self.budget._condition:
+                    if self._tickets > 0:
+                        self._tickets -= 1
+                        return
+                    future = loop.create_future()
+                    self._async_waiters.append((loop, future))
+                await future
+        except asyncio.CancelledError:
+            # 等待中被取消：撤回排队，已分配的名额归还
+            with self.budget._condition:
+                with contextlib.suppress(ValueError):
+                    self._async_waiters.remove((loop, future))
+                if self._tickets > 0:
+                    self._tickets -= 1
+                    self.budget._release(self)
+                else:
+                    self._waiting -= 1
+            raise
+
+    def _wake(self):
+        # 调用方持有锁：新分配了名额，唤醒一个异步等待方（可能在其他线程的事件循环中）
+        while self._async_waiters:
+            loop, future = self._async_waiters.popleft()
+            # 事件循环已关闭时跳过该等待方
+            if _wake_future(loop, future):
+                return
+
+    def release(self):
+        """归还一个名额"""
+        with self.budget._condition:
+            self.budget._release(self)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "weight": self.weight,
+            "in_flight": self.in_flight,
+            "waiting": self._waiting,
+            "granted": self.granted
+        }
+
+
+class ConcurrencyBudget:
+    """
+    多任务共享的全局并发预算
+    有空闲名额时分配给（分配后）在途数/权重 最小的等待任务，权重相同时轮流分配；
+    只有一个任务在请求时它可以用满全部名额
+    """
+
+    def __init__(self, limit: int = 64):
+        """
+        :param limit: 所有任务合计的最大在途请求数
+        """
+        self.limit = max(1, int(limit))
+        self._in_use = 0
+        self._shares: Dict[str, BudgetShare] = {}
+        self._condition = threading.Condition()
+        self._sequence = itertools.count(1)
+
+    def share(self, job_id: str, weight: float = 1.0) -> BudgetShare:
+        """为任务创建份额"""
+        with self._condition:
+            share = BudgetShare(self, job_id, weight)
+            self._shares[job_id] = share
+            return share
+
+    def remove(self, job_id: str):
+        """移除任务的份额（任务删除时）"""
+        with self._condition:
+            self._shares.pop(job_id, None)
+
+    def set_weight(self, job_id: str, weight: float):
+        """调整任务权重，立即影响之后的分配"""
+        with self._condition:
+            share = self._shares.get(job_id)
+            if share is not None:
+                share.weight = weight
+                self._dispatch()
+
+    def set_limit(self, limit: int):
+        """调整全局并发上限（调小时在途请求完成后生效）"""
+        with self._condition:
+            self.limit = max(1, int(limit))
+            self._dispatch()
+
+    def _release(self, share: BudgetShare):
+        # 调用方持有锁
+        share.in_flight -= 1
+        self._in_use -= 1
+        self._dispatch()
+
+    def _dispatch(self):
+        # 调用方持有锁：把空闲名额逐个分配给最欠额的等待任务
+        granted = False
+        while self._in_use < self.limit:
+            waiting = [s for s in self._shares.values() if s._waiting > 0]
+            if not waiting:
+                break
+            # 分配后 在途数/权重 最小者优先，权重相同时轮流
+            share = min(waiting, key=lambda s: ((s.in_flight + 1) / s.weight, s._last_grant))
+            share._waiting -= 1
+            share._tickets += 1
+            share.in_flight += 1
+            share.granted += 1
+            share._last_grant = next(self._sequence)
+            self._in_use += 1
+            share._wake()
+            granted = True
+        if granted:
+            self._condition.notify_all()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._condition:
+            return {
+                "limit": self.limit,
+                "in_use": self._in_use,
+                "waiting": sum(s._waiting for s in self._shares.values()),
+                "jobs": {job_id: s.get_stats() for job_id, s in self._shares.items()}
+            }
+
+
+class Job:
+    """一个生成任务：独立的生成器、Prompt模板、工作目录（上传文件与断点）与状态"""
+
+    def __init__(self, job_id: str, generator, work_dir: str, name: str = "",
+                 priority: str = "normal", broadcaster=None):
+        """
+        :param job_id: 任务ID
+        :param generator: 该任务的 KeyGenerator
+        :param work_dir: 工作目录，上传文件保存在此，断点随之写在此目录
+        :param name: 任务名称（如上传的文件名）
+        :param priority: 优先级（low/normal/high）
+        :param broadcaster: 该任务的进度推送（ProgressBroadcaster），可选
+        """
+        self.job_id = job_id
+        self.generator = generator
+        self.work_dir = work_dir
+        self.name = name
+        self.priority = priority
+        self.broadcaster = broadcaster
+        self.created_at = time.time()
+        self.prompt_template = ""
+        self.variable_mapping: Dict[str, str] = {}
+        self.input_file = ""
+        self.output_file = ""
+        self.status_message = ""
+        self.generation_status = "idle"  # idle, file_loaded, previewing, generating, paused, completed, cancelled, error
+        self._run_lock = threading.Lock()
+        self._run_claimed = False  # 已有请求占用本任务启动生成（后台线程结束时释放）
+
+    @property
+    def generation_status(self) -> str:
+        return self._generation_status
+
+    @generation_status.setter
+    def generation_status(self, status: str):
+        # 状态变化推送给该任务的进度流
+        self._generation_status = status
+        if self.broadcaster is not None:
+            self.broadcaster.publish_state(status, self.status_message)
+
+    def set_status(self, status: str, message: Optional[str] = None):
+        """
+        更新任务状态，先更新说明再推送，进度流收到的状态事件带有本次的说明
+        :param message: 状态说明，为空时保留原说明
+        """
+        if message is not None:
+            self.status_message = message
+        self.generation_status = status
+
+    @property
+    def is_running(self) -> bool:
+        return self._run_claimed or self.generator.is_generating
+
+    def claim_run(self) -> bool:
+        """
+        占用本任务以启动一次生成，检查与占用在同一把锁内完成
+        :return: 已在生成（或已被其他请求占用）时返回 False
+        """
+        with self._run_lock:
+            if self.is_running:
+                return False
+            self._run_claimed = True
+            return True
+
+    def release_run(self):
+        """生成结束（或启动失败）时释放占用"""
+        with self._run_lock:
+            self._run_claimed = False
+
+    def reset(self):
+        """重置任务状态"""
+        self.generator.clear()
+        self.prompt_template = ""
+        self.variable_mapping = {}
+        self.set_status("idle", "")
+
+    def to_dict(self) -> Dict[str, Any]:
+        progress = self.generator.get_progress()
+        return {
+            "job_id": self.job_id,
+            "name": self.name,
+            "priority": self.priority,
+            "status": self.generation_status,
+            "message": self.status_message,
+            "created_at": self.created_at,
+            "total": progress["total"],
+            "current": progress["current"],
+            "progress": progress["progress"],
+            "throughput": progress["throughput"]
+        }
+
+
+class JobManager:
+    """任务管理：创建、查找、删除任务，并为每个任务分配全局并发预算的份额"""
+
+    # 优先级对应的分配权重
+    PRIORITIES = {"low": 1, "normal": 2, "high": 4}
+
+    def __init__(self, base_dir: str, generator_factory: Callable[[str, Optional[BudgetShare]], Any],
+                 budget: Optional[ConcurrencyBudget] = None,
+                 broadcaster_factory: Optional[Callable[[], Any]] = None, max_jobs: int = 50):
+        """
+        :param base_dir: 任务工作目录的根目录，每个任务一个子目录
+        :param generator_factory: 创建生成器的函数 (任务ID, 预算份额) -> KeyGenerator
+        :param budget: 全局并发预算，为空时各任务互不限制
+        :param broadcaster_factory: 创建任务进度推送的函数，可选
+        :param max_jobs: 保留的任务数上限，超出时移除最早的未运行任务
+        """
+        self.base_dir = base_dir
+        self.generator_factory = generator_factory
+        self.budget = budget
+        self.broadcaster_factory = broadcaster_factory
+        self.max_jobs = max_jobs
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+
+    def _weight(self, priority: str) -> float:
+        if priority not in self.PRIORITIES:
+            raise ValueError(f"不支持的优先级: {priority}，可选 {'/'.join(self.PRIORITIES)}")
+        return self.PRIORITIES[priority]
+
+    def create(self, name: str = "", priority: str = "normal") -> Job:
+        """
+        创建任务
+        :param name: 任务名称
+        :param priority: 优先级（low/normal/high）
+        :return: 新任务
+        :raises ValueError: 优先级无效
+        """
+        weight = self._weight(priority)
+        job_id = uuid.uuid4().hex[:12]
+        work_dir = os.path.join(self.base_dir, job_id)
+        os.makedirs(work_dir, exist_ok=True)
+
+        share = self.budget.share(job_id, weight) if self.budget is not None else None
+        generator = self.generator_factory(job_id, share)
+        broadcaster = self.broadcaster_factory() if self.broadcaster_factory else None
+        if broadcaster is not None:
+            generator.add_result_listener(broadcaster.publish_row)
+        job = Job(job_id, generator, work_dir, name=name, priority=priority, broadcaster=broadcaster)
+
+        with self._lock:
+            self._jobs[job_id] = job
+            self._evict()
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def latest(self) -> Optional[Job]:
+        """最近创建的任务"""
+        with self._lock:
+            return max(self._jobs.values(), key=lambda j: j.created_at, default=None)
+
+    def list(self) -> List[Job]:
+        """按创建时间排列的全部任务"""
+        with self._lock:
+            return sorted(self._jobs.values(), key=lambda j: j.created_at)
+
+    def set_priority(self, job: Job, priority: str):
+        """
+        调整任务优先级
+        :raises ValueError: 优先级无效
+        """
+        weight = self._weight(priority)
+        job.priority = priority
+        if self.budget is not None:
+            self.budget.set_weight(job.job_id, weight)
+
+    def remove(self, job_id: str) -> bool:
+        """
+        删除任务（工作目录中的文件与断点保留）
+        :return: 是否删除；任务不存在或正在运行时返回False
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.is_running:
+                return False
+            self._drop(job)
+            return True
+
+    def _drop(self, job: Job):
+        # 调用方持有锁
+        del self._jobs[job.job_id]
+        if self.budget is not None:
+            self.budget.remove(job.job_id)
+
+    def _evict(self):
+        # 调用方持有锁：任务数超出上限时移除最早的未运行任务
+        excess = len(self._jobs) - self.max_jobs
+        if excess <= 0:
+            return
+        idle = sorted((j for j in self._jobs.values() if not j.is_running), key=lambda j: j.created_at)
+        for job in idle[:excess]:
+            self._drop(job)
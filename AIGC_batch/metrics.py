@@ -0,0 +1,208 @@
+"""
+指标统计模块
+延迟直方图与计数器，按进程与单次任务两级汇总，可输出为Prometheus文本格式（/metrics）
+"""
+
+import bisect
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+# 默认的延迟分桶上界（秒）
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# 指标说明，用于 # HELP 行
+HELP = {
+    "request_latency_seconds": "单次API请求耗时（含重试中的每次尝试）",
+    "render_seconds": "Prompt渲染耗时",
+    "parse_seconds": "响应JSON解析耗时",
+    "checkpoint_seconds": "断点日志单次刷盘或压缩耗时",
+    "requests_total": "API请求次数，按HTTP状态类别",
+    "retries_total": "行内重试次数",
+    "rows_total": "完成的行数，按结果状态",
+    "packed_rows_total": "多行打包请求处理的行数，按结果（packed：由打包响应拆出，fallback：退回逐行请求）",
+    "tokens_total": "消耗的token数，按类型",
+    "ttft_seconds": "流式响应从发出请求到首个Token的耗时",
+    "stream_early_stops_total": "流式响应在JSON完整后提前关闭的次数",
+}
+
+
+class Histogram:
+    """固定分桶的直方图"""
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)  # 最后一个为 +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> Optional[float]:
+        """按分桶线性插值估算分位数"""
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        cumulative = 0
+        for i, bucket_count in enumerate(self.counts):
+            if cumulative + bucket_count >= rank and bucket_count > 0:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                if i == len(self.buckets):
+                    return lower  # 落在 +Inf 桶中时只能给出下界
+                upper = self.buckets[i]
+                return lower + (upper - lower) * (rank - cumulative) / bucket_count
+            cumulative += bucket_count
+        return self.buckets[-1]
+
+    def get_stats(self) -> Dict[str, Any]:
+        def rounded(value):
+            return round(value, 4) if value is not None else None
+
+        return {
+            "count": self.count,
+            "avg": round(self.sum / self.count, 4) if self.count else None,
+            "p50": rounded(self.quantile(0.5)),
+            "p95": rounded(self.quantile(0.95)),
+            "p99": rounded(self.quantile(0.99))
+        }
+
+
+class MetricsRegistry:
+    """
+    指标注册表，线程安全
+    子注册表（单次任务）记录的指标同时累加到父注册表（进程级）
+    """
+
+    def __init__(self, prefix: str = "aigc", parent: Optional['MetricsRegistry'] = None,
+                 labels: Optional[Dict[str, str]] = None):
+        """
+        :param prefix: 指标名前缀
+        :param parent: 父注册表
+        :param labels: 附加到所有指标上的标签
+        """
+        self.prefix = prefix
+        self.parent = parent
+        self.labels = labels or {}
+        self._histograms: Dict[str, Histogram] = {}
+        self._counters: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = {}
+        self._lock = threading.Lock()
+
+    def child(self, **labels) -> 'MetricsRegistry':
+        """创建单次任务的子注册表"""
+        return MetricsRegistry(prefix=f"{self.prefix}_job", parent=self, labels=labels)
+
+    def observe(self, name: str, value: float):
+        """记录一次耗时"""
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = Histogram()
+            histogram.observe(value)
+        if self.parent is not None:
+            self.parent.observe(name, value)
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        """累加计数器"""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+        if self.parent is not None:
+            self.parent.inc(name, amount, **labels)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取各直方图的分位数与计数器的值"""
+        with self._lock:
+            histograms = {name: h.get_stats() for name, h in self._histograms.items()}
+            counters: Dict[str, Any] = {}
+            for (name, labels), value in self._counters.items():
+                if labels:
+                    counters.setdefault(name, {})[",".join(v for _, v in labels)] = value
+                else:
+                    counters[name] = value
+        return {"histograms": histograms, "counters": counters}
+
+    @staticmethod
+    def _format_labels(labels: Dict[str, Any]) -> str:
+        if not labels:
+            return ""
+        escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for v in labels.values())
+        return "{" + ",".join(f'{k}="{v}"' for k, v in zip(labels.keys(), escaped)) + "}"
+
+    def families(self, extra_counters: Optional[List[Tuple[str, Dict[str, str], float]]] = None
+                 ) -> Dict[str, Tuple[str, str, List[str]]]:
+        """
+        按指标族整理的样本行
+        :param extra_counters: 额外的计数器 [(名称, 标签, 值)]（如API客户端统计的token数）
+        :return: {完整指标名: (类型, 说明, 样本行)}
+        """
+        result: Dict[str, Tuple[str, str, List[str]]] = {}
+        with self._lock:
+            for name, histogram in self._histograms.items():
+                full_name = f"{self.prefix}_{name}"
+                lines = []
+                cumulative = 0
+                bounds = [repr(float(b)) for b in histogram.buckets] + ["+Inf"]
+                for bound, count in zip(bounds, histogram.counts):
+                    cumulative += count
+                    labels = self._format_labels({**self.labels, "le": bound})
+                    lines.append(f"{full_name}_bucket{labels} {cumulative}")
+                labels = self._format_labels(self.labels)
+                lines.append(f"{full_name}_sum{labels} {histogram.sum}")
+                lines.append(f"{full_name}_count{labels} {histogram.count}")
+                result[full_name] = ("histogram", HELP.get(name, name), lines)
+
+            counters = [(name, dict(labels), value) for (name, labels), value in self._counters.items()]
+        for name, labels, value in counters + list(extra_counters or []):
+            full_name = f"{self.prefix}_{name}"
+            family = result.setdefault(full_name, ("counter", HELP.get(name, name), []))
+            family[2].append(f"{full_name}{self._format_labels({**self.labels, **labels})} {value}")
+        return result
+
+    def render(self, extra_counters: Optional[List[Tuple[str, Dict[str, str], float]]] = None) -> str:
+        """
+        输出Prometheus文本格式
+        :param extra_counters: 额外的计数器 [(名称, 标签, 值)]（如API客户端统计的token数）
+        :return: 文本
+        """
+        return render_families(self.families(extra_counters))
+
+
+def render_families(*family_groups: Dict[str, Tuple[str, str, List[str]]]) -> str:
+    """
+    合并多组指标族后输出，同名指标族（如多个任务的 aigc_job_*）只输出一次 HELP/TYPE
+    :param family_groups: MetricsRegistry.families() 的返回值
+    :return: Prometheus文本
+    """
+    merged: Dict[str, Tuple[str, str, List[str]]] = {}
+    for families in family_groups:
+        for full_name, (kind, help_text, lines) in families.items():
+            merged.setdefault(full_name, (kind, help_text, []))[2].extend(lines)
+
+    output = []
+    for full_name in sorted(merged):
+        kind, help_text, lines = merged[full_name]
+        output.append(f"# HELP {full_name} {help_text}")
+        output.append(f"# TYPE {full_name} {kind}")
+        output.extend(lines)
+    return "\n".join(output) + "\n" if output else ""
+
+
+def gauge_families(prefix: str, gauges: Dict[str, Tuple[str, List[Tuple[Dict[str, str], Any]]]]
+                   ) -> Dict[str, Tuple[str, str, List[str]]]:
+    """
+    瞬时值指标族
+    :param prefix: 指标名前缀
+    :param gauges: {名称: (说明, [(标签, 值)])}，值为空的样本不输出
+    :return: 可传给 render_families 的指标族
+    """
+    result = {}
+    for name, (help_text, samples) in gauges.items():
+        full_name = f"{prefix}_{name}"
+        lines = [f"{full_name}{MetricsRegistry._format_labels(labels)} {value}"
+                 for labels, value in samples if value is not None]
+        if lines:
+            result[full_name] = ("gauge", help_text, lines)
+    return result
@@ -0,0 +1,121 @@
+"""
+进度推送模块
+生成线程发布行完成事件与任务状态变化，每个SSE连接按节流间隔合并推送：
+行完成事件批量发送，进度只发送变化的字段，状态变化逐条发送
+"""
+
+import json
+import time
+import itertools
+import threading
+from collections import deque
+from typing import Any, Callable, Dict, Iterator, Optional
+
+
+class ProgressBroadcaster:
+    """进度事件广播，线程安全"""
+
+    def __init__(self, min_interval: float = 0.25, max_rows_per_event: int = 200,
+                 buffer_size: int = 10000, heartbeat: float = 15.0):
+        """
+        :param min_interval: 同一连接两次推送的最小间隔（秒）
+        :param max_rows_per_event: 每次推送最多携带的行事件数，超出部分只计数
+        :param buffer_size: 缓存的最近事件数，连接落后太多时丢弃最旧的事件
+        :param heartbeat: 无事件时发送心跳的间隔（秒）
+        """
+        self.min_interval = min_interval
+        self.max_rows_per_event = max_rows_per_event
+        self.heartbeat = heartbeat
+        self._events: deque = deque(maxlen=buffer_size)  # (序号, 类型, 数据)
+        self._seq = 0
+        self._condition = threading.Condition()
+
+    def _publish(self, kind: str, data: Dict[str, Any]):
+        with self._condition:
+            self._seq += 1
+            self._events.append((self._seq, kind, data))
+            self._condition.notify_all()
+
+    def publish_row(self, result):
+        """行完成事件（注册为 KeyGenerator 的结果监听）"""
+        self._publish("row", {
+            "row": result.row_index,
+            "status": "success" if result.success else "error",
+            "latency": round(result.generation_time, 3),
+            "error_type": result.error_type
+        })
+
+    def publish_state(self, status: str, message: str = ""):
+        """任务状态变化事件"""
+        self._publish("state", {"status": status, "message": message})
+
+    def notify(self, *args):
+        """进度有更新（作为 on_progress 回调），唤醒等待中的连接"""
+        with self._condition:
+            self._condition.notify_all()
+
+    def _events_since(self, cursor: int):
+        """取序号大于 cursor 的事件，返回 (事件列表, 因缓存溢出丢失的事件数)"""
+        with self._condition:
+            if not self._events or self._seq <= cursor:
+                return [], 0
+            first_seq = self._events[0][0]
+            skipped = max(first_seq - cursor - 1, 0)
+            start = max(cursor + 1 - first_seq, 0)
+            return list(itertools.islice(self._events, start, None)), skipped
+
+    @staticmethod
+    def format_event(kind: str, data: Any) -> str:
+        return f"event: {kind}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+    def stream(self, progress_fn: Callable[[], Dict[str, Any]],
+               stop: Optional[Callable[[], bool]] = None) -> Iterator[str]:
+        """
+        单个SSE连接的事件流
+        :param progress_fn: 获取当前进度的函数（需为常数时间）
+        :param stop: 返回True时结束事件流
+        :return: SSE文本片段迭代器
+        """
+        with self._condition:
+            cursor = self._seq
+        last_progress = progress_fn()
+        yield self.format_event("progress", last_progress)
+        last_sent = time.time()
+
+        while stop is None or not stop():
+            with self._condition:
+                if self._seq <= cursor:
+                    self._condition.wait(self.heartbeat)
+
+            # 节流：距上次推送不足最小间隔时先等待，期间到达的事件合并到同一次推送
+            wait = self.min_interval - (time.time() - last_sent)
+            if wait > 0:
+                time.sleep(wait)
+
+            events, skipped = self._events_since(cursor)
+            if events:
+                cursor = events[-1][0]
+
+            rows = [data for _, kind, data in events if kind == "row"]
+            for _, kind, data in events:
+                if kind == "state":
+                    yield self.format_event("state", data)
+
+            progress = progress_fn()
+            delta = {k: v for k, v in progress.items() if last_progress.get(k) != v}
+            last_progress = progress
+
+            if rows or skipped:
+                dropped = skipped + max(len(rows) - self.max_rows_per_event, 0)
+                yield self.format_event("rows", {
+                    "rows": rows[-self.max_rows_per_event:],
+                    "dropped": dropped
+                })
+            if delta:
+                yield self.format_event("progress", delta)
+
+            if events or delta:
+                last_sent = time.time()
+            elif time.time() - last_sent >= self.heartbeat:
+                yield ": heartbeat\n\n"
+                last_sent = time.time()
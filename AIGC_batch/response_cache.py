@@ -0,0 +1,156 @@
+"""
+响应缓存模块
+以 (渲染后的Prompt, 模型, temperature, max_tokens) 的哈希为键，将API响应持久化到本地SQLite
+重新运行表格时，Prompt未变化的行直接复用之前的结果
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Optional
+
+
+class ResponseCache:
+    """基于SQLite的内容寻址响应缓存，线程安全"""
+
+    def __init__(self, db_path: str, max_entries: int = 200000, max_bytes: int = 512 * 1024 * 1024,
+                 max_age: float = 30 * 24 * 3600, evict_interval: int = 500):
+        """
+        :param db_path: SQLite文件路径
+        :param max_entries: 最大缓存条数
+        :param max_bytes: 缓存响应的最大总字节数
+        :param max_age: 缓存最长保留时间（秒）
+        :param evict_interval: 每写入多少条执行一次淘汰
+        """
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.evict_interval = evict_interval
+        self._lock = threading.Lock()
+        self._writes_since_evict = 0
+        self.hits = 0
+        self.misses = 0
+
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY,"
+            " response TEXT NOT NULL,"
+            " model TEXT,"
+            " size INTEGER NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses(accessed_at)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_created ON responses(created_at)")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(prompt: str, model: str, temperature: float, max_tokens: int) -> str:
+        """计算缓存键"""
+        payload = json.dumps([prompt, model, temperature, max_tokens], ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        读取缓存
+        :param key: make_key 计算的缓存键
+        :return: 缓存的响应，未命中或已过期时为空
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or now - row[1] > self.max_age:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def set(self, key: str, response: str, model: str = ""):
+        """写入缓存（同键覆盖）"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, response, model, size, created_at, accessed_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (key, response, model, len(response.encode('utf-8')), now, now)
+            )
+            self._conn.commit()
+            self._writes_since_evict += 1
+            if self._writes_since_evict >= self.evict_interval:
+                self._evict()
+
+    def evict(self):
+        """按保留时间、条数与总大小淘汰缓存"""
+        with self._lock:
+            self._evict()
+
+    def _evict(self):
+        self._writes_since_evict = 0
+        self._conn.execute("DELETE FROM responses WHERE created_at < ?", (time.time() - self.max_age,))
+
+        count, total_bytes = self._conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()
+
+        # 超出条数上限时按最近访问时间淘汰最久未使用的条目
+        if count > self.max_entries:
+            self._conn.execute(
+                "DELETE FROM responses WHERE key IN"
+                " (SELECT key FROM responses ORDER BY accessed_at LIMIT ?)",
+                (count - self.max_entries,)
+            )
+            total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+        # 超出大小上限时逐批淘汰，直到回到上限以内
+        while total_bytes > self.max_bytes:
+            rows = self._conn.execute(
+                "SELECT key, size FROM responses ORDER BY accessed_at LIMIT 500"
+            ).fetchall()
+            if not rows:
+                break
+            evicted = []
+            for key, size in rows:
+                evicted.append((key,))
+                total_bytes -= size
+                if total_bytes <= self.max_bytes:
+                    break
+            self._conn.executemany("DELETE FROM responses WHERE key = ?", evicted)
+
+        self._conn.commit()
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+    def get_stats(self) -> dict:
+        """获取缓存统计"""
+        with self._lock:
+            count, total_bytes = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+            return {
+                "entries": count,
+                "bytes": total_bytes,
+                "hits": self.hits,
+                "misses": self.misses
+            }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
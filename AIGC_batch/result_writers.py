@@ -0,0 +1,237 @@
+"""
+结果输出模块
+将生成结果流式写出为 CSV / JSONL / Parquet（列式，需要安装pyarrow），
+列与JSON扁平化规则与xlsx导出一致；ResultTailer 可在生成过程中持续追加已完成的结果
+"""
+
+import os
+import csv
+import json
+import queue
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+# 支持的输出格式（按文件扩展名或显式参数选择）
+FORMATS = ("xlsx", "csv", "jsonl", "parquet")
+
+# 可以边生成边追加写入的格式
+TAIL_FORMATS = ("csv", "jsonl")
+
+# Parquet 每个行组的行数
+PARQUET_ROW_GROUP = 10000
+
+
+def detect_format(output_path: str, fmt: Optional[str] = None) -> str:
+    """
+    确定输出格式：显式参数优先，否则按扩展名判断
+    :param output_path: 输出文件路径
+    :param fmt: 输出格式
+    :return: 格式名称
+    """
+    if not fmt:
+        fmt = os.path.splitext(output_path)[1].lstrip(".").lower() or "xlsx"
+    fmt = fmt.lower()
+    if fmt == "json":
+        fmt = "jsonl"
+    if fmt not in FORMATS:
+        raise ValueError(f"不支持的输出格式: {fmt}")
+    return fmt
+
+
+def _columns(generator, json_keys: List[str]) -> List[str]:
+    return ["行索引"] + list(generator.headers) + list(generator.result_columns) + [f"JSON.{k}" for k in json_keys]
+
+
+def _open_csv(output_path: str, mode: str = 'w'):
+    # utf-8-sig 便于Excel直接打开中文CSV
+    return open(output_path, mode, encoding='utf-8-sig' if mode == 'w' else 'utf-8', newline='')
+
+
+def _write_csv(generator, output_path: str):
+    results, json_keys = generator.export_rows()
+    with _open_csv(output_path) as f:
+        writer = csv.DictWriter(f, fieldnames=_columns(generator, json_keys), restval="")
+        writer.writeheader()
+        for result in results:
+            writer.writerow(generator.export_record(result))
+
+
+def _write_jsonl(generator, output_path: str):
+    results, _ = generator.export_rows()
+    with open(output_path, 'w', encoding='utf-8') as f:
+        for result in results:
+            f.write(json.dumps(generator.export_record(result), ensure_ascii=False, default=str) + "\n")
+
+
+def _write_parquet(generator, output_path: str):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("导出Parquet需要安装pyarrow（pip install pyarrow）")
+
+    results, json_keys = generator.export_rows()
+    columns = _columns(generator, json_keys)
+    # 行索引与尝试次数为整数，其余列统一为字符串，避免不同行的JSON值类型不一致
+    int_columns = {"行索引", "尝试次数"}
+    schema = pa.schema([(c, pa.int64() if c in int_columns else pa.string()) for c in columns])
+
+    def convert(column, value):
+        if value is None or column in int_columns:
+            return value
+        return value if isinstance(value, str) else json.dumps(value, ensure_ascii=False)
+
+    with pq.ParquetWriter(output_path, schema) as writer:
+        for start in range(0, len(results), PARQUET_ROW_GROUP):
+            records = [generator.export_record(r) for r in results[start:start + PARQUET_ROW_GROUP]]
+            arrays = {c: [convert(c, record.get(c)) for record in records] for c in columns}
+            writer.write_table(pa.table(arrays, schema=schema))
+
+
+def export_results(generator, output_path: str, fmt: Optional[str] = None,
+                   input_path: Optional[str] = None) -> Tuple[bool, str]:
+    """
+    按格式导出结果
+    :param generator: KeyGenerator
+    :param output_path: 输出文件路径
+    :param fmt: 输出格式（xlsx/csv/jsonl/parquet），为空时按扩展名判断
+    :param input_path: 输入文件路径（仅xlsx使用，用于保留原文件的全部列）
+    :return: (成功, 消息)
+    """
+    try:
+        fmt = detect_format(output_path, fmt)
+        if fmt == "xlsx":
+            return generator.export_result(output_path, input_path)
+
+        writers = {"csv": _write_csv, "jsonl": _write_jsonl, "parquet": _write_parquet}
+        writers[fmt](generator, output_path)
+        return True, f"结果已保存至: {output_path}"
+
+    except Exception as e:
+        return False, f"导出失败: {e}"
+
+
+class ResultTailer:
+    """
+    边生成边写出结果
+    注册为生成器的结果监听，后台线程把新完成的结果批量追加到CSV/JSONL文件；
+    补跑覆盖的行会再追加一次，结束时若出现过重复行或新的JSON列，按最终结果整体重写一次
+    """
+
+    def __init__(self, generator, output_path: str, fmt: Optional[str] = None, flush_interval: float = 1.0):
+        """
+        :param generator: KeyGenerator
+        :param output_path: 输出文件路径
+        :param fmt: 输出格式（csv/jsonl），为空时按扩展名判断
+        :param flush_interval: 最长刷盘间隔（秒）
+        """
+        self.generator = generator
+        self.output_path = output_path
+        self.fmt = detect_format(output_path, fmt)
+        if self.fmt not in TAIL_FORMATS:
+            raise ValueError(f"{self.fmt} 格式不支持边生成边写入，请使用 {'/'.join(TAIL_FORMATS)}")
+        self.flush_interval = flush_interval
+        self.rows_written = 0
+        self._queue: queue.Queue = queue.Queue()
+        self._written_rows: set = set()
+        self._columns: Optional[List[str]] = None  # CSV表头，首批结果到达时确定
+        self._dirty = False  # 是否需要在结束时整体重写
+        self._file = None
+        self._writer = None
+        self._thread: Optional[threading.Thread] = None
+        self.error: Optional[Exception] = None
+
+    def start(self) -> 'ResultTailer':
+        """开始监听并写出结果"""
+        if self.fmt == "csv":
+            self._file = _open_csv(self.output_path)
+        else:
+            self._file = open(self.output_path, 'w', encoding='utf-8')
+        self.generator.add_result_listener(self._queue.put)
+        self._thread = threading.Thread(target=self._run, name="result-tailer", daemon=True)
+        self._thread.start()
+        return self
+
+    def close(self) -> Tuple[bool, str]:
+        """
+        停止监听，写完剩余结果；有重复行或新增列时按最终结果重写文件
+        :return: (成功, 消息)
+        """
+        self.generator.remove_result_listener(self._queue.put)
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+        if self.error is not None:
+            return False, f"结果写出失败: {self.error}"
+        if self._dirty:
+            return export_results(self.generator, self.output_path, self.fmt)
+        return True, f"结果已保存至: {self.output_path}"
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            try:
+                batch = [self._queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                continue
+            # 合并队列中已有的结果，一次写入
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if None in batch:
+                stopping = True
+                batch = [r for r in batch if r is not None]
+            if not batch or self.error is not None:
+                continue
+            try:
+                self._write(batch)
+            except Exception as e:
+                self.error = e
+
+    def _write(self, batch):
+        records = []
+        for result in batch:
+            if result.row_index in self._written_rows:
+                self._dirty = True
+            self._written_rows.add(result.row_index)
+            records.append(self.generator.export_record(result))
+
+        if self.fmt == "jsonl":
+            for record in records:
+                self._file.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+        else:
+            if self._writer is None:
+                json_keys = sorted({k[5:] for record in records for k in record if k.startswith("JSON.")})
+                self._columns = _columns(self.generator, json_keys)
+                self._writer = csv.DictWriter(self._file, fieldnames=self._columns, restval="",
+                                              extrasaction='ignore')
+                self._writer.writeheader()
+            for record in records:
+                if not self._dirty and any(k not in self._columns for k in record):
+                    # 出现表头之外的JSON列，结束时重写
+                    self._dirty = True
+                self._writer.writerow(record)
+
+        self._file.flush()
+        self.rows_written += len(records)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "path": self.output_path,
+            "format": self.fmt,
+            "rows_written": self.rows_written,
+            "pending": self._queue.qsize()
+        }
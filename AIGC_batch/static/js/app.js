@@ -4,11 +4,14 @@
 
 // ==================== 状态管理 ====================
 const state = {
+    jobId: sessionStorage.getItem('jobId'),  // 当前任务ID，上传文件时由服务端创建
     apiConfigured: false,
     fileLoaded: false,
     previewCompleted: false,
     generationCompleted: false,
     progressInterval: null,
+    progressStream: null,
+    progress: {},
     totalRows: 0,
     promptTemplate: '',
     variables: [
@@ -19,6 +22,12 @@ const state = {
 };
 
 // ==================== API 请求封装 ====================
+// 请求附带当前任务ID，多个任务互不影响
+function withJob(url) {
+    if (!state.jobId) return url;
+    return url + (url.includes('?') ? '&' : '?') + 'job_id=' + encodeURIComponent(state.jobId);
+}
+
 async function apiRequest(url, options = {}) {
     const defaultOptions = {
         headers: {
@@ -26,7 +35,7 @@ async function apiRequest(url, options = {}) {
         },
     };
 
-    const response = await fetch(url, { ...defaultOptions, ...options });
+    const response = await fetch(withJob(url), { ...defaultOptions, ...options });
     const data = await response.json();
     return data;
 }
@@ -43,6 +52,8 @@ document.getElementById('btn-save-api').addEventListener('click', async () => {
     const apiUrl = document.getElementById('api-url').value.trim();
     const apiKey = document.getElementById('api-key').value.trim();
     const model = document.getElementById('api-model').value.trim();
+    const rpm = parseInt(document.getElementById('api-rpm').value) || null;
+    const tpm = parseInt(document.getElementById('api-tpm').value) || null;
 
     if (!apiUrl || !apiKey || !model) {
         showStatus('api-status', '请填写完整的API配置', 'error');
@@ -51,7 +62,7 @@ document.getElementById('btn-save-api').addEventListener('click', async () => {
 
     const response = await apiRequest('/api/config', {
         method: 'POST',
-        body: JSON.stringify({ api_url: apiUrl, api_key: apiKey, model })
+        body: JSON.stringify({ api_url: apiUrl, api_key: apiKey, model, rpm, tpm })
     });
 
     if (response.success) {
@@ -151,6 +162,8 @@ async function handleFileUpload(file) {
     const data = await response.json();
 
     if (data.success) {
+        state.jobId = data.data.job_id;
+        sessionStorage.setItem('jobId', state.jobId);
         state.fileLoaded = true;
         state.totalRows = data.data.total_rows;
 
@@ -243,22 +256,131 @@ document.getElementById('btn-start-generate').addEventListener('click', async ()
     if (response.success) {
         document.getElementById('progress-container').style.display = 'block';
         document.getElementById('btn-start-generate').style.display = 'none';
-        startProgressPolling();
+        document.getElementById('btn-pause-generate').style.display = 'inline-flex';
+        document.getElementById('btn-cancel-generate').style.display = 'inline-flex';
+        startProgressStream();
     } else {
         alert('启动失败: ' + response.message);
     }
 });
 
+document.getElementById('btn-pause-generate').addEventListener('click', async () => {
+    const button = document.getElementById('btn-pause-generate');
+    const paused = button.dataset.paused === 'true';
+    const response = await apiRequest(paused ? '/api/generate/resume' : '/api/generate/pause', { method: 'POST' });
+
+    if (response.success) {
+        button.dataset.paused = paused ? 'false' : 'true';
+        button.textContent = paused ? '暂停' : '继续';
+    } else {
+        alert(response.message);
+    }
+});
+
+document.getElementById('btn-cancel-generate').addEventListener('click', async () => {
+    if (!confirm('确定要取消生成吗？已完成的结果会保存到断点，可稍后继续。')) {
+        return;
+    }
+    const response = await apiRequest('/api/generate/cancel', { method: 'POST' });
+    if (!response.success) {
+        alert(response.message);
+    }
+});
+
+function isFinalStatus(status) {
+    return ['completed', 'cancelled', 'error'].includes(status);
+}
+
+function finishGeneration() {
+    document.getElementById('btn-pause-generate').style.display = 'none';
+    document.getElementById('btn-cancel-generate').style.display = 'none';
+    state.generationCompleted = true;
+    updateButtons();
+}
+
+// 通过SSE接收进度推送，不支持或连接失败时退回轮询
+function startProgressStream() {
+    if (!window.EventSource) {
+        startProgressPolling();
+        return;
+    }
+
+    const source = new EventSource(withJob('/api/progress/stream'));
+    state.progressStream = source;
+    state.progress = {};
+
+    const stop = () => {
+        source.close();
+        state.progressStream = null;
+    };
+
+    source.addEventListener('progress', (event) => {
+        // 首次为完整进度，之后只包含变化的字段
+        Object.assign(state.progress, JSON.parse(event.data));
+        updateProgress(state.progress);
+        if (isFinalStatus(state.progress.status)) {
+            stop();
+            finishGeneration();
+        }
+    });
+
+    source.addEventListener('rows', (event) => {
+        const data = JSON.parse(event.data);
+        const failed = data.rows.filter(r => r.status === 'error');
+        if (failed.length > 0) {
+            appendRowErrors(failed);
+        }
+    });
+
+    source.addEventListener('state', (event) => {
+        const data = JSON.parse(event.data);
+        state.progress.status = data.status;
+        if (isFinalStatus(data.status)) {
+            // 等最终进度随后推送；若连接已断开则由轮询补上
+            setTimeout(() => {
+                if (state.progressStream === source) {
+                    stop();
+                    startProgressPolling();
+                }
+            }, 2000);
+        }
+    });
+
+    source.onerror = () => {
+        // 连接中断时改为轮询
+        stop();
+        startProgressPolling();
+    };
+}
+
+function appendRowErrors(rows) {
+    const progressLog = document.getElementById('progress-log');
+    rows.forEach(r => {
+        const line = document.createElement('div');
+        line.className = 'row-error';
+        line.textContent = `第 ${r.row + 1} 行失败${r.error_type ? '（' + r.error_type + '）' : ''}`;
+        progressLog.appendChild(line);
+    });
+    // 只保留最近50条
+    const lines = progressLog.querySelectorAll('.row-error');
+    for (let i = 0; i < lines.length - 50; i++) {
+        lines[i].remove();
+    }
+}
+
 function startProgressPolling() {
+    if (state.progressInterval) {
+        return;
+    }
     state.progressInterval = setInterval(async () => {
         const response = await apiRequest('/api/progress');
         if (response.success) {
             updateProgress(response.data);
 
-            if (response.data.status === 'completed' || response.data.status === 'error') {
+            if (isFinalStatus(response.data.status)) {
                 clearInterval(state.progressInterval);
-                state.generationCompleted = true;
-                updateButtons();
+                state.progressInterval = null;
+                finishGeneration();
             }
         }
     }, 1000);
@@ -286,6 +408,9 @@ function updateProgress(data) {
         timeInfo.innerHTML = `
             <span>总生成耗时: ${data.total_generation_time.toFixed(2)}秒</span>
             <span>平均耗时: ${data.avg_generation_time.toFixed(2)}秒/条</span>
+            ${data.throughput ? `<span>吞吐量: ${data.throughput.toFixed(2)}条/秒</span>` : ''}
+            ${data.eta_seconds !== null && data.eta_seconds !== undefined ? `<span>预计剩余: ${Math.ceil(data.eta_seconds)}秒</span>` : ''}
+            ${data.concurrency ? `<span>当前并发: ${data.concurrency.in_flight} / ${data.concurrency.limit}</span>` : ''}
         `;
         
         // 移除旧的时间信息
@@ -303,7 +428,10 @@ function updateProgress(data) {
 document.getElementById('btn-export').addEventListener('click', async () => {
     const response = await apiRequest('/api/export', {
         method: 'POST',
-        body: JSON.stringify({ filename: '话题keygen_result.xlsx' })
+        body: JSON.stringify({
+            format: document.getElementById('export-format').value,
+            include_phases: document.getElementById('export-phases').checked
+        })
     });
 
     if (response.success) {
@@ -315,12 +443,13 @@ document.getElementById('btn-export').addEventListener('click', async () => {
 });
 
 document.getElementById('btn-download').addEventListener('click', () => {
-    window.location.href = '/api/download';
+    window.location.href = withJob('/api/download');
 });
 
 document.getElementById('btn-reset').addEventListener('click', async () => {
     if (confirm('确定要重置所有状态吗？')) {
         await apiRequest('/api/reset', { method: 'POST' });
+        sessionStorage.removeItem('jobId');
         location.reload();
     }
 });
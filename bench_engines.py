@@ -0,0 +1,77 @@
+"""
+线程池引擎与asyncio引擎吞吐对比
+针对本地模拟服务，测量相同行数下两种引擎的每秒完成行数
+
+用法: python bench_engines.py [行数] [模拟延迟秒]
+"""
+
+import sys
+import os
+import time
+import tempfile
+import shutil
+
+# 添加项目根目录到路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from AIGC_batch.api_clients import UniversalAPIClient
+from AIGC_batch.generator import KeyGenerator
+from mock_llm_server import MockLLMServer
+
+
+def _make_generator(rows: int, work_dir: str) -> KeyGenerator:
+    generator = KeyGenerator(save_interval=10 ** 9)  # 压测时不触发中途断点
+    generator.headers = ["目标对象"]
+    generator.input_data = [{"目标对象": f"对象{i}"} for i in range(rows)]
+    generator.total_rows = rows
+    generator._current_file = os.path.join(work_dir, "bench.xlsx")  # 断点写入临时目录
+    return generator
+
+
+def _run(name, generator, func):
+    start = time.time()
+    success, message = func()
+    elapsed = time.time() - start
+    ok = sum(1 for r in generator.results if r and r.success)
+    print(f"{name:<28} {elapsed:8.2f}s  {ok / elapsed:10.1f} 行/秒  ({message})")
+    return ok / elapsed
+
+
+def bench(rows: int = 2000, latency: float = 0.05):
+    print(f"行数: {rows}，模拟延迟: {latency * 1000:.0f}ms")
+
+    work_dir = tempfile.mkdtemp()
+    with MockLLMServer(latency=latency) as server:
+        client = UniversalAPIClient(server.base_url, "mock-key", "mock-model")
+        template = "{{主场景}}"
+        variables = {"主场景": "目标对象"}
+
+        results = {}
+        for workers in (5, 50):
+            generator = _make_generator(rows, work_dir)
+            results[f"thread x{workers}"] = _run(
+                f"ThreadPool max_workers={workers}", generator,
+                lambda: generator.start_generation(client, template, variables, max_workers=workers)
+            )
+
+        for concurrency in (100, 1000):
+            generator = _make_generator(rows, work_dir)
+            results[f"async x{concurrency}"] = _run(
+                f"asyncio max_concurrency={concurrency}", generator,
+                lambda: generator.run_generation_async(client, template, variables,
+                                                       max_concurrency=concurrency)
+            )
+
+    baseline = results["thread x50"]
+    print("\n相对 ThreadPool(50) 的吞吐倍数:")
+    for name, throughput in results.items():
+        print(f"  {name:<14} {throughput / baseline:6.2f}x")
+
+    shutil.rmtree(work_dir)
+
+
+if __name__ == "__main__":
+    bench(
+        rows=int(sys.argv[1]) if len(sys.argv) > 1 else 2000,
+        latency=float(sys.argv[2]) if len(sys.argv) > 2 else 0.05
+    )
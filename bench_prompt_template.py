@@ -0,0 +1,70 @@
+"""
+Prompt模板渲染微基准
+对比逐变量 str.replace 链式替换与预编译模板在默认 topic_search_key 长模板上的渲染耗时
+
+用法: python bench_prompt_template.py [行数] [额外变量数]
+"""
+
+import sys
+import os
+import time
+
+# 添加项目根目录到路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from AIGC_batch.generator import PromptTemplate
+
+TEMPLATE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "P", "P", "topic_search_key")
+
+
+def render_with_replace(template, variables, row_data):
+    """原实现：每个变量对整段模板做两次 replace"""
+    prompt = template
+    for var_name, column_name in variables.items():
+        value = row_data.get(column_name, "")
+        if value is None:
+            value = ""
+        prompt = prompt.replace(f"{{{{{var_name}}}}}", str(value))
+        prompt = prompt.replace(f"{{{var_name}}}", str(value))
+    return prompt
+
+
+def _time(func, rows):
+    start = time.perf_counter()
+    for row in rows:
+        func(row)
+    return time.perf_counter() - start
+
+
+def bench(rows: int = 100000, extra_variables: int = 0):
+    with open(TEMPLATE_PATH, "r", encoding="utf-8") as f:
+        template = f.read()
+
+    variables = {"主场景": "目标对象", "子场景": "营销主题", "Tab词": "Tab分类"}
+    # 可选：追加变量模拟更长、更多变量的模板
+    for i in range(extra_variables):
+        variables[f"变量{i}"] = f"列{i}"
+        template += f"\n- 变量{i}：{{{{变量{i}}}}}"
+
+    data = [
+        {column: f"{column}{i}" for column in variables.values()}
+        for i in range(rows)
+    ]
+
+    compiled = PromptTemplate(template, variables)
+    assert all(compiled.render(row) == render_with_replace(template, variables, row) for row in data[:100])
+
+    replace_time = _time(lambda row: render_with_replace(template, variables, row), data)
+    compiled_time = _time(compiled.render, data)
+
+    print(f"模板长度: {len(template)} 字符，变量数: {len(variables)}，行数: {rows}")
+    print(f"str.replace 链式替换: {replace_time:8.3f}s  ({replace_time / rows * 1e6:6.2f} µs/行)")
+    print(f"预编译模板:           {compiled_time:8.3f}s  ({compiled_time / rows * 1e6:6.2f} µs/行)")
+    print(f"加速比: {replace_time / compiled_time:.2f}x")
+
+
+if __name__ == "__main__":
+    bench(
+        rows=int(sys.argv[1]) if len(sys.argv) > 1 else 100000,
+        extra_variables=int(sys.argv[2]) if len(sys.argv) > 2 else 0
+    )
@@ -0,0 +1,223 @@
+"""
+本地模拟LLM服务
+提供OpenAI兼容的 /v1/chat/completions 接口与批处理接口（/v1/files、/v1/batches），
+用于测试与压测（不访问真实API）
+"""
+
+import asyncio
+import json
+import time
+import threading
+from typing import Optional
+
+from aiohttp import web
+
+
+class MockLLMServer:
+    """在后台线程中运行的模拟 chat/completions 服务"""
+
+    # 批处理中内容包含该文本的请求返回400错误
+    BATCH_FAIL_MARKER = "[fail]"
+
+    def __init__(self, latency: float = 0.05, port: int = 0, batch_delay: float = 0.2,
+                 api_key: Optional[str] = None):
+        """
+        :param latency: 每个请求的模拟响应延迟（秒）
+        :param port: 监听端口，0 表示随机分配
+        :param batch_delay: 批处理从创建到完成的时间（秒）
+        :param api_key: 要求的API密钥，密钥不符时返回401，为空时不校验
+        """
+        self.latency = latency
+        self.port = port
+        self.batch_delay = batch_delay
+        self.api_key = api_key
+        self.error_status: Optional[int] = None  # 设置后 chat/completions 请求均返回该状态码
+        # 流式响应（stream=true）：在JSON之后追加的多余文本、每个分片的间隔（秒）
+        self.stream_suffix = ""
+        self.chunk_delay = 0.0
+        self.stream_chunks = 0  # 已发送的内容分片数
+        self.streams_aborted = 0  # 客户端在流结束前断开的次数
+        self.request_count = 0
+        self.max_tokens = []  # 各 chat/completions 请求的 max_tokens
+        self.batch_request_count = 0  # 批处理中执行的请求数
+        self.files = {}  # 文件ID -> 内容
+        self.batches = {}  # 批处理ID -> 批处理对象
+        self._loop = None
+        self._runner = None
+        self._thread = None
+        self._ready = threading.Event()
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}/v1"
+
+    def _completion(self, data: dict) -> dict:
+        """回显Prompt的 chat/completions 响应"""
+        prompt = data["messages"][-1]["content"]
+        content = json.dumps({"key": prompt}, ensure_ascii=False)
+        return {
+            "id": f"mock-{self.request_count + self.batch_request_count}",
+            "model": data.get("model"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}}],
+            "usage": {"prompt_tokens": len(prompt), "completion_tokens": len(content),
+                      "total_tokens": len(prompt) + len(content)}
+        }
+
+    async def _handle_chat(self, request: web.Request) -> web.Response:
+        data = await request.json()
+        self.request_count += 1
+        self.max_tokens.append(data.get("max_tokens"))
+        await asyncio.sleep(self.latency)
+        if self.api_key is not None and request.headers.get("Authorization") != f"Bearer {self.api_key}":
+            return web.json_response({"error": {"message": "invalid api key"}}, status=401)
+        if self.error_status is not None:
+            return web.json_response({"error": {"message": "mock error"}}, status=self.error_status)
+        if data.get("stream"):
+            return await self._stream_completion(request, data)
+        return web.json_response(self._completion(data))
+
+    async def _stream_completion(self, request: web.Request, data: dict) -> web.StreamResponse:
+        """以SSE分片返回回显内容（每个分片4个字符），之后是 usage 与 [DONE]"""
+        completion = self._completion(data)
+        content = completion["choices"][0]["message"]["content"] + self.stream_suffix
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+
+        def event(payload) -> bytes:
+            text = payload if isinstance(payload, str) else json.dumps(payload, ensure_ascii=False)
+            return f"data: {text}\n\n".encode("utf-8")
+
+        chunk = {"id": completion["id"], "model": completion["model"], "choices": []}
+        try:
+            for i in range(0, len(content), 4):
+                if self.chunk_delay:
+                    await asyncio.sleep(self.chunk_delay)
+                delta = {"index": 0, "delta": {"content": content[i:i + 4]}, "finish_reason": None}
+                await response.write(event({**chunk, "choices": [delta]}))
+                self.stream_chunks += 1
+            await response.write(event({**chunk, "usage": completion["usage"]}))
+            await response.write(event("[DONE]"))
+        except (ConnectionResetError, RuntimeError):
+            self.streams_aborted += 1
+        return response
+
+    def _add_file(self, content: str, purpose: str) -> dict:
+        file_id = f"file-{len(self.files) + 1}"
+        self.files[file_id] = content
+        return {"id": file_id, "object": "file", "bytes": len(content.encode("utf-8")), "purpose": purpose}
+
+    async def _handle_upload(self, request: web.Request) -> web.Response:
+        form = await request.post()
+        content = form["file"].file.read().decode("utf-8")
+        return web.json_response(self._add_file(content, form.get("purpose", "batch")))
+
+    async def _handle_file_content(self, request: web.Request) -> web.Response:
+        content = self.files.get(request.match_info["file_id"])
+        if content is None:
+            return web.json_response({"error": {"message": "file not found"}}, status=404)
+        return web.Response(text=content, content_type="application/jsonl")
+
+    async def _handle_create_batch(self, request: web.Request) -> web.Response:
+        data = await request.json()
+        if data["input_file_id"] not in self.files:
+            return web.json_response({"error": {"message": "input file not found"}}, status=400)
+        lines = [line for line in self.files[data["input_file_id"]].splitlines() if line.strip()]
+        batch_id = f"batch-{len(self.batches) + 1}"
+        self.batches[batch_id] = batch = {
+            "id": batch_id,
+            "object": "batch",
+            "endpoint": data["endpoint"],
+            "input_file_id": data["input_file_id"],
+            "completion_window": data.get("completion_window", "24h"),
+            "status": "in_progress",
+            "created_at": int(time.time()),
+            "output_file_id": None,
+            "error_file_id": None,
+            "request_counts": {"total": len(lines), "completed": 0, "failed": 0},
+            "_ready_at": time.monotonic() + self.batch_delay
+        }
+        return web.json_response(self._public(batch))
+
+    def _run_batch(self, batch: dict):
+        """执行批处理中的全部请求，生成输出文件与错误文件"""
+        outputs, errors = [], []
+        for line in self.files[batch["input_file_id"]].splitlines():
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            self.batch_request_count += 1
+            result = {"id": f"response-{self.batch_request_count}", "custom_id": record["custom_id"], "error": None}
+            if self.BATCH_FAIL_MARKER in record["body"]["messages"][-1]["content"]:
+                result["response"] = {"status_code": 400, "body": {"error": {"message": "invalid prompt"}}}
+                errors.append(result)
+            else:
+                result["response"] = {"status_code": 200, "body": self._completion(record["body"])}
+                outputs.append(result)
+        if outputs:
+            batch["output_file_id"] = self._add_file(
+                "\n".join(json.dumps(r, ensure_ascii=False) for r in outputs) + "\n", "batch_output")["id"]
+        if errors:
+            batch["error_file_id"] = self._add_file(
+                "\n".join(json.dumps(r, ensure_ascii=False) for r in errors) + "\n", "batch_output")["id"]
+        batch["request_counts"].update(completed=len(outputs), failed=len(errors))
+
+    async def _handle_get_batch(self, request: web.Request) -> web.Response:
+        batch = self.batches.get(request.match_info["batch_id"])
+        if batch is None:
+            return web.json_response({"error": {"message": "batch not found"}}, status=404)
+        if batch["status"] == "in_progress" and time.monotonic() >= batch["_ready_at"]:
+            self._run_batch(batch)
+            batch["status"] = "completed"
+        elif batch["status"] == "cancelling":
+            batch["status"] = "cancelled"
+        return web.json_response(self._public(batch))
+
+    async def _handle_cancel_batch(self, request: web.Request) -> web.Response:
+        batch = self.batches.get(request.match_info["batch_id"])
+        if batch is None:
+            return web.json_response({"error": {"message": "batch not found"}}, status=404)
+        if batch["status"] == "in_progress":
+            batch["status"] = "cancelling"
+        return web.json_response(self._public(batch))
+
+    @staticmethod
+    def _public(batch: dict) -> dict:
+        return {key: value for key, value in batch.items() if not key.startswith("_")}
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        app = web.Application()
+        app.router.add_post("/v1/chat/completions", self._handle_chat)
+        app.router.add_post("/v1/files", self._handle_upload)
+        app.router.add_get("/v1/files/{file_id}/content", self._handle_file_content)
+        app.router.add_post("/v1/batches", self._handle_create_batch)
+        app.router.add_get("/v1/batches/{batch_id}", self._handle_get_batch)
+        app.router.add_post("/v1/batches/{batch_id}/cancel", self._handle_cancel_batch)
+        self._runner = web.AppRunner(app, access_log=None)
+        self._loop.run_until_complete(self._runner.setup())
+        site = web.TCPSite(self._runner, "127.0.0.1", self.port, backlog=4096)
+        self._loop.run_until_complete(site.start())
+        self.port = site._server.sockets[0].getsockname()[1]
+        self._ready.set()
+        self._loop.run_forever()
+
+    def start(self) -> "MockLLMServer":
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        self._ready.wait(timeout=10)
+        return self
+
+    def stop(self):
+        if self._loop is None:
+            return
+        future = asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop)
+        future.result(timeout=10)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=10)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
@@ -0,0 +1,102 @@
+import sys
+import os
+import time
+import threading
+import tempfile
+import shutil
+
+# 添加项目根目录到路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from AIGC_batch.api_clients import APIRequestError
+from AIGC_batch.generator import KeyGenerator, AdaptiveConcurrencyLimiter, RetryPolicy
+
+
+# 测试AIMD自适应并发
+def test_adaptive_concurrency():
+    print("测试AIMD自适应并发...")
+
+    # 1. 并发跑满且健康时加性增加
+    print("\n1. 加性增加:")
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=2, max_limit=4)
+    for _ in range(3):
+        starts = [limiter.acquire() for _ in range(limiter.limit)]
+        for start in starts:
+            limiter.release(start, 0.1)
+    print(f"并发状态: {limiter.get_stats()}")
+    assert limiter.limit == 4
+
+    # 2. 限流时乘性回退，回退前发出的请求不重复回退
+    print("\n2. 乘性回退:")
+    starts = [limiter.acquire() for _ in range(4)]
+    for start in starts:
+        limiter.release(start, 0.1, "rate_limit")
+    print(f"并发状态: {limiter.get_stats()}")
+    assert limiter.limit == 2 and limiter.get_stats()["backoffs"] == 1
+
+    # 3. 普通客户端错误不影响并发
+    start = limiter.acquire()
+    limiter.release(start, 0.1, "client_error")
+    assert limiter.limit == 2
+
+    # 4. 延迟突增触发回退
+    print("\n3. 延迟突增:")
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=8)
+    for _ in range(20):
+        limiter.release(limiter.acquire(), 0.1)
+    limiter.release(limiter.acquire(), 1.0)
+    assert limiter.limit == 4
+
+    # 5. 生成时遇到服务端限流自动降低并发
+    print("\n4. 生成时根据429调整并发:")
+    test_dir = tempfile.mkdtemp()
+
+    try:
+        class ThrottledAPIClient:
+            """并发超过6时返回429"""
+
+            def __init__(self):
+                self.in_flight = 0
+                self.lock = threading.Lock()
+
+            def generate(self, prompt):
+                with self.lock:
+                    self.in_flight += 1
+                    throttled = self.in_flight > 6
+                try:
+                    time.sleep(0.01)
+                    if throttled:
+                        raise APIRequestError.from_status("API请求失败: 429 Too Many Requests", 429)
+                    return prompt
+                finally:
+                    with self.lock:
+                        self.in_flight -= 1
+
+        # 关闭重试，直接观察限流错误对并发的影响
+        generator = KeyGenerator(save_interval=1000, retry_policy=RetryPolicy(max_attempts=1, requeue_passes=0))
+        generator.headers = ["目标对象"]
+        generator.input_data = [{"目标对象": f"对象{i}"} for i in range(300)]
+        generator.total_rows = 300
+        generator._current_file = os.path.join(test_dir, "input.xlsx")
+
+        success, message = generator.start_generation(
+            ThrottledAPIClient(), "{{主场景}}", {"主场景": "目标对象"},
+            max_workers=16, adaptive=True, max_limit=32
+        )
+        progress = generator.get_progress()
+        print(f"生成消息: {message}")
+        print(f"并发状态: {progress['concurrency']}")
+        assert success
+        assert progress["concurrency"]["backoffs"] >= 1
+        assert progress["concurrency"]["limit"] <= 12
+        assert progress["success"] > progress["error"]
+        assert all(r.error_type == "rate_limit" for r in generator.results if not r.success)
+
+        print("\n测试完成！")
+
+    finally:
+        shutil.rmtree(test_dir)
+
+
+if __name__ == "__main__":
+    test_adaptive_concurrency()
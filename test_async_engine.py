@@ -0,0 +1,85 @@
+import sys
+import os
+import tempfile
+import shutil
+
+# 添加项目根目录到路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from AIGC_batch.api_clients import UniversalAPIClient
+from AIGC_batch.generator import KeyGenerator
+from mock_llm_server import MockLLMServer
+
+
+def _make_generator(rows, work_dir):
+    generator = KeyGenerator(save_interval=50)
+    generator.headers = ["目标对象"]
+    generator.input_data = [{"目标对象": f"对象{i}"} for i in range(rows)]
+    generator.total_rows = rows
+    generator._current_file = os.path.join(work_dir, "input.xlsx")
+    return generator
+
+
+# 测试asyncio生成引擎
+def test_async_engine():
+    print("测试asyncio生成引擎...")
+
+    test_dir = tempfile.mkdtemp()
+
+    try:
+        with MockLLMServer(latency=0.01) as server:
+            client = UniversalAPIClient(server.base_url, "mock-key", "mock-model")
+
+            # 1. 对本地模拟服务高并发生成
+            print("\n1. asyncio引擎生成200行:")
+            generator = _make_generator(200, test_dir)
+            progress_calls = []
+
+            success, message = generator.run_generation_async(
+                client, "{{主场景}}", {"主场景": "目标对象"},
+                on_progress=lambda *args: progress_calls.append(args),
+                max_concurrency=64
+            )
+            print(f"生成消息: {message}")
+            assert success
+            assert server.request_count == 200
+            assert [r.row_index for r in generator.results] == list(range(200))
+            assert generator.results[7].parsed_result == {"key": "对象7"}
+            assert progress_calls[-1] == (200, 200, 200, 0)
+            assert generator.get_latest_checkpoint(test_dir) is not None
+
+            # 2. 断点续传起始索引
+            print("\n2. 从第150行开始生成:")
+            generator = _make_generator(200, test_dir)
+            success, message = generator.run_generation_async(
+                client, "{{主场景}}", {"主场景": "目标对象"}, start_index=150, max_concurrency=8
+            )
+            assert success and len(generator.results) == 50
+            assert generator.results[0].row_index == 150
+
+        # 3. 只提供同步 generate 的客户端放入线程池执行
+        print("\n3. 同步客户端回退:")
+
+        class MockAPIClient:
+            def generate(self, prompt):
+                if prompt == "对象3":
+                    raise Exception("模拟失败")
+                return prompt
+
+        generator = _make_generator(10, test_dir)
+        success, message = generator.run_generation_async(
+            MockAPIClient(), "{{主场景}}", {"主场景": "目标对象"}, max_concurrency=4
+        )
+        print(f"生成消息: {message}")
+        progress = generator.get_progress()
+        assert progress["success"] == 9 and progress["error"] == 1
+        assert generator.results[3].error == "模拟失败"
+
+        print("\n测试完成！")
+
+    finally:
+        shutil.rmtree(test_dir)
+
+
+if __name__ == "__main__":
+    test_async_engine()
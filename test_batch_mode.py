@@ -0,0 +1,165 @@
+import sys
+import os
+import csv
+import time
+import shutil
+import tempfile
+import threading
+
+# 添加项目根目录到路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from AIGC_batch.api_clients import APIRequestError, UniversalAPIClient
+from AIGC_batch.generator import KeyGenerator, RetryPolicy
+from AIGC_batch.result_writers import export_results
+from mock_llm_server import MockLLMServer
+
+TEMPLATE = "{{主场景}}"
+VARIABLES = {"主场景": "目标对象"}
+
+
+class FlakyPollClient(UniversalAPIClient):
+    """第一次查询批处理状态时断开，模拟提交后进程中断"""
+    polls = 0
+
+    def get_batch(self, batch_id):
+        FlakyPollClient.polls += 1
+        if FlakyPollClient.polls == 1:
+            raise ConnectionError("连接中断")
+        return super().get_batch(batch_id)
+
+
+class TransientErrorClient(UniversalAPIClient):
+    """查询状态与下载结果各遇到一次可重试的服务端错误"""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.failures = {"get_batch": 1, "fetch_batch_results": 1}
+
+    def _fail_once(self, name):
+        if self.failures[name]:
+            self.failures[name] -= 1
+            raise APIRequestError("网关错误", 502, APIRequestError.SERVER_ERROR)
+
+    def get_batch(self, batch_id):
+        self._fail_once("get_batch")
+        return super().get_batch(batch_id)
+
+    def fetch_batch_results(self, batch):
+        self._fail_once("fetch_batch_results")
+        return super().fetch_batch_results(batch)
+
+
+def _make_generator(values, work_dir):
+    generator = KeyGenerator()
+    generator.headers = ["目标对象"]
+    generator.input_data = [{"目标对象": value} for value in values]
+    generator.total_rows = len(values)
+    generator._current_file = os.path.join(work_dir, "input.xlsx")
+    return generator
+
+
+# 测试批处理（Batch API）模式
+def test_batch_mode():
+    print("测试批处理模式...")
+
+    test_dir = tempfile.mkdtemp()
+    # 20个不同对象、3行与对象0重复、1行服务端返回400
+    values = [f"对象{i}" for i in range(20)] + ["对象0"] * 3 + ["对象[fail]"]
+
+    try:
+        with MockLLMServer(latency=0, batch_delay=0.1) as server:
+            client = UniversalAPIClient(server.base_url, "mock-key", "mock-model")
+            assert client.batch_endpoint == "/v1/chat/completions"
+
+            # 1. 渲染、上传、轮询并按 custom_id 对应回行
+            print("\n1. 提交批处理:")
+            generator = _make_generator(values, test_dir)
+            success, message = generator.start_generation_batch(client, TEMPLATE, VARIABLES, poll_interval=0.05)
+            print(message)
+            assert success and server.request_count == 0
+            # 重复的Prompt只提交一次
+            assert server.batch_request_count == 21
+            assert generator.results[7].parsed_result == {"key": "对象7"}
+            assert generator.results[21].deduplicated and generator.results[21].parsed_result == {"key": "对象0"}
+            failed = generator.results[23]
+            assert not failed.success and failed.error_type == "client_error"
+            progress = generator.get_progress()
+            assert progress["success"] == 23 and progress["error"] == 1
+            assert progress["batch"]["status"] == "completed"
+            # 结果已写入断点，提交记录已删除
+            assert not os.path.exists(os.path.join(test_dir, KeyGenerator.BATCH_STATE_FILE))
+            assert not [name for name in os.listdir(test_dir) if name.startswith(".batch_")]
+
+            output_path = os.path.join(test_dir, "result.csv")
+            assert export_results(generator, output_path)[0]
+            with open(output_path, encoding='utf-8-sig') as f:
+                assert [row["目标对象"] for row in csv.DictReader(f)] == values
+
+            # 2. 从断点续传：只重新提交失败的行
+            print("\n2. 断点续传:")
+            generator = KeyGenerator()
+            generator._current_file = os.path.join(test_dir, "input.xlsx")
+            assert generator.load_checkpoint(generator.get_latest_checkpoint())[0]
+            generator.headers = ["目标对象"]
+            generator.input_data = [{"目标对象": value} for value in values]
+            generator.total_rows = len(values)
+            success, message = generator.start_generation_batch(client, TEMPLATE, VARIABLES, poll_interval=0.05)
+            print(message)
+            assert server.batch_request_count == 22 and len(server.batches) == 2
+            assert generator.get_progress()["success"] == 23
+
+            # 3. 提交后中断，再次运行接回同一个批处理而不是重新提交
+            print("\n3. 接回未结束的批处理:")
+            flaky = FlakyPollClient(server.base_url, "mock-key", "mock-model")
+            work_dir = os.path.join(test_dir, "reattach")
+            os.makedirs(work_dir)
+            generator = _make_generator(values[:5], work_dir)
+            success, message = generator.start_generation_batch(flaky, TEMPLATE, VARIABLES, poll_interval=0.05)
+            print(message)
+            assert not success and os.path.exists(os.path.join(work_dir, KeyGenerator.BATCH_STATE_FILE))
+            success, message = generator.start_generation_batch(flaky, TEMPLATE, VARIABLES, poll_interval=0.05)
+            print(message)
+            assert success and len(server.batches) == 3
+            assert generator.get_progress()["success"] == 5
+
+            # 查询状态与下载结果时的瞬时错误按重试策略重试，不中断生成
+            transient = TransientErrorClient(server.base_url, "mock-key", "mock-model")
+            work_dir = os.path.join(test_dir, "transient")
+            os.makedirs(work_dir)
+            generator = _make_generator(values[:5], work_dir)
+            generator.retry_policy = RetryPolicy(base_delay=0.01)
+            success, message = generator.start_generation_batch(transient, TEMPLATE, VARIABLES, poll_interval=0.05)
+            print(message)
+            assert success and transient.failures == {"get_batch": 0, "fetch_batch_results": 0}
+            assert generator.get_progress()["success"] == 5
+            transient.close()
+
+            # 4. 取消生成时取消远端批处理，未执行的行记为可重试的失败
+            print("\n4. 取消:")
+            server.batch_delay = 30
+            work_dir = os.path.join(test_dir, "cancel")
+            os.makedirs(work_dir)
+            generator = _make_generator(values[:5], work_dir)
+            outcome = []
+            thread = threading.Thread(target=lambda: outcome.append(
+                generator.start_generation_batch(client, TEMPLATE, VARIABLES, poll_interval=0.05)))
+            thread.start()
+            while generator.get_progress()["batch"] is None:
+                time.sleep(0.01)
+            assert generator.cancel_generation()
+            thread.join(timeout=5)
+            print(outcome[0][1])
+            assert not outcome[0][0] and server.batches["batch-5"]["status"] == "cancelled"
+            assert all(r.error_type == "timeout" for r in generator.results)
+
+            client.close()
+            flaky.close()
+
+        print("\n测试完成！")
+
+    finally:
+        shutil.rmtree(test_dir)
+
+
+if __name__ == "__main__":
+    test_batch_mode()
@@ -0,0 +1,102 @@
+import sys
+import os
+import json
+import tempfile
+import shutil
+
+# 添加项目根目录到路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from AIGC_batch.generator import KeyGenerator, CheckpointJournal, GenerationResult
+
+
+class MockAPIClient:
+    def generate(self, prompt):
+        return f'{{"key": "{prompt}"}}'
+
+
+def _make_generator(rows, work_dir):
+    generator = KeyGenerator(save_interval=10)
+    generator.headers = ["目标对象"]
+    generator.input_data = [{"目标对象": f"对象{i}"} for i in range(rows)]
+    generator.total_rows = rows
+    generator._current_file = os.path.join(work_dir, "input.xlsx")
+    return generator
+
+
+# 测试追加写断点日志
+def test_checkpoint_journal():
+    print("测试追加写断点日志...")
+
+    test_dir = tempfile.mkdtemp()
+
+    try:
+        meta = {"total_rows": 5, "start_index": 0, "input_file": "",
+                "prompt_template": "{{主场景}}", "variable_mapping": {"主场景": "目标对象"}}
+        results = [GenerationResult(i, {"目标对象": f"对象{i}"}, f"结果{i}", True) for i in range(5)]
+
+        # 1. 每个结果追加一行，只有日志时也能回放
+        print("\n1. 日志回放:")
+        journal = CheckpointJournal(test_dir, meta, fsync_interval=2, compact_min_rows=3)
+        for r in results[:2]:
+            journal.append(r)
+        with open(journal.journal_path, encoding='utf-8') as f:
+            assert len(f.readlines()) == 3  # 运行信息 + 2条结果
+        checkpoint = CheckpointJournal.replay(journal.journal_path)
+        assert [r["row_index"] for r in checkpoint.results] == [0, 1]
+        assert checkpoint.prompt_template == "{{主场景}}" and checkpoint.current_index == 2
+
+        # 2. 达到阈值后压缩为快照并清空日志，回放快照加日志
+        print("\n2. 压缩与回放:")
+        journal.append(results[2])
+        assert journal.should_compact()
+        journal.compact(results[:3])
+        assert journal.journal_rows == 0 and os.path.exists(journal.snapshot_path)
+        journal.append(results[3])
+        # 同一行再次追加时以最后一条为准
+        journal.append(GenerationResult(1, {"目标对象": "对象1"}, "重试结果", True))
+        checkpoint = CheckpointJournal.replay(journal.snapshot_path)
+        assert [r["row_index"] for r in checkpoint.results] == [0, 1, 2, 3]
+        assert checkpoint.results[1]["result"] == "重试结果"
+
+        # 3. 崩溃时写了一半的行被忽略
+        print("\n3. 截断的日志行:")
+        journal.close()
+        with open(journal.journal_path, 'a', encoding='utf-8') as f:
+            f.write('{"row_index": 4, "inp')
+        assert len(CheckpointJournal.replay(journal.journal_path).results) == 4
+
+        # 4. 生成过程中写日志，结束时压缩出最终快照
+        print("\n4. 生成与恢复:")
+        run_dir = os.path.join(test_dir, "run")
+        os.makedirs(run_dir)
+        generator = _make_generator(50, run_dir)
+        success, message = generator.start_generation(MockAPIClient(), "{{主场景}}", {"主场景": "目标对象"})
+        assert success
+        latest = generator.get_latest_checkpoint(run_dir)
+        print(f"最新断点: {os.path.basename(latest)}")
+        assert latest.endswith(".json") and not os.path.exists(latest + "l")
+        with open(latest, encoding='utf-8') as f:
+            assert len(json.load(f)["results"]) == 50
+
+        restored = KeyGenerator()
+        success, message = restored.load_checkpoint(latest)
+        print(f"加载消息: {message}")
+        assert success and len(restored.results) == 50
+        assert restored.results[7].parsed_result == {"key": "对象7"}
+        assert restored.checkpoint_variables == {"主场景": "目标对象"}
+
+        # 5. 只保留最近3次运行的断点
+        print("\n5. 清理旧断点:")
+        for _ in range(4):
+            generator.start_generation(MockAPIClient(), "{{主场景}}", {"主场景": "目标对象"})
+        assert len(os.listdir(run_dir)) == 4
+
+        print("\n测试完成！")
+
+    finally:
+        shutil.rmtree(test_dir)
+
+
+if __name__ == "__main__":
+    test_checkpoint_journal()
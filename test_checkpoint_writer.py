@@ -0,0 +1,141 @@
+import sys
+import os
+import time
+import tempfile
+import shutil
+
+# 添加项目根目录到路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from AIGC_batch.generator import KeyGenerator, CheckpointJournal, CheckpointWriter, GenerationResult
+
+
+class MockAPIClient:
+    def generate(self, prompt):
+        return f'{{"key": "{prompt}"}}'
+
+
+class SlowJournal(CheckpointJournal):
+    """每次刷盘都很慢的断点日志"""
+
+    def sync(self):
+        time.sleep(0.05)
+        super().sync()
+
+
+def _wait_for(condition, timeout=2.0):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def _meta():
+    return {"total_rows": 100, "start_index": 0, "input_file": "",
+            "prompt_template": "{{主场景}}", "variable_mapping": {"主场景": "目标对象"}}
+
+
+# 测试后台断点写入
+def test_checkpoint_writer():
+    print("测试后台断点写入...")
+
+    test_dir = tempfile.mkdtemp()
+
+    try:
+        # 1. 提交不等待刷盘，按行数批量写入，关闭时写完剩余结果
+        print("\n1. 批量刷盘:")
+        journal = SlowJournal(test_dir, _meta(), compact_min_rows=10000)
+        writer = CheckpointWriter(journal, flush_rows=25, flush_interval=60)
+        start = time.time()
+        for i in range(100):
+            writer.submit(GenerationResult(i, {}, f"结果{i}", True))
+        submit_time = time.time() - start
+        stats = writer.get_stats()
+        print(f"提交耗时: {submit_time:.3f}秒，写入状态: {stats}")
+        assert submit_time < 0.05
+        assert stats["submitted"] == 100
+
+        writer.close()
+        stats = writer.get_stats()
+        print(f"关闭后: {stats}")
+        assert stats["persisted"] == 100 and stats["lag_rows"] == 0
+        assert stats["flushes"] <= 5
+        assert len(CheckpointJournal.replay(journal.snapshot_path).results) == 100
+
+        # 2. 同一行的多次结果合并为一条，超过刷盘间隔时即使行数不足也会写入
+        print("\n2. 合并与定时刷盘:")
+        journal = CheckpointJournal(test_dir, _meta())
+        writer = CheckpointWriter(journal, flush_rows=100, flush_interval=0.05)
+        writer.submit(GenerationResult(0, {}, "失败", False))
+        writer.submit(GenerationResult(0, {}, "补跑成功", True))
+        time.sleep(0.2)
+        assert writer.get_stats()["persisted"] == 2
+        assert journal.journal_rows == 1
+        writer.close()
+        assert CheckpointJournal.replay(journal.snapshot_path).results[0]["result"] == "补跑成功"
+
+        # 3. 生成中断时同样写完已完成的结果
+        print("\n3. 中断时最终刷盘:")
+        generator = KeyGenerator(save_interval=1000)
+        generator.headers = ["目标对象"]
+        generator.input_data = [{"目标对象": f"对象{i}"} for i in range(30)]
+        generator.total_rows = 30
+        generator._current_file = os.path.join(test_dir, "input.xlsx")
+
+        def on_progress(current, total, success, error):
+            if current == 10:
+                raise RuntimeError("模拟中断")
+
+        success, message = generator.start_generation(MockAPIClient(), "{{主场景}}", {"主场景": "目标对象"},
+                                                      on_progress=on_progress, max_workers=1)
+        print(f"生成消息: {message}")
+        assert not success
+        progress = generator.get_progress()
+        print(f"断点状态: {progress['checkpoint']}")
+        assert progress["checkpoint"]["lag_rows"] == 0
+        checkpoint = CheckpointJournal.replay(generator.get_latest_checkpoint(test_dir))
+        assert len(checkpoint.results) == 10
+        assert "已保存当前进度" in message
+
+        # 4. 中断时断点写入失败，不再声称已保存
+        print("\n4. 中断时保存失败:")
+        generator._current_file = os.path.join(test_dir, "input2.xlsx")
+
+        stop_writer = generator._stop_checkpoint_writer
+
+        def broken_writer():
+            stop_writer()
+            raise OSError("磁盘已满")
+
+        generator._stop_checkpoint_writer = broken_writer
+        success, message = generator.start_generation(MockAPIClient(), "{{主场景}}", {"主场景": "目标对象"},
+                                                      on_progress=on_progress, max_workers=1)
+        print(f"生成消息: {message}")
+        assert not success
+        assert "保存进度失败" in message and "磁盘已满" in message and "已保存当前进度" not in message
+
+        # 5. 续传后进程在写入线程关闭前退出，最新断点仍包含恢复的结果
+        print("\n5. 续传后崩溃:")
+        crash_dir = os.path.join(test_dir, "crash")
+        os.makedirs(crash_dir)
+        restored = [GenerationResult(i, {}, f"结果{i}", True) for i in range(2500)]
+        journal = CheckpointJournal(crash_dir, {**_meta(), "total_rows": 3000})
+        writer = CheckpointWriter(journal, flush_rows=10, flush_interval=60, initial_results=restored)
+        for i in range(2500, 2550):
+            writer.submit(GenerationResult(i, {}, f"结果{i}", True))
+        assert _wait_for(lambda: writer.get_stats()["persisted"] == 50)
+        # 不关闭写入线程，直接读取最新断点（模拟进程被杀）
+        latest = KeyGenerator().get_latest_checkpoint(crash_dir)
+        checkpoint = CheckpointJournal.replay(latest)
+        print(f"最新断点: {os.path.basename(latest)}，行数: {len(checkpoint.results)}")
+        assert len(checkpoint.results) == 2550 and checkpoint.results[0]["result"] == "结果0"
+        writer.close()
+
+        print("\n测试完成！")
+
+    finally:
+        shutil.rmtree(test_dir)
+
+
+if __name__ == "__main__":
+    test_checkpoint_writer()
@@ -0,0 +1,69 @@
+import sys
+import os
+import tempfile
+import shutil
+import concurrent.futures
+
+# 添加项目根目录到路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from AIGC_batch.api_clients import UniversalAPIClient
+from AIGC_batch.generator import KeyGenerator
+from mock_llm_server import MockLLMServer
+
+
+# 测试长连接池复用
+def test_connection_pool():
+    print("测试长连接池复用...")
+
+    test_dir = tempfile.mkdtemp()
+
+    try:
+        with MockLLMServer(latency=0.01) as server:
+            client = UniversalAPIClient(server.base_url, "mock-key", "mock-model")
+
+            # 1. 单线程连续请求只建立一条连接
+            print("\n1. 连续请求:")
+            for i in range(5):
+                assert client.generate(f"测试{i}") == f'{{"key": "测试{i}"}}'
+            stats = client.get_pool_stats()
+            print(f"连接池统计: {stats}")
+            assert stats["requests"] == 5 and stats["opened"] == 1 and stats["reused"] == 4
+
+            # 2. 并发生成时连接数不超过并发数
+            print("\n2. 5并发生成100行:")
+            generator = KeyGenerator()
+            generator.headers = ["目标对象"]
+            generator.input_data = [{"目标对象": f"对象{i}"} for i in range(100)]
+            generator.total_rows = 100
+            generator._current_file = os.path.join(test_dir, "input.xlsx")
+
+            success, message = generator.start_generation(
+                client, "{{主场景}}", {"主场景": "目标对象"}, max_workers=5
+            )
+            stats = client.get_pool_stats()
+            print(f"生成消息: {message}")
+            print(f"连接池统计: {stats}")
+            assert success and generator.get_progress()["success"] == 100
+            assert stats["pool_size"] == 5 and stats["requests"] == 100
+            assert stats["opened"] <= 5 and stats["reused"] >= 95
+
+            # 3. 并发超过连接池大小时记录等待
+            print("\n3. 连接池小于并发数:")
+            client.configure_pool(2)
+            with concurrent.futures.ThreadPoolExecutor(max_workers=8) as executor:
+                list(executor.map(client.generate, [f"等待{i}" for i in range(40)]))
+            stats = client.get_pool_stats()
+            print(f"连接池统计: {stats}")
+            assert stats["opened"] <= 2 and stats["waited"] > 0
+
+            client.close()
+
+        print("\n测试完成！")
+
+    finally:
+        shutil.rmtree(test_dir)
+
+
+if __name__ == "__main__":
+    test_connection_pool()
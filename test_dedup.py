@@ -0,0 +1,103 @@
+import sys
+import os
+import threading
+import tempfile
+import shutil
+
+# 添加项目根目录到路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from AIGC_batch.generator import KeyGenerator, RetryPolicy
+
+
+class CountingAPIClient:
+    """记录每个Prompt请求次数的模拟客户端"""
+
+    def __init__(self, fail_prompts=()):
+        self.calls = {}
+        self.fail_prompts = set(fail_prompts)
+        self.lock = threading.Lock()
+
+    def generate(self, prompt):
+        with self.lock:
+            self.calls[prompt] = self.calls.get(prompt, 0) + 1
+        if prompt in self.fail_prompts:
+            raise Exception("模拟失败")
+        return f'{{"key": "{prompt}"}}'
+
+
+def _make_generator(work_dir):
+    generator = KeyGenerator(retry_policy=RetryPolicy(requeue_passes=0))
+    generator.headers = ["SKU", "目标对象", "营销主题"]
+    # 60行数据只有6种 目标对象/营销主题 组合
+    generator.input_data = [
+        {"SKU": f"sku{i}", "目标对象": f"对象{i % 3}", "营销主题": f"主题{i % 2}"}
+        for i in range(60)
+    ]
+    generator.total_rows = 60
+    generator._current_file = os.path.join(work_dir, "input.xlsx")
+    return generator
+
+
+# 测试相同Prompt去重
+def test_dedup():
+    print("测试相同Prompt去重...")
+
+    test_dir = tempfile.mkdtemp()
+    template = "{{主场景}}/{{子场景}}"
+    variables = {"主场景": "目标对象", "子场景": "营销主题"}
+
+    try:
+        # 1. 线程池引擎：每种Prompt只请求一次，结果分发给所有重复行
+        print("\n1. 线程池引擎:")
+        client = CountingAPIClient()
+        generator = _make_generator(test_dir)
+        success, message = generator.start_generation(client, template, variables, max_workers=4)
+        progress = generator.get_progress()
+        print(f"生成消息: {message}")
+        print(f"请求次数: {sum(client.calls.values())}，去重行数: {progress['deduplicated']}")
+        assert sum(client.calls.values()) == 6
+        assert progress["success"] == 60 and progress["deduplicated"] == 54
+
+        result = generator.results[7]
+        assert result.row_index == 7 and result.input_data["SKU"] == "sku7"
+        assert result.deduplicated and result.parsed_result == {"key": "对象1/主题1"}
+        assert not generator.results[1].deduplicated
+        # 分发的结果互不共享解析字典
+        result.parsed_result["extra"] = 1
+        assert "extra" not in generator.results[1].parsed_result
+
+        # 2. asyncio引擎同样去重
+        print("\n2. asyncio引擎:")
+        client = CountingAPIClient()
+        generator = _make_generator(test_dir)
+        generator.run_generation_async(client, template, variables, max_concurrency=8)
+        assert sum(client.calls.values()) == 6
+        assert generator.get_progress()["deduplicated"] == 54
+        assert [r.row_index for r in generator.results] == list(range(60))
+
+        # 3. 首行失败时重复行同样失败
+        print("\n3. 首行失败:")
+        client = CountingAPIClient(fail_prompts={"对象0/主题0"})
+        generator = _make_generator(test_dir)
+        generator.start_generation(client, template, variables, max_workers=4)
+        failed = [r.row_index for r in generator.results if not r.success]
+        assert failed == list(range(0, 60, 6))
+        assert client.calls["对象0/主题0"] == 1
+
+        # 4. 关闭去重时逐行请求
+        print("\n4. 关闭去重:")
+        client = CountingAPIClient()
+        generator = _make_generator(test_dir)
+        generator.start_generation(client, template, variables, max_workers=4, dedup=False)
+        assert sum(client.calls.values()) == 60
+        assert generator.get_progress()["deduplicated"] == 0
+
+        print("\n测试完成！")
+
+    finally:
+        shutil.rmtree(test_dir)
+
+
+if __name__ == "__main__":
+    test_dedup()
@@ -0,0 +1,162 @@
+import sys
+import os
+import pickle
+import asyncio
+import shutil
+import tempfile
+
+# 添加项目根目录到路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from AIGC_batch.api_clients import APIConfig, APIRequestError, create_endpoint_pool
+from AIGC_batch.generator import KeyGenerator
+from mock_llm_server import MockLLMServer
+
+# 没有服务监听的地址，请求立即连接失败
+DEAD_URL = "http://127.0.0.1:1/v1"
+
+
+def _endpoint(url, weight=1, key="mock-key", **kwargs):
+    return {"api_url": url, "api_key": key, "model": "mock-model", "weight": weight, **kwargs}
+
+
+def _generate(pool, work_dir, rows, engine="thread"):
+    generator = KeyGenerator()
+    generator.headers = ["目标对象"]
+    generator.input_data = [{"目标对象": f"对象{i}"} for i in range(rows)]
+    generator.total_rows = rows
+    generator._current_file = os.path.join(work_dir, "input.xlsx")
+    if engine == "async":
+        success, message = asyncio.run(generator.start_generation_async(
+            pool, "{{主场景}}", {"主场景": "目标对象"}, max_concurrency=8, use_cache=False))
+    else:
+        success, message = generator.start_generation(
+            pool, "{{主场景}}", {"主场景": "目标对象"}, max_workers=8, use_cache=False)
+    assert success, message
+    return generator
+
+
+# 测试多端点路由与故障转移
+def test_endpoint_pool():
+    print("测试多端点路由...")
+
+    test_dir = tempfile.mkdtemp()
+
+    try:
+        with MockLLMServer(latency=0.02) as server_a, MockLLMServer(latency=0.02) as server_b:
+            # 1. 按权重与在途数路由
+            print("\n1. 加权路由:")
+            pool = create_endpoint_pool([_endpoint(server_a.base_url, weight=3),
+                                         _endpoint(server_b.base_url, weight=1)])
+            generator = _generate(pool, test_dir, 80)
+            print(f"请求数: A={server_a.request_count}, B={server_b.request_count}")
+            assert server_a.request_count + server_b.request_count == 80
+            assert server_a.request_count > 2 * server_b.request_count > 0
+            assert generator.results[5].parsed_result == {"key": "对象5"}
+            pool.close()
+
+            # 2. 变慢的端点分到的请求减少
+            print("\n2. 慢端点:")
+            server_a.request_count = server_b.request_count = 0
+            server_b.latency = 0.15
+            pool = create_endpoint_pool([_endpoint(server_a.base_url), _endpoint(server_b.base_url)])
+            _generate(pool, test_dir, 80)
+            stats = pool.get_endpoint_stats()
+            print(f"请求数: A={server_a.request_count}, B={server_b.request_count}，耗时: "
+                  f"{[s['latency'] for s in stats]}")
+            assert server_a.request_count > 3 * server_b.request_count
+            assert stats[1]["latency"] > stats[0]["latency"]
+            server_b.latency = 0.02
+            pool.close()
+
+            # 3. 单端点并发上限
+            print("\n3. 端点并发上限:")
+            pool = create_endpoint_pool([_endpoint(server_a.base_url, weight=10, max_concurrency=2),
+                                         _endpoint(server_b.base_url)])
+            _generate(pool, test_dir, 40)
+            stats = pool.get_endpoint_stats()
+            assert stats[0]["peak_in_flight"] <= 2 and stats[1]["peak_in_flight"] > 2
+            assert all(s["in_flight"] == 0 for s in stats)
+            pool.close()
+
+            # 4. 连接失败与5xx的端点被暂停，请求转到其他端点，所有行成功
+            print("\n4. 故障转移:")
+            server_b.error_status = 503
+            server_a.request_count = server_b.request_count = 0
+            pool = create_endpoint_pool([_endpoint(DEAD_URL), _endpoint(server_b.base_url),
+                                         _endpoint(server_a.base_url)])
+            generator = _generate(pool, test_dir, 60)
+            stats = pool.get_endpoint_stats()
+            print(f"端点统计: {[(s['requests'], s['errors'], s['healthy']) for s in stats]}")
+            assert generator.get_progress()["success"] == 60
+            assert stats[0]["errors"] == stats[0]["requests"] > 0 and not stats[0]["healthy"]
+            assert stats[1]["errors"] > 0 and not stats[1]["healthy"]
+            # 暂停期间不再分配请求
+            assert stats[0]["requests"] + stats[1]["requests"] < 20
+            assert server_a.request_count >= 60
+            # 参数错误与端点无关，不影响端点健康状态
+            assert not pool._is_endpoint_error(APIRequestError("bad", 400, APIRequestError.CLIENT_ERROR))
+            assert pool._is_endpoint_error(APIRequestError("denied", 401, APIRequestError.CLIENT_ERROR))
+            server_b.error_status = None
+            pool.close()
+
+        # 5. 异步引擎：多个端点（不同密钥）共享一个会话
+        print("\n5. 异步引擎:")
+        with MockLLMServer(latency=0.02, api_key="key-a") as server_a, \
+                MockLLMServer(latency=0.02, api_key="key-b") as server_b:
+            pool = create_endpoint_pool([_endpoint(server_a.base_url, key="key-a"),
+                                         _endpoint(server_b.base_url, key="key-b")])
+            generator = _generate(pool, test_dir, 40, engine="async")
+            stats = pool.get_endpoint_stats()
+            assert generator.get_progress()["success"] == 40
+            assert all(s["errors"] == 0 and s["requests"] > 0 for s in stats)
+            pool.close()
+            # 端点均已满时等待归还名额唤醒
+            pool = create_endpoint_pool([_endpoint(server_a.base_url, key="key-a", max_concurrency=2),
+                                         _endpoint(server_b.base_url, key="key-b", max_concurrency=1)])
+            generator = _generate(pool, test_dir, 30, engine="async")
+            stats = pool.get_endpoint_stats()
+            assert generator.get_progress()["success"] == 30
+            assert stats[0]["peak_in_flight"] <= 2 and stats[1]["peak_in_flight"] <= 1
+            assert all(s["in_flight"] == 0 for s in stats) and not pool._async_waiters
+            pool.close()
+
+            # 6. 配置端点池：部分端点不可用时仍可使用，配置信息不含密钥
+            print("\n6. 端点池配置:")
+            config = APIConfig()
+            success, message = config.configure_endpoints([
+                _endpoint(server_a.base_url, key="key-a", weight=2, max_concurrency=8, rpm=600),
+                _endpoint(DEAD_URL)
+            ])
+            print(message)
+            assert success and "1/2" in message
+            info = config.get_config_info()
+            assert len(info["endpoints"]) == 2 and "api_key" not in info["endpoints"][0]
+            assert len(config.get_endpoint_stats()) == 2
+            # 分片进程平分各端点的并发上限与限速配额
+            factory = pickle.loads(pickle.dumps(config.client_factory(processes=2)))
+            assert factory.args[0][0]["max_concurrency"] == 4 and factory.args[0][0]["rpm"] == 300
+            assert not config.configure_endpoints([_endpoint(DEAD_URL)])[0]
+            assert not config.configure_endpoints([{"api_url": server_a.base_url}])[0]
+            # 端点名称唯一：同主机同模型的端点追加序号，显式指定的重名被拒绝
+            pool = create_endpoint_pool([_endpoint(server_a.base_url, key="key-a"),
+                                         _endpoint(server_a.base_url, key="key-a2"),
+                                         _endpoint(server_b.base_url, key="key-b")])
+            names = [s["name"] for s in pool.get_endpoint_stats()]
+            print(f"端点名称: {names}")
+            assert len(set(names)) == 3 and names[0].endswith("#1") and names[1].endswith("#2")
+            assert "#" not in names[2]
+            pool.close()
+            success, message = config.configure_endpoints([_endpoint(server_a.base_url, key="key-a", name="主"),
+                                                           _endpoint(server_b.base_url, key="key-b", name="主")])
+            assert not success and "重复" in message
+            config.clear()
+
+        print("\n测试完成！")
+
+    finally:
+        shutil.rmtree(test_dir)
+
+
+if __name__ == "__main__":
+    test_endpoint_pool()
@@ -0,0 +1,209 @@
+import sys
+import os
+import time
+import asyncio
+import tempfile
+import shutil
+import threading
+
+# 添加项目根目录到路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from AIGC_batch.generator import KeyGenerator, AdaptiveConcurrencyLimiter
+from AIGC_batch.jobs import ConcurrencyBudget, JobManager
+
+
+class MockAPIClient:
+    """记录各任务同时在途的请求数"""
+    def __init__(self, latency=0.02):
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.in_flight = {}
+        self.peak_total = 0
+        self.started = {}
+
+    def generate(self, prompt):
+        job = prompt.split(":")[0]
+        with self.lock:
+            self.in_flight[job] = self.in_flight.get(job, 0) + 1
+            self.started[job] = self.started.get(job, 0) + 1
+            self.peak_total = max(self.peak_total, sum(self.in_flight.values()))
+        time.sleep(self.latency)
+        with self.lock:
+            self.in_flight[job] -= 1
+        return f'{{"key": "{prompt}"}}'
+
+
+def _load(job, rows):
+    generator = job.generator
+    generator.headers = ["目标对象"]
+    generator.input_data = [{"目标对象": f"{job.name}:{i}"} for i in range(rows)]
+    generator.total_rows = rows
+    generator._current_file = os.path.join(job.work_dir, "input.xlsx")
+
+
+# 测试多任务调度与全局并发预算
+def test_jobs():
+    print("测试多任务调度...")
+
+    # 1. 预算按权重分配空闲名额
+    print("\n1. 加权公平分配:")
+    budget = ConcurrencyBudget(limit=3)
+    high, low = budget.share("high", weight=2), budget.share("low", weight=1)
+    for _ in range(3):
+        low.acquire()
+    granted = []
+
+    def waiter(share):
+        share.acquire()
+        granted.append(share.job_id)
+
+    threads = [threading.Thread(target=waiter, args=(s,)) for s in [low, low, high, high]]
+    for t in threads:
+        t.start()
+    time.sleep(0.05)
+    assert granted == [] and budget.get_stats()["waiting"] == 4
+    # 名额归还后优先分配给 在途数/权重 更小的高优先级任务
+    low.release()
+    low.release()
+    time.sleep(0.05)
+    assert sorted(granted) == ["high", "high"]
+    # 其余名额归还后等待中的低优先级请求依次获得名额
+    low.release()
+    high.release()
+    high.release()
+    for t in threads:
+        t.join(timeout=1)
+    assert sorted(granted) == ["high", "high", "low", "low"]
+    low.release()
+    low.release()
+    assert budget.get_stats()["in_use"] == 0
+
+    # 异步获取名额：名额被占满时等待，其他线程归还后被唤醒；等待中取消不占用名额
+    async def async_acquire():
+        share = budget.share("async")
+        await share.aacquire()
+        share.release()
+        for _ in range(3):
+            low.acquire()
+        waiters = [asyncio.ensure_future(share.aacquire()) for _ in range(3)]
+        await asyncio.sleep(0.02)
+        assert not any(w.done() for w in waiters) and budget.get_stats()["waiting"] == 3
+        waiters[2].cancel()
+        threading.Timer(0.01, low.release).start()
+        threading.Timer(0.02, low.release).start()
+        start = time.time()
+        await asyncio.wait_for(asyncio.gather(*waiters[:2]), timeout=1)
+        assert time.time() - start < 0.5 and waiters[2].cancelled()
+        share.release()
+        share.release()
+        low.release()
+    asyncio.run(async_acquire())
+    assert budget.get_stats()["in_use"] == 0 and budget.get_stats()["waiting"] == 0
+
+    test_dir = tempfile.mkdtemp()
+
+    try:
+        # 2. 任务管理：每个任务独立的生成器与工作目录
+        print("\n2. 任务管理:")
+        budget = ConcurrencyBudget(limit=4)
+        manager = JobManager(test_dir, lambda job_id, share: KeyGenerator(budget=share, job_id=job_id),
+                             budget=budget, max_jobs=3)
+        job_a = manager.create("A", priority="high")
+        job_b = manager.create("B")
+        assert job_a.generator is not job_b.generator and os.path.isdir(job_b.work_dir)
+        assert manager.get(job_a.job_id) is job_a and manager.latest() is job_b
+        try:
+            manager.create("C", priority="urgent")
+            assert False, "无效优先级应报错"
+        except ValueError:
+            pass
+        # 同一任务的并发启动请求只有一个能占用，释放后可再次启动
+        barrier = threading.Barrier(8)
+        claims = []
+
+        def claim():
+            barrier.wait()
+            claims.append(job_a.claim_run())
+
+        threads = [threading.Thread(target=claim) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert claims.count(True) == 1 and job_a.is_running and not manager.remove(job_a.job_id)
+        job_a.release_run()
+        assert not job_a.is_running and job_a.claim_run()
+        job_a.release_run()
+
+        # 3. 两个任务同时运行，合计在途请求不超过全局预算
+        print("\n3. 并发运行:")
+        _load(job_a, 60)
+        _load(job_b, 60)
+        client = MockAPIClient()
+        threads = [
+            threading.Thread(target=job.generator.start_generation,
+                             args=(client, "{{主场景}}", {"主场景": "目标对象"}), kwargs={"max_workers": 8})
+            for job in (job_a, job_b)
+        ]
+        for t in threads:
+            t.start()
+        time.sleep(0.15)
+        snapshot = dict(client.started)
+        for t in threads:
+            t.join()
+        print(f"峰值在途: {client.peak_total}，运行中各任务已开始: {snapshot}")
+        assert client.peak_total <= 4
+        # 高优先级任务（权重4）分到的名额多于普通任务（权重2）
+        assert snapshot["A"] > snapshot["B"]
+        assert job_a.generator.get_progress()["success"] == 60 and job_b.generator.get_progress()["success"] == 60
+        # 断点写在各自的工作目录
+        assert job_a.generator.get_latest_checkpoint().startswith(job_a.work_dir)
+        # 被本任务限制器挡住的请求不占用共享名额（先取限制器再取预算）
+        peak_in_use = []
+
+        class BudgetProbeClient(MockAPIClient):
+            def generate(self, prompt):
+                peak_in_use.append(budget.get_stats()["in_use"])
+                return super().generate(prompt)
+
+        generator = job_a.generator
+        generator._limiter = AdaptiveConcurrencyLimiter(initial_limit=1, max_limit=1)
+        probe = BudgetProbeClient()
+        threads = [threading.Thread(target=generator._call_api, args=(probe, f"A:{i}")) for i in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        generator._limiter = None
+        assert len(peak_in_use) == 8 and max(peak_in_use) == 1 and budget.get_stats()["in_use"] == 0
+
+        # 4. 删除与超出上限时淘汰最早的任务
+        print("\n4. 删除与淘汰:")
+        assert manager.remove(job_b.job_id) and manager.get(job_b.job_id) is None
+        for name in ("D", "E", "F"):
+            manager.create(name)
+        assert manager.get(job_a.job_id) is None and len(manager.list()) == 3
+
+        # 5. 状态事件带有同时更新的说明
+        print("\n5. 状态事件:")
+        states = []
+
+        class StateRecorder:
+            def publish_state(self, status, message=""):
+                states.append((status, message))
+
+        job = manager.list()[-1]
+        job.broadcaster = StateRecorder()
+        job.set_status("error", "API未配置")
+        job.set_status("paused")
+        assert states == [("error", "API未配置"), ("paused", "API未配置")]
+
+        print("\n测试完成！")
+
+    finally:
+        shutil.rmtree(test_dir)
+
+
+if __name__ == "__main__":
+    test_jobs()
@@ -0,0 +1,100 @@
+import sys
+import os
+import tempfile
+import shutil
+
+# 添加项目根目录到路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from AIGC_batch.generator import KeyGenerator, RetryPolicy
+from AIGC_batch.metrics import Histogram, MetricsRegistry
+from AIGC_batch.api_clients import APIRequestError
+
+
+class MockAPIClient:
+    def __init__(self):
+        self.calls = {}
+
+    def generate(self, prompt):
+        # 对象3 第一次返回429，之后成功；对象5 始终返回400
+        self.calls[prompt] = self.calls.get(prompt, 0) + 1
+        if prompt == "对象3" and self.calls[prompt] == 1:
+            raise APIRequestError.from_status("限流", 429)
+        if prompt == "对象5":
+            raise APIRequestError.from_status("参数错误", 400)
+        return f'{{"key": "{prompt}"}}'
+
+
+# 测试延迟直方图与/metrics指标
+def test_metrics():
+    print("测试延迟直方图与指标...")
+
+    # 1. 直方图分位数
+    print("\n1. 直方图:")
+    histogram = Histogram(buckets=(0.1, 0.2, 0.5, 1.0))
+    for value in [0.05] * 50 + [0.15] * 45 + [0.8] * 5:
+        histogram.observe(value)
+    stats = histogram.get_stats()
+    print(f"分位数: {stats}")
+    assert stats["count"] == 100
+    assert 0 < stats["p50"] <= 0.1 and 0.1 < stats["p95"] <= 0.2 and 0.5 < stats["p99"] <= 1.0
+    assert Histogram().get_stats()["p50"] is None
+
+    # 2. 子注册表的指标累加到父注册表
+    print("\n2. 注册表:")
+    process = MetricsRegistry()
+    job = process.child(job="a")
+    job.observe("request_latency_seconds", 0.3)
+    job.inc("requests_total", status_class="2xx")
+    process.inc("requests_total", status_class="5xx")
+    assert process.get_stats()["counters"]["requests_total"] == {"2xx": 1, "5xx": 1}
+    assert job.get_stats()["counters"]["requests_total"] == {"2xx": 1}
+    text = job.render()
+    assert 'aigc_job_request_latency_seconds_bucket{job="a",le="0.5"} 1' in text
+    assert 'aigc_job_request_latency_seconds_bucket{job="a",le="+Inf"} 1' in text
+    assert 'aigc_job_requests_total{job="a",status_class="2xx"} 1' in text
+
+    # 3. 生成过程中记录请求、重试、状态类别、渲染/解析与断点耗时
+    print("\n3. 生成指标:")
+    test_dir = tempfile.mkdtemp()
+    try:
+        registry = MetricsRegistry()
+        generator = KeyGenerator(save_interval=5, metrics=registry,
+                                 retry_policy=RetryPolicy(max_attempts=2, base_delay=0,
+                                                          requeue_passes=0))
+        generator.headers = ["目标对象"]
+        generator.input_data = [{"目标对象": f"对象{i}"} for i in range(10)]
+        generator.total_rows = 10
+        generator._current_file = os.path.join(test_dir, "input.xlsx")
+        generator.start_generation(MockAPIClient(), "{{主场景}}", {"主场景": "目标对象"}, max_workers=3)
+
+        stats = generator.job_metrics.get_stats()
+        print(f"任务指标: {stats}")
+        counters = stats["counters"]
+        assert counters["requests_total"] == {"2xx": 9, "4xx": 2}
+        assert counters["retries_total"] == 1
+        assert counters["rows_total"] == {"success": 9, "error": 1}
+        histograms = stats["histograms"]
+        assert histograms["request_latency_seconds"]["count"] == 11
+        assert histograms["render_seconds"]["count"] == 10
+        assert histograms["parse_seconds"]["count"] == 9
+        assert histograms["checkpoint_seconds"]["count"] >= 1
+        assert generator.get_progress()["latency"]["count"] == 11
+
+        # 进程级指标包含本次运行，预览不计入任务指标
+        generator.preview_first_n(MockAPIClient(), 2, "{{主场景}}", {"主场景": "目标对象"}, use_cache=False)
+        assert registry.get_stats()["counters"]["requests_total"]["2xx"] == 11
+        assert generator.job_metrics.get_stats()["counters"]["requests_total"]["2xx"] == 9
+
+        text = registry.render([("tokens_total", {"type": "prompt"}, 42)])
+        assert "# TYPE aigc_request_latency_seconds histogram" in text
+        assert 'aigc_tokens_total{type="prompt"} 42' in text
+
+    finally:
+        shutil.rmtree(test_dir)
+
+    print("\n测试完成！")
+
+
+if __name__ == "__main__":
+    test_metrics()
@@ -0,0 +1,101 @@
+import sys
+import os
+import csv
+import tempfile
+import shutil
+
+# 添加项目根目录到路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from AIGC_batch.api_clients import UniversalAPIClient
+from AIGC_batch.generator import KeyGenerator
+from AIGC_batch.result_writers import export_results
+from mock_llm_server import MockLLMServer
+
+NETWORK_PHASES = ("queue", "connect", "ttfb", "receive")
+
+
+class MockAPIClient:
+    """不提供阶段细分的客户端"""
+    def generate(self, prompt):
+        return f'{{"key": "{prompt}"}}'
+
+
+def _make_generator(rows, work_dir):
+    generator = KeyGenerator()
+    generator.headers = ["目标对象"]
+    generator.input_data = [{"目标对象": f"对象{i}"} for i in range(rows)]
+    generator.total_rows = rows
+    generator._current_file = os.path.join(work_dir, "input.xlsx")
+    return generator
+
+
+# 测试单行阶段耗时分解
+def test_phase_timing():
+    print("测试单行阶段耗时...")
+
+    test_dir = tempfile.mkdtemp()
+
+    try:
+        with MockLLMServer(latency=0.05) as server:
+            client = UniversalAPIClient(server.base_url, "mock-key", "mock-model")
+
+            # 1. 客户端区分排队、建连发送、首字节与接收，服务端延迟计入首字节
+            print("\n1. 单次请求:")
+            timings = {}
+            client.generate("测试", timings=timings)
+            print(f"阶段耗时: {timings}")
+            assert set(timings) == set(NETWORK_PHASES)
+            assert 0.04 < timings["ttfb"] < 1 and timings["connect"] < timings["ttfb"]
+
+            # 2. 线程池引擎：结果携带全部阶段，进度中按行平均
+            print("\n2. 线程池引擎:")
+            generator = _make_generator(20, test_dir)
+            success, _ = generator.start_generation(client, "{{主场景}}", {"主场景": "目标对象"}, max_workers=2)
+            assert success
+            phases = generator.results[5].phases
+            print(f"第6行阶段耗时: {phases}")
+            assert {"queue", "render", "connect", "ttfb", "receive", "parse"} <= set(phases)
+            # 并发数小于提交窗口，排队的任务等待空闲线程
+            assert max(r.phases["queue"] for r in generator.results) > 0.02
+            average = generator.get_progress()["phases"]
+            print(f"平均阶段耗时: {average}")
+            assert 0.04 < average["ttfb"] < 1
+
+            # 3. 导出时可附加阶段耗时列
+            print("\n3. 导出阶段耗时列:")
+            generator.export_phases = True
+            output_path = os.path.join(test_dir, "result.csv")
+            assert export_results(generator, output_path)[0]
+            with open(output_path, encoding='utf-8-sig') as f:
+                rows = list(csv.DictReader(f))
+            assert float(rows[0]["首字节耗时(秒)"]) > 0.04 and rows[0]["重试等待(秒)"] == ""
+            generator.export_phases = False
+            assert "首字节耗时(秒)" not in generator.export_record(generator.results[0])
+
+            # 4. asyncio引擎通过请求打点区分各阶段
+            print("\n4. asyncio引擎:")
+            generator = _make_generator(20, test_dir)
+            success, _ = generator.run_generation_async(client, "{{主场景}}", {"主场景": "目标对象"},
+                                                        max_concurrency=5)
+            assert success
+            phases = generator.results[3].phases
+            print(f"第4行阶段耗时: {phases}")
+            assert set(NETWORK_PHASES) <= set(phases) and 0.04 < phases["ttfb"] < 1
+
+            client.close()
+
+        # 5. 客户端不提供细分时，整个请求计入首字节
+        print("\n5. 普通客户端:")
+        generator = _make_generator(3, test_dir)
+        result = generator.generate_single(MockAPIClient(), 0, "{{主场景}}", {"主场景": "目标对象"})
+        assert set(result.phases) == {"render", "ttfb", "parse"}
+
+        print("\n测试完成！")
+
+    finally:
+        shutil.rmtree(test_dir)
+
+
+if __name__ == "__main__":
+    test_phase_timing()
@@ -0,0 +1,94 @@
+import sys
+import os
+import time
+import tempfile
+import shutil
+
+# 添加项目根目录到路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from AIGC_batch.generator import KeyGenerator, ProgressTracker, GenerationResult
+
+
+class MockAPIClient:
+    def generate(self, prompt):
+        if prompt.endswith("3"):
+            raise Exception("模拟失败")
+        time.sleep(0.002)
+        return f'{{"key": "{prompt}"}}'
+
+
+# 测试增量进度统计
+def test_progress_stats():
+    print("测试增量进度统计...")
+
+    # 1. 计数、耗时与补跑覆盖
+    print("\n1. 增量计数:")
+    tracker = ProgressTracker(tick_interval=0.05)
+    failed = GenerationResult(0, {}, "", False, attempts=2)
+    tracker.record(failed)
+    tracker.record(GenerationResult(1, {}, "ok", True, generation_time=0.5))
+    tracker.record(None)
+    stats = tracker.get_stats()
+    assert (stats["completed"], stats["success"], stats["error"], stats["retries"]) == (3, 1, 2, 1)
+
+    # 补跑成功覆盖之前的失败结果
+    tracker.record(GenerationResult(0, {}, "ok", True, generation_time=1.5, attempts=3), previous=failed)
+    stats = tracker.get_stats()
+    print(f"统计: {stats}")
+    assert (stats["completed"], stats["success"], stats["error"], stats["retries"]) == (3, 2, 1, 2)
+    assert stats["total_generation_time"] == 2.0 and stats["avg_generation_time"] == 1.0
+
+    # 2. 吞吐量EWMA：窗口结束时更新，没有新结果时逐步衰减
+    print("\n2. 吞吐量:")
+    tracker = ProgressTracker(tick_interval=0.05)
+    for _ in range(10):
+        tracker.record(GenerationResult(0, {}, "ok", True))
+        time.sleep(0.01)
+    busy = tracker.get_stats()["throughput"]
+    time.sleep(0.2)
+    idle = tracker.get_stats()["throughput"]
+    print(f"吞吐量: {busy:.1f} -> {idle:.1f} 条/秒")
+    assert 30 < busy < 150 and idle < busy
+
+    # 3. 断点恢复的结果计入完成数
+    tracker.reset([GenerationResult(5, {}, "ok", True), None])
+    assert tracker.get_stats()["completed"] == 1 and tracker.get_stats()["rows_per_second"] == 0
+
+    # 4. 生成后进度与结果一致，读取不遍历结果列表
+    print("\n3. 生成进度:")
+    test_dir = tempfile.mkdtemp()
+
+    try:
+        generator = KeyGenerator()
+        generator.headers = ["目标对象"]
+        generator.input_data = [{"目标对象": f"对象{i}"} for i in range(200)]
+        generator.total_rows = 200
+        generator._current_file = os.path.join(test_dir, "input.xlsx")
+        generator.start_generation(MockAPIClient(), "{{主场景}}", {"主场景": "目标对象"}, max_workers=8)
+
+        progress = generator.get_progress()
+        print(f"进度: {progress}")
+        assert progress["current"] == 200 and progress["progress"] == 100
+        assert progress["success"] == sum(1 for r in generator.results if r.success) == 180
+        assert progress["rows_per_second"] > 0 and progress["eta_seconds"] is None
+
+        class CountingList(list):
+            iterations = 0
+
+            def __iter__(self):
+                CountingList.iterations += 1
+                return super().__iter__()
+
+        generator.results = CountingList(generator.results)
+        generator.get_progress()
+        assert CountingList.iterations == 0
+
+        print("\n测试完成！")
+
+    finally:
+        shutil.rmtree(test_dir)
+
+
+if __name__ == "__main__":
+    test_progress_stats()
@@ -0,0 +1,96 @@
+import sys
+import os
+import json
+import time
+import threading
+
+# 添加项目根目录到路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from AIGC_batch.generator import GenerationResult
+from AIGC_batch.progress_stream import ProgressBroadcaster
+
+
+def _parse(chunks):
+    """解析SSE文本为 (事件类型, 数据) 列表"""
+    events = []
+    for chunk in chunks:
+        if chunk.startswith(":"):
+            events.append(("heartbeat", None))
+            continue
+        kind, data = chunk.strip().split("\n")
+        events.append((kind[len("event: "):], json.loads(data[len("data: "):])))
+    return events
+
+
+# 测试SSE进度推送
+def test_progress_stream():
+    print("测试SSE进度推送...")
+
+    broadcaster = ProgressBroadcaster(min_interval=0.1, max_rows_per_event=50)
+    progress = {"current": 0, "total": 3000, "status": "generating"}
+    done = threading.Event()
+    chunks = []
+
+    def consume():
+        for chunk in broadcaster.stream(lambda: dict(progress), stop=done.is_set):
+            chunks.append(chunk)
+
+    consumer = threading.Thread(target=consume)
+    consumer.start()
+    time.sleep(0.05)
+
+    # 1. 约1秒内完成3000行：推送被节流合并，而不是每行一条
+    print("\n1. 节流与合并:")
+    broadcaster.publish_state("generating")
+    for i in range(3000):
+        broadcaster.publish_row(GenerationResult(i, {}, "", i % 100 != 0, generation_time=0.2,
+                                                 error_type=None if i % 100 else "timeout"))
+        progress["current"] = i + 1
+        broadcaster.notify()
+        if i % 300 == 0:
+            time.sleep(0.1)
+    progress["status"] = "completed"
+    broadcaster.publish_state("completed", "生成完成")
+    time.sleep(0.3)
+    done.set()
+    broadcaster.notify()
+    consumer.join()
+
+    events = _parse(chunks)
+    kinds = [kind for kind, _ in events]
+    print(f"推送次数: {len(events)}，类型: {set(kinds)}")
+    assert len(events) < 100
+
+    # 首条为完整进度，之后只包含变化的字段
+    assert events[0] == ("progress", {"current": 0, "total": 3000, "status": "generating"})
+    deltas = [data for kind, data in events[1:] if kind == "progress"]
+    assert deltas and all("total" not in d for d in deltas)
+    assert deltas[-1].get("status") == "completed" or any(d.get("status") == "completed" for d in deltas)
+    assert any(d.get("current") == 3000 for d in deltas)
+
+    # 行事件：每批不超过上限，超出部分计入dropped，总数守恒
+    batches = [data for kind, data in events if kind == "rows"]
+    assert all(len(b["rows"]) <= 50 for b in batches)
+    assert sum(len(b["rows"]) + b["dropped"] for b in batches) == 3000
+    assert batches[-1]["rows"][-1] == {"row": 2999, "status": "success", "latency": 0.2, "error_type": None}
+
+    # 状态变化逐条送达
+    states = [data["status"] for kind, data in events if kind == "state"]
+    assert states == ["generating", "completed"]
+
+    # 2. 连接落后超过缓存时丢弃最旧的事件并计数
+    print("\n2. 缓存溢出:")
+    small = ProgressBroadcaster(min_interval=0, buffer_size=10)
+    stream = small.stream(lambda: {})
+    next(stream)
+    for i in range(25):
+        small.publish_row(GenerationResult(i, {}, "", True))
+    kind, data = _parse([next(stream)])[0]
+    assert kind == "rows" and len(data["rows"]) == 10 and data["dropped"] == 15
+
+    print("\n测试完成！")
+
+
+if __name__ == "__main__":
+    test_progress_stream()
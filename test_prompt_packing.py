@@ -0,0 +1,129 @@
+import sys
+import os
+import json
+import tempfile
+import shutil
+import threading
+
+# 添加项目根目录到路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from AIGC_batch.api_clients import UniversalAPIClient
+from AIGC_batch.generator import KeyGenerator, PromptPacker, PromptTemplate
+from mock_llm_server import MockLLMServer
+
+# 说明部分远长于变量取值（与实际的话题召回模板一致）
+TEMPLATE = "根据场景 {{主场景}} 与 {{次场景}} 生成搜索Key，返回JSON。" + "要求：Key简洁、覆盖用户常见的搜索说法。" * 20
+VARIABLES = {"主场景": "场景", "次场景": "子场景"}
+
+
+class PackingMockClient:
+    """按打包Prompt中的各组输入返回JSON数组；drop 指定的组编号不返回，garbage 为真时返回无法解析的内容"""
+    def __init__(self, drop=(), garbage=False):
+        self.drop = set(drop)
+        self.garbage = garbage
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def generate(self, prompt):
+        with self.lock:
+            self.calls.append(prompt)
+        groups = [json.loads(line) for line in prompt.splitlines() if line.startswith('{"index"')]
+        if not groups:
+            return json.dumps({"key": prompt.split()[1]}, ensure_ascii=False)
+        if self.garbage:
+            return "抱歉，无法处理"
+        return json.dumps([{"index": g["index"], "result": {"key": g["主场景"]}}
+                           for g in groups if g["index"] not in self.drop], ensure_ascii=False)
+
+
+def _make_generator(rows, work_dir):
+    generator = KeyGenerator()
+    generator.headers = ["场景", "子场景"]
+    generator.input_data = [{"场景": f"对象{i}", "子场景": f"子{i}"} for i in range(rows)]
+    generator.total_rows = rows
+    generator._current_file = os.path.join(work_dir, "input.xlsx")
+    return generator
+
+
+# 测试多行打包请求
+def test_prompt_packing():
+    print("测试多行打包请求...")
+
+    # 1. 打包Prompt只包含一次模板，响应按编号拆回
+    print("\n1. 打包与拆分:")
+    packer = PromptPacker(PromptTemplate(TEMPLATE, VARIABLES))
+    prompt = packer.build([{"场景": "a", "子场景": "b"}, {"场景": "c\n换行", "子场景": None}])
+    assert prompt.count(TEMPLATE) == 1
+    assert '{"index": 2, "主场景": "c\\n换行", "次场景": ""}' in prompt
+    response = '结果如下：[{"index": 2, "result": {"key": "c"}}, {"index": 1, "result": "{\\"key\\": \\"a\\"}"}]'
+    assert packer.split(response, 2) == {0: '{"key": "a"}', 1: '{"key": "c"}'}
+    # 编号重复、越界或结果为空的组不采用
+    response = '[{"index": 1, "result": {"k": 1}}, {"index": 1, "result": {"k": 2}}, {"index": 3, "result": {}}]'
+    assert packer.split(response, 3) == {}
+    assert packer.split("不是JSON", 2) == {}
+
+    test_dir = tempfile.mkdtemp()
+
+    try:
+        # 2. 每4行一个请求
+        print("\n2. 打包生成:")
+        generator = _make_generator(20, test_dir)
+        client = PackingMockClient()
+        success, message = generator.start_generation(client, TEMPLATE, VARIABLES, max_workers=3, pack_size=4)
+        assert success and len(client.calls) == 5
+        assert [r.parsed_result for r in generator.results] == [{"key": f"对象{i}"} for i in range(20)]
+        packing = generator.get_progress()["packing"]
+        print(f"打包统计: {packing}")
+        assert packing["requests"] == 5 and packing["rows"] == 20 and packing["requests_saved"] == 15
+        assert packing["prompt_chars_saved"] > 0 and packing["fallback_rows"] == 0
+
+        # 3. 响应缺少的组退回逐行请求
+        print("\n3. 缺失的组:")
+        generator = _make_generator(20, test_dir)
+        client = PackingMockClient(drop={2})
+        success, message = generator.start_generation(client, TEMPLATE, VARIABLES, max_workers=3, pack_size=4)
+        assert success and len(client.calls) == 5 + 5
+        assert all(r.success for r in generator.results)
+        assert generator.results[1].parsed_result == {"key": "对象1"}
+        packing = generator.get_progress()["packing"]
+        assert packing["fallback_rows"] == 5 and packing["requests_saved"] == 10
+
+        # 4. 无法解析的响应：整包退回逐行请求
+        print("\n4. 格式错误的响应:")
+        generator = _make_generator(10, test_dir)
+        client = PackingMockClient(garbage=True)
+        success, message = generator.start_generation(client, TEMPLATE, VARIABLES, max_workers=2, pack_size=5)
+        assert success and len(client.calls) == 2 + 10
+        assert all(r.success for r in generator.results)
+
+        # 5. 不足两行时不打包
+        print("\n5. 单行:")
+        generator = _make_generator(5, test_dir)
+        client = PackingMockClient()
+        success, message = generator.start_generation(client, TEMPLATE, VARIABLES, max_workers=2, pack_size=4)
+        assert success and len(client.calls) == 2
+        assert generator.results[4].parsed_result == {"key": "对象4"}
+
+        # 6. 打包请求的输出上限按行数放大（限速预估使用同一上限），逐行请求保持客户端设置
+        print("\n6. 输出上限:")
+        with MockLLMServer(latency=0) as server:
+            client = UniversalAPIClient(server.base_url, "mock-key", "mock-model")
+            client.set_rate_limit(tpm=10 ** 7)
+            generator = _make_generator(8, test_dir)
+            generator.start_generation(client, TEMPLATE, VARIABLES, max_workers=1, pack_size=4)
+            print(f"max_tokens: {server.max_tokens}")
+            # 模拟服务回显Prompt，打包响应无法拆分，各行退回逐行请求
+            assert sorted(server.max_tokens) == [500] * 8 + [2000] * 2
+            estimated = client.rate_limiter.get_stats()["estimated_tokens"]
+            assert estimated >= 2 * 2000 + 8 * 500
+            client.close()
+
+        print("\n测试完成！")
+
+    finally:
+        shutil.rmtree(test_dir)
+
+
+if __name__ == "__main__":
+    test_prompt_packing()
@@ -0,0 +1,62 @@
+import sys
+import os
+
+# 添加项目根目录到路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from AIGC_batch.generator import KeyGenerator, PromptTemplate
+
+
+# 测试预编译Prompt模板
+def test_prompt_template():
+    print("测试预编译Prompt模板...")
+
+    variables = {"主场景": "目标对象", "子场景": "营销主题"}
+
+    # 1. 两种占位符语法，字面量中的花括号原样保留
+    print("\n1. 渲染:")
+    template = PromptTemplate('对象：{{主场景}}，主题：{子场景}，输出 {"key": "..."}', variables)
+    prompt = template.render({"目标对象": "宝妈", "营销主题": None})
+    print(f"渲染结果: {prompt}")
+    assert prompt == '对象：宝妈，主题：，输出 {"key": "..."}'
+    assert template.render({"目标对象": 3.5}) == '对象：3.5，主题：，输出 {"key": "..."}'
+
+    # 2. 变量值中的占位符不会被再次替换
+    print("\n2. 变量值包含占位符:")
+    prompt = template.render({"目标对象": "{{子场景}}", "营销主题": "年货节"})
+    assert prompt == '对象：{{子场景}}，主题：年货节，输出 {"key": "..."}'
+
+    # 3. 编译时校验占位符与列名
+    print("\n3. 模板校验:")
+    try:
+        PromptTemplate("{{主场景}} {{Tab词}}", variables)
+        assert False, "未映射的变量应报错"
+    except ValueError as e:
+        print(f"校验错误: {e}")
+        assert "Tab词" in str(e)
+
+    try:
+        PromptTemplate("{{主场景}}", variables, headers=["目标对象"])
+        assert False, "不存在的列应报错"
+    except ValueError as e:
+        print(f"校验错误: {e}")
+        assert "营销主题" in str(e)
+
+    # 4. 模板校验失败时不启动生成
+    print("\n4. 生成前校验:")
+    generator = KeyGenerator()
+    generator.headers = ["目标对象"]
+    generator.input_data = [{"目标对象": "宝妈"}]
+    generator.total_rows = 1
+    success, message = generator.start_generation(object(), "{{主场景}} {{子场景}}", {"主场景": "目标对象"})
+    print(f"生成消息: {message}")
+    assert not success and "子场景" in message
+    assert not generator.get_progress()["is_generating"]
+
+    assert generator.render_prompt("{{主场景}}!", {"主场景": "目标对象"}, {"目标对象": "宝妈"}) == "宝妈!"
+
+    print("\n测试完成！")
+
+
+if __name__ == "__main__":
+    test_prompt_template()
@@ -0,0 +1,67 @@
+import sys
+import os
+import time
+import concurrent.futures
+
+# 添加项目根目录到路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from AIGC_batch.api_clients import UniversalAPIClient, RateLimiter
+from mock_llm_server import MockLLMServer
+
+
+# 测试RPM/TPM令牌桶限速
+def test_rate_limiter():
+    print("测试RPM/TPM令牌桶限速...")
+
+    # 1. token预估
+    print("\n1. token预估:")
+    assert RateLimiter.estimate_tokens("abcdefgh", 100) == 102
+    assert RateLimiter.estimate_tokens("目标对象", 0) == 4
+
+    # 2. RPM匀速放行：桶容量为1秒配额，超出部分按速率顺延
+    print("\n2. RPM限速:")
+    limiter = RateLimiter(rpm=600)  # 每秒10个
+    waits = [limiter.reserve(0) for _ in range(15)]
+    print(f"等待时间: {[round(w, 2) for w in waits]}")
+    assert all(w == 0 for w in waits[:10])
+    assert abs(waits[14] - 0.5) < 0.05
+    # 等待时间逐个递增，不会集中突发
+    assert all(b > a for a, b in zip(waits[10:], waits[11:]))
+
+    # 3. TPM按实际用量修正
+    print("\n3. TPM修正:")
+    limiter = RateLimiter(tpm=6000)  # 每秒100个token
+    assert limiter.reserve(100) == 0
+    over_wait = limiter.reserve(100)
+    assert over_wait > 0.9
+    limiter.reconcile(100, 10)  # 实际只用了10个，归还90
+    assert limiter.reserve(0) < over_wait - 0.8
+    assert limiter.get_stats()["actual_tokens"] == 10
+
+    # 4. 多线程请求按RPM节奏发出
+    print("\n4. 客户端限速:")
+    with MockLLMServer(latency=0) as server:
+        client = UniversalAPIClient(server.base_url, "mock-key", "mock-model")
+        client.set_rate_limit(rpm=1200)  # 每秒20个，初始突发20个
+
+        start = time.time()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=10) as executor:
+            list(executor.map(client.generate, [f"行{i}" for i in range(30)]))
+        elapsed = time.time() - start
+
+        stats = client.rate_limiter.get_stats()
+        print(f"耗时: {elapsed:.2f}秒，限速统计: {stats}")
+        assert elapsed >= 0.45
+        assert stats["requests"] == 30
+        assert stats["actual_tokens"] > 0
+
+        client.set_rate_limit()
+        assert client.rate_limiter is None
+        client.close()
+
+    print("\n测试完成！")
+
+
+if __name__ == "__main__":
+    test_rate_limiter()
@@ -0,0 +1,117 @@
+import sys
+import os
+import time
+import tempfile
+import shutil
+
+# 添加项目根目录到路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from AIGC_batch.generator import KeyGenerator
+from AIGC_batch.response_cache import ResponseCache
+
+
+class CountingAPIClient:
+    """记录请求次数的模拟客户端"""
+    model = "mock-model"
+    temperature = 0.3
+    max_tokens = 500
+
+    def __init__(self):
+        self.calls = 0
+
+    def generate(self, prompt):
+        self.calls += 1
+        return f'{{"key": "{prompt}"}}'
+
+
+def _make_generator(work_dir, cache):
+    generator = KeyGenerator(cache=cache)
+    generator.headers = ["目标对象", "营销主题"]
+    generator.input_data = [{"目标对象": f"对象{i}", "营销主题": f"主题{i}"} for i in range(20)]
+    generator.total_rows = 20
+    generator._current_file = os.path.join(work_dir, "input.xlsx")
+    return generator
+
+
+# 测试响应缓存
+def test_response_cache():
+    print("测试响应缓存...")
+
+    test_dir = tempfile.mkdtemp()
+
+    try:
+        cache_path = os.path.join(test_dir, "cache.sqlite")
+
+        # 1. 缓存键区分Prompt与生成参数
+        print("\n1. 缓存键:")
+        key = ResponseCache.make_key("提示词", "m", 0.3, 500)
+        assert key == ResponseCache.make_key("提示词", "m", 0.3, 500)
+        assert key != ResponseCache.make_key("提示词", "m", 0.7, 500)
+        assert key != ResponseCache.make_key("提示词", "m2", 0.3, 500)
+
+        # 2. 首次运行全部请求并写入缓存，重跑时全部命中
+        print("\n2. 重复运行命中缓存:")
+        client = CountingAPIClient()
+        generator = _make_generator(test_dir, ResponseCache(cache_path))
+        generator.start_generation(client, "{{主场景}}", {"主场景": "目标对象"})
+        assert client.calls == 20
+        assert generator.get_progress()["cache"] == {"hits": 0, "misses": 20}
+
+        # 新进程重新打开同一个缓存文件
+        generator = _make_generator(test_dir, ResponseCache(cache_path))
+        generator.start_generation(client, "{{主场景}}", {"主场景": "目标对象"})
+        progress = generator.get_progress()
+        print(f"缓存统计: {progress['cache']}")
+        assert client.calls == 20
+        assert progress["cache"] == {"hits": 20, "misses": 0}
+        assert all(r.cached and r.attempts == 0 for r in generator.results)
+        assert generator.results[3].parsed_result == {"key": "对象3"}
+
+        # 3. 模板修改后只有渲染结果变化的行重新请求
+        print("\n3. 修改模板:")
+        generator.start_generation(client, "{{主场景}}-{{子场景}}",
+                                   {"主场景": "目标对象", "子场景": "营销主题"})
+        assert client.calls == 40
+
+        # 4. 跳过缓存时重新请求
+        print("\n4. 跳过缓存:")
+        generator.start_generation(client, "{{主场景}}", {"主场景": "目标对象"}, use_cache=False)
+        assert client.calls == 60
+        assert not any(r.cached for r in generator.results)
+
+        # 5. 失败的响应不写入缓存
+        class FailingAPIClient(CountingAPIClient):
+            def generate(self, prompt):
+                raise Exception("模拟失败")
+
+        generator.start_generation(FailingAPIClient(), "失败{{主场景}}", {"主场景": "目标对象"})
+        assert generator.get_progress()["cache"]["hits"] == 0
+        assert generator.cache.get_stats()["entries"] == 40
+
+        # 6. 按条数、大小与保留时间淘汰
+        print("\n5. 缓存淘汰:")
+        cache = ResponseCache(os.path.join(test_dir, "evict.sqlite"), max_entries=5, max_bytes=40)
+        for i in range(10):
+            cache.set(f"k{i}", "x" * 10)
+        cache.evict()
+        stats = cache.get_stats()
+        print(f"淘汰后: {stats}")
+        assert stats["entries"] == 4 and stats["bytes"] == 40
+        assert cache.get("k0") is None and cache.get("k9") == "x" * 10
+
+        cache.max_age = 0.01
+        time.sleep(0.02)
+        assert cache.get("k9") is None
+        cache.evict()
+        assert cache.get_stats()["entries"] == 0
+        cache.close()
+
+        print("\n测试完成！")
+
+    finally:
+        shutil.rmtree(test_dir)
+
+
+if __name__ == "__main__":
+    test_response_cache()
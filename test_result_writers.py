@@ -0,0 +1,143 @@
+import sys
+import os
+import csv
+import json
+import time
+import threading
+import tempfile
+import shutil
+
+# 添加项目根目录到路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from AIGC_batch.api_clients import APIRequestError
+from AIGC_batch.generator import GenerationResult, KeyGenerator, RetryPolicy
+from AIGC_batch.result_writers import ResultTailer, detect_format, export_results
+
+
+class SlowAPIClient:
+    """第一行首次请求失败，第5行起多一个JSON字段"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.failed = False
+
+    def generate(self, prompt):
+        time.sleep(0.01)
+        with self.lock:
+            if prompt == "对象0" and not self.failed:
+                self.failed = True
+                raise APIRequestError("503", 503, "server_error")
+        index = int(prompt[2:])
+        extra = f', "extra": {{"n": {index}}}' if index >= 5 else ""
+        return f'{{"key": "{prompt}"{extra}}}'
+
+
+def _make_generator(work_dir):
+    # 单次调度只尝试一次，失败行在补跑轮中再次写出
+    generator = KeyGenerator(retry_policy=RetryPolicy(max_attempts=1))
+    generator.headers = ["目标对象"]
+    generator.input_data = [{"目标对象": f"对象{i}"} for i in range(20)]
+    generator.total_rows = 20
+    generator._current_file = os.path.join(work_dir, "input.xlsx")
+    return generator
+
+
+def _read_csv(path):
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        return list(csv.DictReader(f))
+
+
+# 测试CSV/JSONL导出与边生成边写出
+def test_result_writers():
+    print("测试结果输出格式...")
+
+    test_dir = tempfile.mkdtemp()
+
+    try:
+        # 1. 格式识别
+        print("\n1. 格式识别:")
+        assert detect_format("a.CSV") == "csv"
+        assert detect_format("a.xlsx", "jsonl") == "jsonl"
+        assert detect_format("result") == "xlsx"
+        try:
+            detect_format("a.txt")
+            assert False
+        except ValueError:
+            pass
+
+        # 2. 边生成边写出JSONL：生成过程中文件已有内容
+        print("\n2. 边生成边写出:")
+        generator = _make_generator(test_dir)
+        tail_path = os.path.join(test_dir, "tail.jsonl")
+        tailer = ResultTailer(generator, tail_path, flush_interval=0.05).start()
+        seen_during_run = []
+
+        def on_progress(current, total, success, error):
+            if current == 15:
+                time.sleep(0.2)
+                with open(tail_path, encoding='utf-8') as f:
+                    seen_during_run.append(len(f.readlines()))
+
+        generator.start_generation(SlowAPIClient(), "{{主场景}}", {"主场景": "目标对象"},
+                                   on_progress=on_progress, max_workers=2)
+        success, message = tailer.close()
+        print(f"生成中已写出: {seen_during_run}，{message}")
+        assert success and seen_during_run and seen_during_run[0] >= 10
+
+        # 补跑的行出现过两次，结束时按最终结果重写，每行只保留一条
+        with open(tail_path, encoding='utf-8') as f:
+            records = [json.loads(line) for line in f]
+        assert [r["行索引"] for r in records] == list(range(20))
+        assert records[0]["状态"] == "成功" and records[0]["尝试次数"] == 2
+        assert records[7]["JSON.extra.n"] == 7 and "JSON.extra.n" not in records[1]
+
+        # 3. 边生成边写出CSV：后出现的JSON列在结束时补齐表头
+        generator = _make_generator(test_dir)
+        tail_path = os.path.join(test_dir, "tail.csv")
+        with ResultTailer(generator, tail_path):
+            generator.start_generation(SlowAPIClient(), "{{主场景}}", {"主场景": "目标对象"}, max_workers=2)
+        rows = _read_csv(tail_path)
+        assert len(rows) == 20 and rows[9]["JSON.extra.n"] == "9"
+
+        # 4. 生成结束后导出CSV与JSONL，列与xlsx导出一致
+        print("\n3. 导出CSV/JSONL:")
+        csv_path = os.path.join(test_dir, "result.csv")
+        success, message = export_results(generator, csv_path)
+        print(message)
+        rows = _read_csv(csv_path)
+        assert list(rows[0].keys()) == ["行索引", "目标对象", "召回Key", "状态", "错误信息", "生成耗时(秒)",
+                                        "尝试次数", "JSON.extra.n", "JSON.key"]
+        assert rows[3]["JSON.key"] == "对象3" and rows[3]["JSON.extra.n"] == ""
+
+        jsonl_path = os.path.join(test_dir, "result.data")
+        success, message = export_results(generator, jsonl_path, "jsonl")
+        with open(jsonl_path, encoding='utf-8') as f:
+            assert len(f.readlines()) == 20
+
+        # xlsx 与不支持边写边出的格式
+        assert export_results(generator, os.path.join(test_dir, "result.xlsx"))[0]
+        try:
+            ResultTailer(generator, os.path.join(test_dir, "result.xlsx"))
+            assert False
+        except ValueError:
+            pass
+
+        # 4. 其他线程扁平化新结果时读取JSON列（生成中请求导出）
+        print("\n4. 并发读取JSON列:")
+        results = [GenerationResult(i, {}, "{}", True, parsed_result={f"k{i}": i}) for i in range(20000)]
+        flattening = threading.Thread(target=lambda: [generator._flatten_result(r) for r in results])
+        flattening.start()
+        while flattening.is_alive():
+            generator.json_columns()
+        flattening.join()
+        assert len(generator.json_columns()) == 20000 + 2
+
+        print("\n测试完成！")
+
+    finally:
+        shutil.rmtree(test_dir)
+
+
+if __name__ == "__main__":
+    test_result_writers()
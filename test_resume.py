@@ -0,0 +1,109 @@
+import sys
+import os
+import threading
+import tempfile
+import shutil
+
+# 添加项目根目录到路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from AIGC_batch.api_clients import APIRequestError
+from AIGC_batch.generator import KeyGenerator, RetryPolicy
+
+
+class CountingAPIClient:
+    """记录请求过的提示词，可指定始终失败的提示词"""
+
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+        self.prompts = []
+        self.lock = threading.Lock()
+
+    def generate(self, prompt):
+        with self.lock:
+            self.prompts.append(prompt)
+        if prompt in self.failing:
+            raise APIRequestError("503", 503, "server_error")
+        return f'{{"key": "{prompt}"}}'
+
+
+def _make_generator(work_dir):
+    generator = KeyGenerator(save_interval=5, retry_policy=RetryPolicy(max_attempts=1, requeue_passes=0))
+    generator.headers = ["目标对象"]
+    generator.input_data = [{"目标对象": f"对象{i}"} for i in range(40)]
+    generator.total_rows = 40
+    generator._current_file = os.path.join(work_dir, "input.xlsx")
+    return generator
+
+
+# 测试断点续传只补齐缺失与失败的行
+def test_resume():
+    print("测试跳过已完成行的断点续传...")
+
+    test_dir = tempfile.mkdtemp()
+    template, variables = "{{主场景}}", {"主场景": "目标对象"}
+
+    try:
+        # 1. 首次运行在完成25行后中断，其中2行失败
+        print("\n1. 首次运行中断:")
+        client = CountingAPIClient(failing={"对象3", "对象7"})
+
+        def on_progress(current, total, success, error):
+            if current == 25:
+                raise RuntimeError("模拟中断")
+
+        generator = _make_generator(test_dir)
+        success, message = generator.start_generation(client, template, variables,
+                                                      on_progress=on_progress, max_workers=4)
+        print(f"生成消息: {message}")
+        assert not success
+
+        # 2. 加载断点后只调度缺失或失败的行
+        print("\n2. 断点续传:")
+        generator = _make_generator(test_dir)
+        success, message = generator.load_checkpoint(generator.get_latest_checkpoint(test_dir))
+        print(f"加载消息: {message}")
+        assert success
+        done_before = {r.row_index for r in generator.results if r.success}
+        assert len(done_before) >= 23 and 3 not in done_before and 7 not in done_before
+
+        client = CountingAPIClient()
+        success, message = generator.start_generation(client, template, variables, max_workers=4)
+        progress = generator.get_progress()
+        print(f"生成消息: {message}，跳过: {progress['skipped']}")
+        assert success
+        requested = {int(p[2:]) for p in client.prompts}
+        assert requested.isdisjoint(done_before)
+        assert {3, 7} <= requested and len(client.prompts) == 40 - len(done_before)
+
+        # 恢复的结果与新结果合并，补跑的行累计尝试次数
+        assert progress["skipped"] == len(done_before)
+        assert progress["current"] == 40 and progress["success"] == 40
+        assert [r.row_index for r in generator.results] == list(range(40))
+        assert generator.results[3].attempts == 2
+
+        # 3. 最终断点包含全部行，再次续传无需任何请求
+        generator = _make_generator(test_dir)
+        generator.load_checkpoint(generator.get_latest_checkpoint(test_dir))
+        client = CountingAPIClient()
+        generator.start_generation(client, template, variables)
+        assert client.prompts == [] and generator.get_progress()["skipped"] == 40
+
+        # 4. 模板变化或关闭续传时重新生成全部行
+        print("\n3. 模板变化:")
+        generator.load_checkpoint(generator.get_latest_checkpoint(test_dir))
+        generator.start_generation(client, "新{{主场景}}", variables)
+        assert len(client.prompts) == 40 and generator.get_progress()["skipped"] == 0
+
+        generator.load_checkpoint(generator.get_latest_checkpoint(test_dir))
+        generator.start_generation(client, "新{{主场景}}", variables, resume=False)
+        assert len(client.prompts) == 80
+
+        print("\n测试完成！")
+
+    finally:
+        shutil.rmtree(test_dir)
+
+
+if __name__ == "__main__":
+    test_resume()
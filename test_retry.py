@@ -0,0 +1,129 @@
+import sys
+import os
+import time
+import threading
+import tempfile
+import shutil
+from email.utils import formatdate
+
+import openpyxl
+
+# 添加项目根目录到路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from AIGC_batch.api_clients import APIRequestError, parse_retry_after
+from AIGC_batch.generator import KeyGenerator, RetryPolicy
+
+
+class FlakyAPIClient:
+    """按提示词预设失败次数的模拟客户端"""
+
+    def __init__(self, failures):
+        # {prompt: [异常, ...]}，依次抛出后返回成功
+        self.failures = failures
+        self.calls = {}
+        self.lock = threading.Lock()
+
+    def generate(self, prompt):
+        with self.lock:
+            self.calls[prompt] = self.calls.get(prompt, 0) + 1
+            pending = self.failures.get(prompt)
+            error = pending.pop(0) if pending else None
+        if error:
+            raise error
+        return f'{{"key": "{prompt}"}}'
+
+
+def _make_generator(rows, work_dir, **policy):
+    generator = KeyGenerator(retry_policy=RetryPolicy(base_delay=0.01, **policy))
+    generator.headers = ["目标对象"]
+    generator.input_data = [{"目标对象": f"对象{i}"} for i in range(rows)]
+    generator.total_rows = rows
+    generator._current_file = os.path.join(work_dir, "input.xlsx")
+    return generator
+
+
+# 测试重试、Retry-After与失败行补跑
+def test_retry():
+    print("测试重试与补跑...")
+
+    # 1. Retry-After 解析
+    print("\n1. Retry-After解析:")
+    assert parse_retry_after("3") == 3.0
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("abc") is None
+    assert 8 <= parse_retry_after(formatdate(time.time() + 10, usegmt=True)) <= 10
+
+    # 2. 退避时间：遵循Retry-After，否则指数退避加抖动
+    policy = RetryPolicy(base_delay=1.0, max_delay=4.0)
+    throttled = APIRequestError.from_status("429", 429, {"Retry-After": "7"})
+    assert policy.next_delay(1, throttled) == 7.0
+    assert 0.5 <= policy.next_delay(1, APIRequestError("超时", error_type="timeout")) <= 1.0
+    assert 1.0 <= policy.next_delay(2, APIRequestError("503", 503, "server_error")) <= 2.0
+    assert policy.next_delay(3, throttled) is None
+    assert policy.next_delay(1, APIRequestError.from_status("400", 400)) is None
+    assert policy.next_delay(1, ValueError("未知错误")) is None
+
+    test_dir = tempfile.mkdtemp()
+
+    try:
+        # 3. 可重试错误自动重试，不可重试错误立即失败
+        print("\n2. 行内重试:")
+        client = FlakyAPIClient({
+            "对象1": [APIRequestError.from_status("429", 429, {"Retry-After": "0.01"})],
+            "对象2": [APIRequestError("超时", error_type="timeout")] * 2,
+            "对象3": [APIRequestError.from_status("401 Unauthorized", 401)],
+        })
+        generator = _make_generator(5, test_dir, requeue_passes=0)
+        success, message = generator.start_generation(client, "{{主场景}}", {"主场景": "目标对象"})
+        print(f"生成消息: {message}")
+        results = generator.results
+        assert results[0].success and results[0].attempts == 1
+        assert results[1].success and results[1].attempts == 2
+        assert results[2].success and results[2].attempts == 3
+        assert not results[3].success and results[3].attempts == 1
+        assert results[3].error_type == "client_error" and client.calls["对象3"] == 1
+        assert generator.get_progress()["retries"] == 3
+
+        # 4. 重试耗尽的行在主流程结束后降低并发补跑
+        print("\n3. 失败行补跑:")
+        client = FlakyAPIClient({
+            "对象4": [APIRequestError("503", 503, "server_error")] * 3,
+            "对象6": [APIRequestError("503", 503, "server_error")] * 10,
+        })
+        generator = _make_generator(8, test_dir, max_attempts=3)
+        success, message = generator.start_generation(
+            client, "{{主场景}}", {"主场景": "目标对象"}, max_workers=4
+        )
+        progress = generator.get_progress()
+        print(f"生成消息: {message}")
+        print(f"进度: {progress}")
+        assert generator.results[4].success and generator.results[4].attempts == 4
+        assert not generator.results[6].success and generator.results[6].attempts == 6
+        assert progress["success"] == 7 and progress["error"] == 1
+        assert progress["requeued"] == 2
+
+        # 5. asyncio引擎同样重试并补跑
+        print("\n4. asyncio引擎:")
+        client = FlakyAPIClient({"对象0": [APIRequestError("503", 503, "server_error")] * 3})
+        generator = _make_generator(3, test_dir)
+        generator.run_generation_async(client, "{{主场景}}", {"主场景": "目标对象"}, max_concurrency=2)
+        assert generator.results[0].success and generator.results[0].attempts == 4
+
+        # 6. 导出包含尝试次数列
+        print("\n5. 导出尝试次数:")
+        output_file = os.path.join(test_dir, "output.xlsx")
+        success, message = generator.export_result(output_file)
+        assert success
+        sheet = openpyxl.load_workbook(output_file).active
+        assert sheet.cell(1, 6).value == "尝试次数"
+        assert sheet.cell(2, 6).value == 4
+
+        print("\n测试完成！")
+
+    finally:
+        shutil.rmtree(test_dir)
+
+
+if __name__ == "__main__":
+    test_retry()
@@ -0,0 +1,120 @@
+import sys
+import os
+import re
+import csv
+import shutil
+import zipfile
+import tempfile
+import functools
+
+import openpyxl
+
+# 添加项目根目录到路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from AIGC_batch.api_clients import UniversalAPIClient
+from AIGC_batch.generator import KeyGenerator, _shard_ranges
+from AIGC_batch.result_writers import export_results
+from mock_llm_server import MockLLMServer
+
+ROWS = 45
+
+
+def _write_input(path):
+    wb = openpyxl.Workbook()
+    sheet = wb.active
+    sheet.append(["目标对象"])
+    for i in range(ROWS):
+        sheet.append([f"对象{i}"])
+    wb.save(path)
+
+
+def _strip_dimension(path):
+    """去掉工作表的 <dimension> 尺寸信息（部分工具导出的xlsx没有该信息）"""
+    stripped = path + ".tmp"
+    with zipfile.ZipFile(path) as source, zipfile.ZipFile(stripped, "w") as target:
+        for item in source.infolist():
+            data = source.read(item.filename)
+            if item.filename == "xl/worksheets/sheet1.xml":
+                data = re.sub(rb'<dimension[^>]*/>', b'', data)
+            target.writestr(item, data)
+    os.replace(stripped, path)
+
+
+# 测试多进程分片生成与按行合并
+def test_sharding():
+    print("测试多进程分片生成...")
+
+    # 1. 连续区间划分
+    print("\n1. 分片划分:")
+    assert _shard_ranges(10, 3) == [(0, 4), (4, 7), (7, 10)]
+    assert _shard_ranges(2, 4) == [(0, 1), (1, 2)]
+
+    test_dir = tempfile.mkdtemp()
+
+    try:
+        input_path = os.path.join(test_dir, "input.xlsx")
+        _write_input(input_path)
+
+        with MockLLMServer(latency=0.01) as server:
+            client_factory = functools.partial(UniversalAPIClient, server.base_url, "mock-key", "mock-model")
+
+            # 2. 三个进程各自生成，结果按行索引合并
+            print("\n2. 分片生成:")
+            generator = KeyGenerator()
+            generator.load_input(input_path)
+            progress = []
+            success, message = generator.start_generation_sharded(
+                client_factory, "{{主场景}}", {"主场景": "目标对象"}, shards=3,
+                on_progress=lambda current, total, ok, failed: progress.append(current), max_workers=4)
+            print(message)
+            assert success and server.request_count == ROWS
+            assert [r.row_index for r in generator.results] == list(range(ROWS))
+            assert generator.results[17].parsed_result == {"key": "对象17"}
+            assert progress[-1] == ROWS and generator.get_progress()["success"] == ROWS
+
+            # 导出顺序与输入一致
+            output_path = os.path.join(test_dir, "result.csv")
+            assert export_results(generator, output_path)[0]
+            with open(output_path, encoding='utf-8-sig') as f:
+                assert [row["目标对象"] for row in csv.DictReader(f)] == [f"对象{i}" for i in range(ROWS)]
+
+            # 3. 各分片从自己的断点续传，已完成的行不再请求
+            print("\n3. 分片续传:")
+            shard_root = os.path.join(test_dir, ".shards_3")
+            assert sorted(os.listdir(shard_root)) == ["shard_0", "shard_1", "shard_2"]
+            shutil.rmtree(os.path.join(shard_root, "shard_1"))
+            generator = KeyGenerator()
+            generator.load_input(input_path)
+            success, message = generator.start_generation_sharded(
+                client_factory, "{{主场景}}", {"主场景": "目标对象"}, shards=3, engine="async")
+            print(message)
+            # 只有断点被删除的第二个分片（15行）重新请求
+            assert success and server.request_count == ROWS + 15
+            assert all(r.success for r in generator.results) and len(generator.results) == ROWS
+
+            # 4. 流式加载且没有尺寸信息的文件：先数出实际行数再分片，从起始行开始
+            print("\n4. 无尺寸信息的流式文件:")
+            unsized_path = os.path.join(test_dir, "unsized.xlsx")
+            _write_input(unsized_path)
+            _strip_dimension(unsized_path)
+            generator = KeyGenerator()
+            generator.load_input(unsized_path, streaming=True)
+            requests_before = server.request_count
+            success, message = generator.start_generation_sharded(
+                client_factory, "{{主场景}}", {"主场景": "目标对象"}, shards=4, start_index=5)
+            print(message)
+            assert success and server.request_count - requests_before == ROWS - 5
+            assert generator.total_rows == ROWS and generator.get_progress()["success"] == ROWS - 5
+            assert generator.results[ROWS - 1].parsed_result == {"key": f"对象{ROWS - 1}"}
+            assert not generator.start_generation_sharded(
+                client_factory, "{{主场景}}", {"主场景": "目标对象"}, shards=4, start_index=ROWS)[0]
+
+        print("\n测试完成！")
+
+    finally:
+        shutil.rmtree(test_dir)
+
+
+if __name__ == "__main__":
+    test_sharding()
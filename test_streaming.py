@@ -0,0 +1,134 @@
+import sys
+import os
+import time
+import asyncio
+import shutil
+import tempfile
+
+# 添加项目根目录到路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from AIGC_batch.api_clients import APIRequestError, JSONStreamScanner, UniversalAPIClient
+from AIGC_batch.generator import KeyGenerator
+from AIGC_batch.metrics import MetricsRegistry
+from mock_llm_server import MockLLMServer
+
+# 模型常在JSON之后附带的说明文字
+CHATTER = "\n以上就是根据场景生成的搜索Key，希望对你有帮助！" * 5
+
+
+def _make_generator(rows, work_dir):
+    generator = KeyGenerator(metrics=MetricsRegistry())
+    generator.headers = ["目标对象"]
+    generator.input_data = [{"目标对象": f"对象{i}"} for i in range(rows)]
+    generator.total_rows = rows
+    generator._current_file = os.path.join(work_dir, "input.xlsx")
+    return generator
+
+
+def _wait_for(condition, timeout=2.0):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+# 测试流式响应与JSON完整后提前结束
+def test_streaming():
+    print("测试流式响应...")
+
+    # 1. 增量判断顶层JSON是否完整（字符串内的括号与转义不参与配对）
+    print("\n1. JSON完整性扫描:")
+    scanner = JSONStreamScanner()
+    pieces = ['结果如下 "说明"：```json\n{"key": "a}', '\\"{", "list": [1, ', '{"b": 2}]', '}\n```', "多余"]
+    assert [scanner.feed(piece) for piece in pieces] == [False, False, False, True, True]
+    text = "".join(pieces)
+    assert text[:scanner.end].endswith('{"b": 2}]}') and text[scanner.end:].startswith("\n```")
+    scanner = JSONStreamScanner()
+    assert scanner.feed('[{"index": 1}, {"index": 2}]') and scanner.end == 28
+    # 说明文字中的括号配对成功但不是合法JSON，不提前结束
+    scanner = JSONStreamScanner()
+    pieces = ["[注意] 以下为结果", ": {\"key\": ", '"[a]"', "}", " 完毕"]
+    assert [scanner.feed(piece) for piece in pieces] == [False, False, False, True, True]
+    assert "".join(pieces)[:scanner.end].endswith('{"key": "[a]"}')
+    scanner = JSONStreamScanner()
+    text = '[说明 {"key": 1}] 其余'
+    assert scanner.feed(text) and text[:scanner.end].endswith('{"key": 1}')
+
+    test_dir = tempfile.mkdtemp()
+
+    try:
+        with MockLLMServer(latency=0.01) as server:
+            server.stream_suffix = CHATTER
+            server.chunk_delay = 0.005
+            client = UniversalAPIClient(server.base_url, "mock-key", "mock-model", stream=True)
+
+            # 2. 线程引擎：JSON完整即关闭流，结果不含多余文本
+            print("\n2. 线程引擎:")
+            generator = _make_generator(20, test_dir)
+            success, message = generator.start_generation(client, "{{主场景}}", {"主场景": "目标对象"},
+                                                          max_workers=4, use_cache=False)
+            assert success
+            assert all(r.result == f'{{"key": "对象{r.row_index}"}}' for r in generator.results)
+            assert generator.results[3].parsed_result == {"key": "对象3"}
+            progress = generator.get_progress()
+            print(f"首Token耗时: {progress['ttft']}，阶段: {progress['phases']}")
+            assert progress["ttft"]["count"] == 20 and "ttft" in progress["phases"]
+            assert client.get_usage_stats()["early_stops"] == 20
+            # 服务端在发送多余文本时发现客户端已断开
+            assert _wait_for(lambda: server.streams_aborted == 20)
+
+            # 3. 不提前结束时读完整个流，usage 随最后的分片返回
+            print("\n3. 完整读取:")
+            chunks = server.stream_chunks
+            client.stop_on_json = False
+            result = client.generate("完整")
+            client.stop_on_json = True
+            assert result.endswith(CHATTER.strip()) and generator._parse_json_result(result) == {"key": "完整"}
+            assert server.stream_chunks - chunks > 20 and client.get_usage_stats()["completion_tokens"] > 0
+            # 单次请求可关闭流式
+            assert client.generate("非流式", stream=False) == '{"key": "非流式"}'
+
+            # 4. asyncio引擎
+            print("\n4. 异步引擎:")
+            generator = _make_generator(20, test_dir)
+            success, message = asyncio.run(generator.start_generation_async(
+                client, "{{主场景}}", {"主场景": "目标对象"}, max_concurrency=8, use_cache=False))
+            assert success and all(r.parsed_result == {"key": f"对象{r.row_index}"} for r in generator.results)
+            assert generator.get_progress()["ttft"]["count"] == 20
+            assert client.get_usage_stats()["early_stops"] == 40
+
+            # 未传入会话时临时创建会话，单次调用的参数同样传递下去
+            class RecordingClient(UniversalAPIClient):
+                def __init__(self, *args, **kwargs):
+                    super().__init__(*args, **kwargs)
+                    self.options = []
+
+                async def agenerate(self, prompt, *args, **kwargs):
+                    self.options.append(kwargs.get("user"))
+                    return await super().agenerate(prompt, *args, **kwargs)
+
+            recording = RecordingClient(server.base_url, "mock-key", "mock-model", stream=True)
+            assert asyncio.run(recording.agenerate("单次", user="u1")) == '{"key": "单次"}'
+            assert recording.options == ["u1", "u1"]
+            recording.close()
+
+            # 5. 流式请求的HTTP错误同样按状态码分类
+            print("\n5. 错误响应:")
+            server.error_status = 429
+            try:
+                client.generate("限流")
+                assert False, "应抛出限流错误"
+            except APIRequestError as e:
+                assert e.error_type == APIRequestError.RATE_LIMIT
+            server.error_status = None
+            client.close()
+
+        print("\n测试完成！")
+
+    finally:
+        shutil.rmtree(test_dir)
+
+
+if __name__ == "__main__":
+    test_streaming()
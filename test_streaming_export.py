@@ -0,0 +1,98 @@
+import sys
+import os
+import tempfile
+import shutil
+
+import openpyxl
+
+# 添加项目根目录到路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from AIGC_batch.generator import KeyGenerator, GenerationResult
+
+
+class MockAPIClient:
+    def generate(self, prompt):
+        if prompt == "对象2":
+            raise Exception("模拟失败")
+        return f'{{"key": "{prompt}", "meta": {{"len": {len(prompt)}}}}}'
+
+
+# 测试流式导出
+def test_streaming_export():
+    print("测试流式导出...")
+
+    test_dir = tempfile.mkdtemp()
+
+    try:
+        input_file = os.path.join(test_dir, "input.xlsx")
+        wb = openpyxl.Workbook()
+        sheet = wb.active
+        sheet.append(["目标对象", "备注"])
+        for i in range(5):
+            sheet.append([f"对象{i}", f"备注{i}" if i % 2 else None])
+        wb.save(input_file)
+
+        generator = KeyGenerator()
+        success, message = generator.load_input(input_file)
+        assert success
+        generator.start_generation(MockAPIClient(), "{{主场景}}", {"主场景": "目标对象"}, max_workers=2)
+
+        # 1. 保留原文件全部列，并追加结果列与JSON列
+        print("\n1. 基于原文件导出:")
+        output_file = os.path.join(test_dir, "output.xlsx")
+        success, message = generator.export_result(output_file, input_file)
+        print(f"导出消息: {message}")
+        assert success
+        rows = list(openpyxl.load_workbook(output_file).active.iter_rows(values_only=True))
+        assert list(rows[0]) == ["目标对象", "备注", "召回Key", "状态", "错误信息", "生成耗时(秒)", "尝试次数",
+                                 "JSON.key", "JSON.meta.len"]
+        assert rows[2][:4] == ("对象1", "备注1", '{"key": "对象1", "meta": {"len": 3}}', "成功")
+        assert rows[2][7:] == ("对象1", "3")
+        assert rows[3][3] == "失败" and rows[3][4] == "模拟失败" and rows[3][7] is None
+        assert len(rows) == 6
+
+        # 2. 扁平化结果不随行数缓存：生成时已并入列集合，导出时每行只在写出时扁平化一次
+        print("\n2. 单次扁平化:")
+        calls = []
+        original = generator._flatten_json
+
+        def counting_flatten(data, prefix=''):
+            if not prefix:
+                calls.append(data)
+            return original(data, prefix)
+
+        generator._flatten_json = counting_flatten
+        generator.export_result(output_file)
+        json_results = [r for r in generator.results if r is not None and r.success and r.parsed_result]
+        assert len(calls) == len(json_results)
+        calls.clear()
+
+        # 断点恢复（未经过生成记录）的结果先补齐列集合，再在写出时扁平化
+        restored = KeyGenerator()
+        restored._flatten_json = counting_flatten
+        restored.headers = generator.headers
+        restored.results = [GenerationResult(1, {"目标对象": "对象1"}, "{}", True, parsed_result={"a": {"b": 1}}),
+                            GenerationResult(3, {"目标对象": "对象3"}, "{}", True, parsed_result={"c": 2})]
+
+        # 3. 没有原文件时从结果还原输入列，缺失的行保留空行
+        print("\n3. 无原文件导出:")
+        success, message = restored.export_result(output_file)
+        assert success and len(calls) == 4
+        # 再次导出时恢复的结果已并入列集合，只在写出时扁平化
+        calls.clear()
+        assert restored.export_result(output_file)[0] and len(calls) == 2
+        rows = list(openpyxl.load_workbook(output_file).active.iter_rows(values_only=True))
+        assert rows[0][-2:] == ("JSON.a.b", "JSON.c")
+        assert rows[2][0] == "对象1" and rows[2][-2:] == ("1", None)
+        assert rows[4][0] == "对象3" and rows[4][-2:] == (None, "2")
+        assert all(v is None for v in rows[3])
+
+        print("\n测试完成！")
+
+    finally:
+        shutil.rmtree(test_dir)
+
+
+if __name__ == "__main__":
+    test_streaming_export()
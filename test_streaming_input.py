@@ -0,0 +1,86 @@
+import sys
+import os
+import tempfile
+import shutil
+
+import openpyxl
+
+# 添加项目根目录到路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from AIGC_batch.generator import KeyGenerator
+
+
+def _write_sheet(path, rows):
+    wb = openpyxl.Workbook()
+    sheet = wb.active
+    sheet.append(["目标对象", "营销主题", "Tab分类"])
+    for row in rows:
+        sheet.append(row)
+    wb.save(path)
+
+
+# 测试流式读取输入文件
+def test_streaming_input():
+    print("测试流式读取输入文件...")
+
+    test_dir = tempfile.mkdtemp()
+
+    try:
+        input_file = os.path.join(test_dir, "input.xlsx")
+        rows = [[f"对象{i}", f"主题{i}", f"Tab{i}"] for i in range(50)]
+        # 最后一行尾部为空单元格，只读模式下会被省略
+        rows.append(["对象50", None, None])
+        _write_sheet(input_file, rows)
+
+        # 1. 全量模式与流式模式读取结果一致
+        print("\n1. 对比全量模式与流式模式:")
+        full = KeyGenerator()
+        success, message = full.load_input(input_file)
+        print(f"全量模式: {message}")
+        assert success and full.total_rows == 51
+
+        streaming = KeyGenerator()
+        success, message = streaming.load_input(input_file, streaming=True)
+        print(f"流式模式: {message}")
+        assert success and streaming.total_rows == 51
+        assert len(streaming.input_data) == KeyGenerator.STREAMING_PREVIEW_ROWS
+        assert streaming.get_data_preview(5) == full.get_data_preview(5)
+
+        streamed = list(streaming.iter_input_rows())
+        assert [row for _, row in streamed] == full.input_data
+        assert streamed[-1][1] == {"目标对象": "对象50", "营销主题": None, "Tab分类": None}
+
+        # 2. 流式模式下从指定行开始读取
+        print("\n2. 从第40行开始读取:")
+        tail = list(streaming.iter_input_rows(40))
+        assert [i for i, _ in tail] == list(range(40, 51))
+        assert tail[0][1]["目标对象"] == "对象40"
+
+        # 3. 流式模式下批量生成
+        print("\n3. 流式模式批量生成:")
+
+        class MockAPIClient:
+            def generate(self, prompt):
+                return f'{{"key": "{prompt}"}}'
+
+        success, message = streaming.start_generation(
+            MockAPIClient(),
+            "{{主场景}}-{{子场景}}",
+            {"主场景": "目标对象", "子场景": "营销主题"},
+            max_workers=4
+        )
+        print(f"生成消息: {message}")
+        assert success
+        assert all(r is not None and r.success for r in streaming.results)
+        assert streaming.results[10].parsed_result == {"key": "对象10-主题10"}
+        assert streaming.get_progress()["current"] == 51
+
+        print("\n测试完成！")
+
+    finally:
+        shutil.rmtree(test_dir)
+
+
+if __name__ == "__main__":
+    test_streaming_input()
@@ -0,0 +1,117 @@
+import sys
+import os
+import time
+import threading
+import tempfile
+import shutil
+import concurrent.futures
+
+# 添加项目根目录到路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from AIGC_batch.generator import KeyGenerator
+
+
+class SlowAPIClient:
+    def __init__(self, latency=0.01):
+        self.latency = latency
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def generate(self, prompt):
+        time.sleep(self.latency)
+        with self.lock:
+            self.calls += 1
+        return f'{{"key": "{prompt}"}}'
+
+
+def _make_generator(rows, work_dir):
+    generator = KeyGenerator(save_interval=100)
+    generator.headers = ["目标对象"]
+    generator.input_data = [{"目标对象": f"对象{i}"} for i in range(rows)]
+    generator.total_rows = rows
+    generator._current_file = os.path.join(work_dir, "input.xlsx")
+    return generator
+
+
+# 测试窗口化提交、暂停与取消
+def test_windowed_submission():
+    print("测试窗口化提交...")
+
+    test_dir = tempfile.mkdtemp()
+    template, variables = "{{主场景}}", {"主场景": "目标对象"}
+
+    try:
+        # 1. 排队任务数不超过 并发数 × 窗口系数
+        print("\n1. 提交窗口:")
+        generator = _make_generator(300, test_dir)
+        max_pending = []
+        original_submit = concurrent.futures.ThreadPoolExecutor.submit
+
+        def tracking_submit(executor, *args, **kwargs):
+            max_pending.append(executor._work_queue.qsize())
+            return original_submit(executor, *args, **kwargs)
+
+        concurrent.futures.ThreadPoolExecutor.submit = tracking_submit
+        try:
+            success, message = generator.start_generation(SlowAPIClient(0.001), template, variables, max_workers=4)
+        finally:
+            concurrent.futures.ThreadPoolExecutor.submit = original_submit
+        print(f"生成消息: {message}，最大排队数: {max(max_pending)}")
+        assert success and generator.get_progress()["success"] == 300
+        assert max(max_pending) <= 4 * KeyGenerator.SUBMIT_WINDOW_FACTOR
+
+        # 2. 暂停后不再提交，继续后完成全部行
+        print("\n2. 暂停与继续:")
+        generator = _make_generator(200, test_dir)
+        client = SlowAPIClient()
+        thread = threading.Thread(target=generator.start_generation,
+                                  args=(client, template, variables), kwargs={"max_workers": 4})
+        thread.start()
+        time.sleep(0.1)
+        assert generator.pause_generation()
+        time.sleep(0.05)  # 等在途请求完成
+        paused_calls = client.calls
+        time.sleep(0.2)
+        print(f"暂停期间请求数: {paused_calls} -> {client.calls}")
+        assert client.calls == paused_calls and generator.get_progress()["is_paused"]
+        assert generator.resume_generation()
+        thread.join()
+        assert generator.get_progress()["success"] == 200
+
+        # 3. 取消后尽快结束，只等待在途请求，未完成的行可从断点续传
+        print("\n3. 取消:")
+        generator = _make_generator(2000, test_dir)
+        client = SlowAPIClient()
+        outcome = {}
+
+        def run():
+            outcome["result"] = generator.start_generation(client, template, variables, max_workers=4)
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        time.sleep(0.1)
+        cancel_time = time.time()
+        assert generator.cancel_generation()
+        thread.join()
+        elapsed = time.time() - cancel_time
+        success, message = outcome["result"]
+        print(f"生成消息: {message}，取消耗时: {elapsed:.3f}秒")
+        assert not success and generator.is_cancelled
+        assert elapsed < 0.5 and client.calls < 2000
+
+        resumed = _make_generator(2000, test_dir)
+        resumed.load_checkpoint(resumed.get_latest_checkpoint(test_dir))
+        client = SlowAPIClient(0)
+        success, message = resumed.start_generation(client, template, variables, max_workers=8)
+        assert success and resumed.get_progress()["success"] == 2000
+        assert client.calls == 2000 - resumed.get_progress()["skipped"]
+
+        print("\n测试完成！")
+
+    finally:
+        shutil.rmtree(test_dir)
+
+
+if __name__ == "__main__":
+    test_windowed_submission()